@@ -52,6 +52,7 @@ default_condition = 'PP'
 dm_trial_show_mouse = False
 dm_ignore_local_overrides = False
 show_gamepad_debug = False
+show_queue_stats = False
 max_trials_per_block = False
 
 #########################################
@@ -77,3 +78,53 @@ test_mapping = 'normal'
 
 collect_kviq = True
 cursor_size = 1.0  # degrees
+
+# Realtime trial mode: suspends garbage collection during trials (collecting
+# between trials instead), raises process priority if possible, and optionally
+# pins the process to the given list of CPU cores (Linux only)
+realtime_trials = False
+realtime_cpus = None
+
+# Whether to stop SDL from queuing event types that aren't needed during trials
+# (e.g. mouse motion when using a gamepad), re-enabling them between trials
+filter_trial_events = True
+
+# Whether to extrapolate the drawn cursor position forward to the expected
+# display time, compensating for the measured input-to-flip latency. The offset
+# (in ms) is added to the measured latency to account for any additional lag
+# from the display itself.
+cursor_prediction = False
+cursor_prediction_offset = 0
+
+# Whether to pack the trial stimuli and error messages into a single texture at
+# startup, drawing them from it instead of uploading each stimulus every frame
+stimulus_atlas = False
+
+# Whether to only repaint the parts of the screen that change between trial
+# frames (i.e. around the cursor) instead of clearing and redrawing the whole
+# screen every frame. Assumes a double-buffered display.
+dirty_rendering = False
+
+# The path (relative to the task folder) of an optional SDL gamecontrollerdb.txt
+# file with extra controller mappings to load on launch. The validated mappings
+# are cached next to the file so later launches can skip re-parsing it.
+controller_db = None
+
+# Whether to record the raw values of all sticks & triggers for every connected
+# controller during every trial (e.g. for bimanual or dual-stick setups), with
+# every controller sampled once per frame (when SDL updates their state) on a
+# common clock. Samples are written to the 'device_samples' table (in ms since
+# target onset, only when a device's values change), with the name & channel
+# names of each device in the 'devices' table.
+record_devices = False
+
+# Whether to record the raw 16-bit stick x/y and trigger values for every sample
+# of every trial, stored as a compact binary trace per trial in the 'raw_traces'
+# table (see traces.py for the format)
+record_raw_traces = False
+
+# The maximum error (in pixels) allowed when simplifying cursor trajectories
+# before writing them to the 'gamepad' table. Samples are only dropped if their
+# positions can be reconstructed to within this distance by interpolating
+# between the remaining samples at the same timestamp. Set to 0 to disable.
+trajectory_tolerance = 0
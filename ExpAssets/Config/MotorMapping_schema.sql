@@ -32,6 +32,15 @@ destroyed and rebuilt. If you wish to keep the data you currently have, run:
 while within the root of your project folder. This will export all participant and trial
 data in the database to text files found in MotorMapping/ExpAssets/Data.
 
+Alternatively, to update an existing database to match this file without losing
+any data, run:
+
+  python tools/migrate_db.py
+
+This rebuilds any tables whose columns have changed (e.g. converting columns from
+text to numbers), copying over all existing rows, and creates any missing tables
+or indexes. Missing values are stored as NULLs rather than "NA" strings.
+
 
 Note that you *really* do not need to be concerned about datatypes when adding columns;
 in the end, everything will be a string when the data is exported. The *only* reason you
@@ -59,18 +68,22 @@ CREATE TABLE trials (
     phase text not null,
     trial_type text not null,
     rotation float not null,
-    target_onset text not null,
+    target_onset float,
     target_dist float not null,
     target_angle float not null,
-    movement_rt text not null,
-    contact_rt text not null,
-    response_rt text not null,
-    initial_angle text not null,
-    err text not null,
+    movement_rt float,
+    contact_rt float,
+    response_rt float,
+    initial_angle float,
+    err text,
     target_x integer not null,
-    target_y integer not null
+    target_y integer not null,
+    controller_dropouts integer,
+    trajectory_tolerance float
 );
 
+CREATE INDEX trials_by_trial ON trials (participant_id, block_num, trial_num);
+
 
 CREATE TABLE kviq (
     id integer primary key autoincrement not null,
@@ -83,13 +96,121 @@ CREATE TABLE kviq (
     kinaesthetic_time float not null
 );
 
+CREATE INDEX kviq_by_participant ON kviq (participant_id);
+
 
 CREATE TABLE gamepad (
     id integer primary key autoincrement not null,
     participant_id integer not null references participants(id),
     block_num integer not null,
     trial_num integer not null,
-    "time" integer not null,
+    "time" float not null,
     stick_x float not null,
-    stick_y float not null
+    stick_y float not null,
+    display_x integer not null,
+    display_y integer not null
+);
+
+CREATE INDEX gamepad_by_trial ON gamepad (participant_id, block_num, trial_num, "time");
+
+
+CREATE TABLE devices (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    device integer not null,
+    name text not null,
+    channels text not null
+);
+
+
+CREATE TABLE device_samples (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    device integer not null,
+    "time" float not null,
+    ch0 integer,
+    ch1 integer,
+    ch2 integer,
+    ch3 integer,
+    ch4 integer,
+    ch5 integer
+);
+
+CREATE INDEX device_samples_by_trial ON device_samples (
+    participant_id, block_num, trial_num, device, "time"
+);
+
+
+CREATE TABLE raw_traces (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    samples integer not null,
+    target_on float,
+    data blob not null
+);
+
+CREATE INDEX raw_traces_by_trial ON raw_traces (participant_id, block_num, trial_num);
+
+
+CREATE TABLE trial_kinematics (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    samples integer not null,
+    peak_velocity float,
+    time_to_peak float,
+    path_length float,
+    max_deviation float,
+    endpoint_error float,
+    movement_time float
+);
+
+CREATE INDEX trial_kinematics_by_trial ON trial_kinematics (
+    participant_id, block_num, trial_num
+);
+
+
+CREATE TABLE trial_flags (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    rule text not null,
+    value float
+);
+
+CREATE INDEX trial_flags_by_trial ON trial_flags (participant_id, block_num, trial_num);
+
+
+CREATE TABLE phase_summary (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    phase text not null,
+    trials integer not null,
+    errors integer not null,
+    timeouts integer not null,
+    angle_error_n integer not null,
+    angle_error_mean float,
+    angle_error_var float,
+    movement_rt_n integer not null,
+    movement_rt_mean float,
+    movement_rt_var float
+);
+
+CREATE INDEX phase_summary_by_participant ON phase_summary (participant_id);
+
+
+CREATE TABLE gc_pauses (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    generation integer not null,
+    duration float not null
 );
@@ -12,7 +12,6 @@ from klibs.KLText import add_text_style
 from klibs.KLCommunication import message
 
 from sdl_utils import get_key_state
-from InterfaceExtras import RatingScale, Aesthetics
 
 
 # KVIQ-10 elements
@@ -341,6 +340,7 @@ class KVIQ(object):
         prompt = message(prompt_txt.format(prompt_adj))
 
         # Create the rating prompt for the current imagery type
+        from InterfaceExtras import RatingScale # Only import when needed
         scale_loc = (P.screen_c[0], int(P.screen_y * 0.3))
         scale = RatingScale(
             choices, prompt, scale_loc, order = ['5', '4', '3', '2', '1']
@@ -0,0 +1,159 @@
+import numpy as np
+from OpenGL import GL as gl
+
+from klibs.KLGraphics import blit
+
+
+def _get_pixels(stim):
+    # Gets the rendered RGBA pixels for a Drawbject, NumpySurface, or array
+    if isinstance(stim, np.ndarray):
+        return stim
+    return np.asarray(stim.render(), dtype=np.uint8)
+
+
+def _reg_offset(registration, w, h):
+    # Gets the offset of a registration point (numpad layout) from the top-left
+    # corner of an image with a given width & height
+    col = (registration - 1) % 3
+    row = 2 - (registration - 1) // 3
+    return (col * w // 2, row * h // 2)
+
+
+def _pack(sizes, padding, max_width):
+    # Packs a list of (w, h) rectangles into rows ('shelves'), tallest first,
+    # returning the (x, y) position of each and the total width & height
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i][1], reverse=True)
+    positions = [None] * len(sizes)
+    x, y, row_h, total_w = (padding, padding, 0, 0)
+    for i in order:
+        w, h = sizes[i]
+        if x + w + padding > max_width and x > padding:
+            y += row_h + padding
+            x, row_h = (padding, 0)
+        positions[i] = (x, y)
+        x += w + padding
+        row_h = max(row_h, h)
+        total_w = max(total_w, x)
+    return positions, total_w, y + row_h + padding
+
+
+
+class StimulusAtlas(object):
+    """Packs a set of static stimuli into a single OpenGL texture.
+
+    Normally, each call to klibs' ``blit()`` uploads the full image to a new
+    texture before drawing it. With an atlas, all stimuli are uploaded once
+    as a single texture and then drawn as sub-regions of it, so drawing a
+    frame only needs one texture bind and no uploads.
+
+    Stimuli can be drawn from the atlas using the same arguments as
+    ``blit()``. Anything not in the atlas (e.g. text rendered on the fly) is
+    passed through to klibs' ``blit()`` instead.
+
+    Args:
+        stimuli (list): The Drawbjects, NumpySurfaces, and/or RGBA arrays to
+            pack into the atlas. These must not change after the atlas is
+            created.
+        padding (int, optional): The number of transparent pixels to leave
+            around each stimulus in the atlas. Defaults to 2.
+
+    """
+    def __init__(self, stimuli, padding=2):
+        pixels = [_get_pixels(s) for s in stimuli]
+        sizes = [(p.shape[1], p.shape[0]) for p in pixels]
+        max_size = gl.glGetIntegerv(gl.GL_MAX_TEXTURE_SIZE)
+        max_width = min(int(max_size), max(2048, max(w for w, h in sizes) + padding * 2))
+        positions, width, height = _pack(sizes, padding, max_width)
+        if height > max_size:
+            e = "Stimuli are too large to fit into a single {0}x{0} texture."
+            raise ValueError(e.format(max_size))
+
+        # Copy all stimuli into a single transparent image
+        sheet = np.zeros((height, width, 4), dtype=np.uint8)
+        self._regions = {}
+        for stim, px, (w, h), (x, y) in zip(stimuli, pixels, sizes, positions):
+            sheet[y:y+h, x:x+w, :] = px
+            texcoords = (
+                x / float(width), y / float(height),
+                (x + w) / float(width), (y + h) / float(height),
+            )
+            self._regions[id(stim)] = (w, h, texcoords)
+        self._stimuli = list(stimuli) # Keep stimuli alive so ids stay valid
+        self.width = width
+        self.height = height
+
+        # Upload the atlas to the GPU
+        self._texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self._texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glTexImage2D(
+            gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width, height, 0, gl.GL_RGBA,
+            gl.GL_UNSIGNED_BYTE, sheet
+        )
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+
+    def __contains__(self, stim):
+        return id(stim) in self._regions
+
+    def _quads(self, items):
+        # Draws a batch of stimuli from the atlas with a single texture bind,
+        # saving and restoring the texture state (including the texture
+        # environment mode) so klibs' own drawing isn't affected
+        gl.glPushAttrib(gl.GL_ENABLE_BIT | gl.GL_TEXTURE_BIT)
+        gl.glEnable(gl.GL_TEXTURE_2D)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self._texture)
+        gl.glTexEnvi(gl.GL_TEXTURE_ENV, gl.GL_TEXTURE_ENV_MODE, gl.GL_REPLACE)
+        gl.glBegin(gl.GL_QUADS)
+        for stim, registration, location in items:
+            w, h, (s1, t1, s2, t2) = self._regions[id(stim)]
+            off_x, off_y = _reg_offset(registration, w, h)
+            x1 = int(location[0]) - off_x
+            y1 = int(location[1]) - off_y
+            gl.glTexCoord2f(s1, t1)
+            gl.glVertex2f(x1, y1)
+            gl.glTexCoord2f(s2, t1)
+            gl.glVertex2f(x1 + w, y1)
+            gl.glTexCoord2f(s2, t2)
+            gl.glVertex2f(x1 + w, y1 + h)
+            gl.glTexCoord2f(s1, t2)
+            gl.glVertex2f(x1, y1 + h)
+        gl.glEnd()
+        gl.glPopAttrib()
+
+    def draw(self, items):
+        """Draws a list of stimuli to the screen, in order.
+
+        Consecutive stimuli that are in the atlas are drawn together as a single
+        batch. Stimuli not in the atlas are drawn using klibs' ``blit()``.
+
+        Args:
+            items (list): A list of (stimulus, registration, location) tuples,
+                using the same meanings as the arguments for ``blit()``.
+
+        """
+        batch = []
+        for item in items:
+            if id(item[0]) in self._regions:
+                batch.append(item)
+                continue
+            if len(batch):
+                self._quads(batch)
+                batch = []
+            blit(*item)
+        if len(batch):
+            self._quads(batch)
+
+    def blit(self, source, registration=7, location=(0, 0)):
+        """Draws a single stimulus to the screen, like klibs' ``blit()``.
+
+        """
+        self.draw([(source, registration, location)])
+
+    def delete(self):
+        """Frees the atlas texture on the GPU.
+
+        """
+        if self._texture is not None:
+            gl.glDeleteTextures([self._texture])
+            self._texture = None
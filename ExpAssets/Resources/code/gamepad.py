@@ -9,11 +9,15 @@ from sdl2 import (
     SDL_INIT_JOYSTICK, SDL_INIT_GAMECONTROLLER, SDL_FALSE, SDL_TRUE,
     SDL_JOYBUTTONDOWN, SDL_JOYBUTTONUP,
     SDL_CONTROLLERBUTTONDOWN, SDL_CONTROLLERBUTTONUP,
+    SDL_CONTROLLERDEVICEADDED, SDL_CONTROLLERDEVICEREMOVED,
 )
 from sdl2.ext.common import raise_sdl_err
 from sdl2.ext.compat import utf8, stringify, byteify, _is_text
 
-from mappings import CUSTOM_MAPPINGS, add_controller_mapping
+from mappings import (
+    CUSTOM_MAPPINGS, load_mapping_db, add_controller_mappings,
+    _create_controller_mapping,
+)
 
 
 # Define name maps for joystick types and states
@@ -48,14 +52,19 @@ def _joystick_init():
         if SDL_InitSubSystem(SDL_INIT_JOYSTICK) != 0:
             raise_sdl_err("initializing the joystick subsystem")
 
-def gamepad_init():
+def gamepad_init(mapping_db=None):
     error.SDL_ClearError()
     if SDL_WasInit(SDL_INIT_GAMECONTROLLER) == 0:
         if SDL_InitSubSystem(SDL_INIT_GAMECONTROLLER) != 0:
             raise_sdl_err("initializing the gamepad subsystem")
-    # Automaticaly add any custom controller mappings
+    # Automaticaly add any mappings from a controller database file, along with
+    # any custom controller mappings (which take precedence), in a single call
+    mappings = []
+    if mapping_db:
+        mappings += load_mapping_db(mapping_db)
     for guid, name, mapping in CUSTOM_MAPPINGS:
-        add_controller_mapping(guid, name, mapping)
+        mappings.append(_create_controller_mapping(guid, name, mapping))
+    add_controller_mappings(mappings)
 
 
 def _validate_index(index):
@@ -68,7 +77,13 @@ def _validate_index(index):
         e = "No joystick found at index '{0}'. Valid device indices are: {1}."
         raise ValueError(e.format(index, valid))
 
+# Cache of joystick info by instance ID, so devices only need to be queried once
+_info_cache = {}
+
 def _get_joystick_info(index):
+    instance_id = jy.SDL_JoystickGetDeviceInstanceID(index)
+    if instance_id in _info_cache:
+        return dict(_info_cache[instance_id])
     info = {}
     info_functions = {
         'name': jy.SDL_JoystickNameForIndex,
@@ -89,7 +104,8 @@ def _get_joystick_info(index):
     sdl2.SDL_JoystickGetGUIDString(info['guid'], buf, 40)
     info['guid'] = buf.value
     info['name'] = info['name'].decode('utf-8')
-    return info
+    _info_cache[instance_id] = info
+    return dict(info)
 
 def _get_gamecontroller_info():
     pass
@@ -216,6 +232,7 @@ class GameController(object):
                 e += "and no mapping was manually provided."
                 raise RuntimeError(e.format(index))
         self._index = index
+        self._instance_id = jy.SDL_JoystickGetDeviceInstanceID(index)
         self._info = _get_joystick_info(index)
         self._pad = None
         self._stick = None
@@ -305,12 +322,129 @@ class GameController(object):
         # queue
         pass
 
+    @property
+    def attached(self):
+        if not self._pad:
+            return False
+        return gc.SDL_GameControllerGetAttached(self._pad) == SDL_TRUE
+
+    @property
+    def instance_id(self):
+        return self._instance_id
+
     @property
     def name(self):
         return self._info["name"]
 
 
 
+class ControllerManager(object):
+    """Manages the task's game controller across disconnects and reconnects.
+
+    Provides the same input methods as :class:`GameController` for whichever
+    controller is currently connected. If the controller is unplugged, it is
+    closed and its sticks and triggers read as neutral until a controller is
+    plugged back in, at which point the new device is opened on the next call
+    to :meth:`update`.
+
+    Controller hotplug events are caught with an SDL event watch as they are
+    queued, so they are never missed regardless of which part of the task
+    pumps the event queue. At most one device is opened per :meth:`update`,
+    and devices are never re-enumerated, so reconnecting only costs a single
+    device open.
+
+    Args:
+        pad (:obj:`GameController`, optional): An initialized controller to
+            start with.
+
+    """
+    def __init__(self, pad=None):
+        self.pad = pad
+        self.dropouts = 0
+        self._added = []
+        self._removed = []
+        self._watch = sdl2.SDL_EventFilter(self._on_event)
+        sdl2.SDL_AddEventWatch(self._watch, None)
+
+    def _on_event(self, userdata, event):
+        # Records controller hotplug events as they're added to the SDL queue
+        e = event.contents
+        if e.type == SDL_CONTROLLERDEVICEADDED:
+            self._added.append(e.cdevice.which) # device index
+        elif e.type == SDL_CONTROLLERDEVICEREMOVED:
+            self._removed.append(e.cdevice.which) # instance ID
+        return 0
+
+    def _drop(self):
+        print("\nController '{0}' disconnected!".format(self.pad.name))
+        self.pad.close()
+        self.pad = None
+        self.dropouts += 1
+
+    def _reopen(self, index):
+        # Tries opening a newly-added controller
+        try:
+            pad = GameController(index)
+            pad.initialize()
+        except (RuntimeError, ValueError):
+            return
+        self.pad = pad
+        print("\nController '{0}' connected.".format(pad.name))
+
+    def update(self):
+        """Checks for controller disconnects and reconnects.
+
+        Should be called regularly (e.g. once per frame) to keep the manager's
+        controller up to date.
+
+        """
+        removed, self._removed = (self._removed, [])
+        if self.pad:
+            if self.pad.instance_id in removed or not self.pad.attached:
+                self._drop()
+        if self.pad:
+            self._added = []
+        elif len(self._added):
+            self._reopen(self._added.pop(0))
+
+    def close(self):
+        """Closes the current controller and stops watching for hotplug events.
+
+        """
+        sdl2.SDL_DelEventWatch(self._watch, None)
+        if self.pad:
+            self.pad.close()
+            self.pad = None
+
+    def left_stick(self):
+        return self.pad.left_stick() if self.pad else (0, 0)
+
+    def right_stick(self):
+        return self.pad.right_stick() if self.pad else (0, 0)
+
+    def left_trigger(self):
+        return self.pad.left_trigger() if self.pad else 0
+
+    def right_trigger(self):
+        return self.pad.right_trigger() if self.pad else 0
+
+    def dpad(self):
+        return self.pad.dpad() if self.pad else (0.0, 0.0)
+
+    @property
+    def connected(self):
+        return self.pad is not None
+
+    @property
+    def name(self):
+        return self.pad.name if self.pad else None
+
+    @property
+    def _info(self):
+        return self.pad._info if self.pad else {}
+
+
+
 def button_pressed(events, button=None, device=None, on_release=False):
     button_events = [SDL_JOYBUTTONDOWN, SDL_CONTROLLERBUTTONDOWN]
     if on_release:
@@ -1,4 +1,9 @@
+import os
 import re
+import hashlib
+from functools import lru_cache
+
+import sdl2
 from sdl2 import gamecontroller as gc
 from sdl2.ext.common import raise_sdl_err
 
@@ -25,7 +30,13 @@ CUSTOM_MAPPINGS = [
     ['0300ea9f6d04000015c2000011570000', 'Logitech Extreme 3D pro', stick_map],
 ]
 
+# Patterns and extra fields for validating gamecontrollerdb-format mappings
+_GUID_PATTERN = re.compile(r"^([0-9a-fA-F]+|xinput)$")
+_VALUE_PATTERN = re.compile(r"^[+-]?(b\d+|a\d+~?|h\d+\.\d+)$")
+_EXTRA_FIELDS = ("platform", "hint", "crc", "sdk>=", "sdk<=")
+
 
+@lru_cache(maxsize=None)
 def _sanitize_mapping_name(name):
     sdlname = re.sub(r"[\s_-]", "", name).lower()
     b = gc.SDL_GameControllerGetButtonFromString(sdlname.encode('utf-8'))
@@ -61,6 +72,131 @@ def _create_controller_mapping(guid, name, buttonmap):
         mappings.append("{0}:{1}".format(sdlcontrol, value))
     return "{0},{1},{2},".format(guid, name, ",".join(mappings))
 
+@lru_cache(maxsize=None)
+def _valid_binding(binding):
+    # Checks whether a 'control:value' binding from a mapping string is valid
+    control, sep, value = binding.partition(":")
+    if not sep:
+        return False
+    if control in _EXTRA_FIELDS:
+        return True
+    if not _sanitize_mapping_name(control.lstrip("+-")):
+        return False
+    return _VALUE_PATTERN.match(value) is not None
+
+def _platform():
+    return sdl2.SDL_GetPlatform().decode('utf-8')
+
+def _compile_mapping(line, platform):
+    # Validates a gamecontrollerdb-format mapping string for the current
+    # platform, returning a cleaned-up version (or None if not usable)
+    fields = line.strip().rstrip(",").split(",")
+    if len(fields) < 3 or not _GUID_PATTERN.match(fields[0]):
+        return None
+    bindings = []
+    has_platform = False
+    for binding in fields[2:]:
+        if binding.startswith("platform:"):
+            if binding[9:] != platform:
+                return None
+            has_platform = True
+        if _valid_binding(binding):
+            bindings.append(binding)
+    if not len(bindings):
+        return None
+    # NOTE: SDL ignores mappings without a platform when bulk-loading them
+    if not has_platform:
+        bindings.append("platform:{0}".format(platform))
+    return ",".join(fields[:2] + bindings) + ","
+
+def _mapping_db_hash(path, platform):
+    # Hashes a mapping database file along with the SDL version and platform,
+    # since both affect which mappings are valid
+    ver = sdl2.SDL_version()
+    sdl2.SDL_GetVersion(ver)
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        h.update(f.read())
+    key = "{0}.{1}.{2}:{3}".format(ver.major, ver.minor, ver.patch, platform)
+    h.update(key.encode('utf-8'))
+    return h.hexdigest()
+
+def load_mapping_db(path, cache_dir=None):
+    """Loads and validates the mappings in a gamecontrollerdb-format file.
+
+    Only mappings for the current platform are kept, and any invalid mappings
+    or bindings are skipped. The validated mappings are cached to disk (by
+    default in the same folder as the file) so they don't need to be re-parsed
+    on later launches, unless the file or the SDL version changes.
+
+    Args:
+        path (str): The path of the mapping database file.
+        cache_dir (str, optional): The folder in which to cache the validated
+            mappings. Defaults to the folder containing the database file.
+
+    Returns:
+        list: The validated mapping strings for the current platform, to be
+        added using :func:`add_controller_mappings`.
+
+    """
+    platform = _platform()
+    if not cache_dir:
+        cache_dir = os.path.dirname(os.path.abspath(path))
+    db_hash = _mapping_db_hash(path, platform)
+    cache_name = ".{0}.{1}.mapcache".format(os.path.basename(path), db_hash[:16])
+    cache_path = os.path.join(cache_dir, cache_name)
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            return [line for line in f.read().splitlines() if line]
+
+    mappings = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            mapping = _compile_mapping(line, platform)
+            if mapping:
+                mappings.append(mapping)
+
+    # Write the cache to a temporary file first so it's never partially written
+    try:
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(mappings) + "\n")
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass # If the cache can't be written, just skip it
+    return mappings
+
+def add_controller_mappings(mappings):
+    """Adds a list of gamecontrollerdb-format mapping strings to SDL at once.
+
+    Mappings without a platform field are added for the current platform.
+    If a mapping exists for a given GUID, it is replaced with the new one.
+
+    Args:
+        mappings (list): The mapping strings to add.
+
+    Returns:
+        int: The number of new mappings added.
+
+    """
+    platform = _platform()
+    lines = []
+    for mapping in mappings:
+        mapping = mapping.strip()
+        if not mapping:
+            continue
+        if "platform:" not in mapping:
+            mapping = mapping.rstrip(",") + ",platform:{0},".format(platform)
+        lines.append(mapping)
+    buf = ("\n".join(lines) + "\n").encode('utf-8')
+    rw = sdl2.SDL_RWFromConstMem(buf, len(buf))
+    ret = gc.SDL_GameControllerAddMappingsFromRW(rw, 1)
+    if ret == -1:
+        raise_sdl_err("adding controller mappings")
+    return ret
+
 def add_controller_mapping(guid, name, buttonmap):
     mapping = _create_controller_mapping(guid, name, buttonmap)
     ret = gc.SDL_GameControllerAddMapping(mapping.encode('utf-8'))
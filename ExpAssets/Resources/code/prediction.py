@@ -0,0 +1,122 @@
+from collections import deque
+from math import sqrt
+
+
+class CursorPredictor(object):
+    """Extrapolates cursor positions forward in time to offset display latency.
+
+    Input sampled at the start of a frame only reaches the screen after the
+    frame has been drawn and flipped (and often one or more refresh intervals
+    later than that). To compensate, this class estimates the current
+    velocity of the cursor from its recent positions and extrapolates it
+    forward to the expected time the frame will actually be seen.
+
+    The prediction horizon is set from the measured latency between sampling
+    the input and ``flip()`` returning, smoothed over frames, plus a fixed
+    offset for any additional lag added by the display itself.
+
+    Args:
+        origin (tuple): The (x, y) pixel coordinates of the cursor's resting
+            position.
+        max_radius (int): The maximum distance (in pixels) the cursor can move
+            from the origin. Predicted positions are clamped to this distance.
+        initial_latency (float): The initial estimate of the input-to-flip
+            latency (in seconds), used until actual flips have been measured.
+        offset (float, optional): Additional display lag (in seconds) to add to
+            the measured flip latency. Defaults to 0.
+        window (float, optional): How far back in time (in seconds) to look when
+            estimating cursor velocity. Defaults to 0.05.
+        max_horizon (float, optional): The maximum time (in seconds) to
+            extrapolate the cursor forward. Defaults to 0.1.
+
+    """
+    def __init__(
+        self, origin, max_radius, initial_latency, offset=0.0, window=0.05,
+        max_horizon=0.1
+    ):
+        self.origin = origin
+        self.max_radius = max_radius
+        self.offset = offset
+        self.window = window
+        self.max_horizon = max_horizon
+        self.latency = initial_latency
+        self._samples = deque(maxlen=16)
+        self._last_input = None
+
+    def reset(self):
+        """Clears all recent cursor samples (e.g. at the start of a trial).
+
+        """
+        self._samples.clear()
+        self._last_input = None
+
+    def add(self, t, pos):
+        """Adds a new raw cursor sample.
+
+        Args:
+            t (float): The time (in seconds) the input was sampled.
+            pos (tuple): The raw (x, y) cursor position for the sample.
+
+        """
+        self._samples.append((t, pos[0], pos[1]))
+        self._last_input = t
+
+    def flipped(self, flip_time):
+        """Updates the latency estimate using the time the last frame was flipped.
+
+        Args:
+            flip_time (float): The time (in seconds) at which ``flip()`` returned
+                for the frame drawn using the most recent sample.
+
+        """
+        if self._last_input is None:
+            return
+        # Smooth latency estimate with an exponential moving average
+        latency = flip_time - self._last_input
+        self.latency += 0.1 * (latency - self.latency)
+
+    def _velocity(self):
+        # Estimates x/y velocity using least-squares over the recent samples
+        newest = self._samples[-1][0]
+        pts = [s for s in self._samples if newest - s[0] <= self.window]
+        n = len(pts)
+        if n < 2:
+            return (0.0, 0.0)
+        mean_t = sum(s[0] for s in pts) / n
+        mean_x = sum(s[1] for s in pts) / n
+        mean_y = sum(s[2] for s in pts) / n
+        var_t = sum((s[0] - mean_t) ** 2 for s in pts)
+        if var_t <= 0:
+            return (0.0, 0.0)
+        vx = sum((s[0] - mean_t) * (s[1] - mean_x) for s in pts) / var_t
+        vy = sum((s[0] - mean_t) * (s[2] - mean_y) for s in pts) / var_t
+        return (vx, vy)
+
+    def predict(self):
+        """Extrapolates the most recent cursor sample to the expected display time.
+
+        Returns:
+            tuple: The predicted (x, y) position of the cursor, in pixels.
+
+        """
+        if not len(self._samples):
+            return self.origin
+        _, x, y = self._samples[-1]
+        vx, vy = self._velocity()
+        if vx == 0 and vy == 0:
+            return (x, y)
+
+        horizon = self.horizon
+        dx = x + vx * horizon - self.origin[0]
+        dy = y + vy * horizon - self.origin[1]
+        # Keep the predicted cursor within the range of the joystick
+        dist = sqrt(dx ** 2 + dy ** 2)
+        if dist > self.max_radius:
+            dx = dx * self.max_radius / dist
+            dy = dy * self.max_radius / dist
+        return (self.origin[0] + int(dx), self.origin[1] + int(dy))
+
+    @property
+    def horizon(self):
+        """float: The current prediction horizon (in seconds)."""
+        return min(self.max_horizon, max(0.0, self.latency + self.offset))
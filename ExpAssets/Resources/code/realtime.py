@@ -0,0 +1,160 @@
+import gc
+import os
+import sys
+from time import perf_counter
+
+
+# Windows process priority constants (see SetPriorityClass in the Win32 API)
+_WIN_HIGH_PRIORITY = 0x00000080
+
+
+def _raise_priority():
+    # Tries to raise the scheduling priority of the current process, returning
+    # a function that restores the original priority (or None if not allowed)
+    if sys.platform == "win32":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        proc = kernel32.GetCurrentProcess()
+        old = kernel32.GetPriorityClass(proc)
+        if not old or not kernel32.SetPriorityClass(proc, _WIN_HIGH_PRIORITY):
+            return None
+        return lambda: kernel32.SetPriorityClass(proc, old)
+    try:
+        old = os.getpriority(os.PRIO_PROCESS, 0)
+        os.setpriority(os.PRIO_PROCESS, 0, old - 10)
+    except (AttributeError, OSError):
+        # Raising priority usually requires root on Linux & macOS
+        return None
+    return lambda: os.setpriority(os.PRIO_PROCESS, 0, old)
+
+
+def _pin_affinity(cpus):
+    # Tries to pin the current process to a given set of CPUs, returning a
+    # function that restores the original affinity (or None if unsupported)
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    try:
+        old = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+    except (OSError, ValueError):
+        return None
+    return lambda: os.sched_setaffinity(0, old)
+
+
+
+class RealtimeMode(object):
+    """Isolates trials from garbage collection pauses and OS scheduling noise.
+
+    While a trial is active, Python's cyclic garbage collector is disabled
+    so that collection pauses can't land in the middle of the trial loop.
+    Any garbage created during the trial is then collected during the
+    inter-trial interval. All objects alive at the start of the session
+    (stimuli, trial lists, etc.) are also frozen into the permanent GC
+    generation, which keeps those between-trial collections short.
+
+    If the OS allows it, the priority of the process is also raised for the
+    duration of the session and the process can be pinned to a specific set
+    of CPU cores. Any GC pauses that still happen during a trial (e.g. from
+    an explicit ``gc.collect()`` call) are timed and recorded.
+
+    Args:
+        priority (bool, optional): Whether to try raising the priority of the
+            process when the session starts. Defaults to True.
+        cpus (list, optional): The indices of the CPU cores to pin the process
+            to when the session starts. Only supported on Linux. Defaults to
+            None (no CPU pinning).
+
+    """
+    def __init__(self, priority=True, cpus=None):
+        self.priority = priority
+        self.cpus = set(cpus) if cpus else None
+        self.pauses = []
+        self._in_trial = False
+        self._gc_was_enabled = True
+        self._gc_start = None
+        self._restore = []
+
+    def _gc_callback(self, phase, info):
+        # Times any garbage collections that happen during a trial
+        if not self._in_trial:
+            return
+        if phase == "start":
+            self._gc_start = perf_counter()
+        elif self._gc_start is not None:
+            duration = perf_counter() - self._gc_start
+            self.pauses.append((info['generation'], duration))
+            self._gc_start = None
+
+    def start(self):
+        """Applies the session-wide realtime settings.
+
+        Returns:
+            dict: Whether the process priority was raised ('priority') and
+            whether the process was pinned to specific CPUs ('affinity').
+
+        """
+        status = {'priority': False, 'affinity': False}
+        if self.priority:
+            restore = _raise_priority()
+            if restore:
+                self._restore.append(restore)
+                status['priority'] = True
+        if self.cpus:
+            restore = _pin_affinity(self.cpus)
+            if restore:
+                self._restore.append(restore)
+                status['affinity'] = True
+
+        # Move everything created during setup out of the GC's way
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        gc.callbacks.append(self._gc_callback)
+        return status
+
+    def stop(self):
+        """Reverts all session-wide realtime settings.
+
+        """
+        self.exit_trial()
+        if self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        if hasattr(gc, "unfreeze"):
+            gc.unfreeze()
+        while len(self._restore):
+            self._restore.pop()()
+
+    def enter_trial(self):
+        """Disables automatic garbage collection for the upcoming trial.
+
+        If the previous trial was never exited (e.g. it was recycled), garbage
+        collection stays disabled and only its recorded GC pauses are cleared.
+
+        """
+        self.pauses = []
+        if self._in_trial:
+            return
+        self._gc_was_enabled = gc.isenabled()
+        gc.disable()
+        self._in_trial = True
+
+    def exit_trial(self):
+        """Re-enables garbage collection and collects any trial garbage.
+
+        Returns:
+            list: A list of (generation, duration) tuples for any GC pauses that
+            occurred during the trial, with durations in seconds.
+
+        """
+        if not self._in_trial:
+            return []
+        self._in_trial = False
+        gc.collect()
+        if self._gc_was_enabled:
+            gc.enable()
+        return self.pauses
+
+    @property
+    def in_trial(self):
+        """bool: Whether automatic garbage collection is currently suspended."""
+        return self._in_trial
@@ -0,0 +1,114 @@
+from OpenGL import GL as gl
+
+
+def stim_size(stim):
+    # Gets the (width, height) in pixels of a rendered Drawbject or NumpySurface
+    pixels = getattr(stim, 'rendered', None)
+    if pixels is None:
+        pixels = stim.render()
+    return (pixels.shape[1], pixels.shape[0])
+
+
+def centered_rect(size, loc, margin=1):
+    # Gets the (x1, y1, x2, y2) bounds of an image drawn centered on a location
+    # (i.e. with registration 5), padded by a margin to allow for rounding
+    w, h = size
+    x1 = int(loc[0]) - w // 2 - margin
+    y1 = int(loc[1]) - h // 2 - margin
+    return (x1, y1, x1 + w + margin * 2, y1 + h + margin * 2)
+
+
+def rect_union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def rects_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+
+class DirtyRegions(object):
+    """Tracks which part of the screen needs to be repainted for each frame.
+
+    When only a small part of the screen changes between frames (e.g. the cursor
+    moving during a trial), clearing and redrawing the whole screen every frame
+    wastes fill rate, especially on high-resolution displays. Instead, this
+    class works out the smallest rectangle that covers everything that has
+    changed and restricts drawing to it with a scissor test.
+
+    Since the back buffer after a flip holds the frame drawn ``buffers`` flips
+    ago (not the last frame), each repaint covers the moving objects' bounds
+    for the current frame and for each of the last ``buffers`` frames. Whenever
+    the static parts of the scene change (e.g. the target appears), the full
+    screen is repainted for the next ``buffers`` frames.
+
+    Args:
+        screen_size (tuple): The (width, height) of the screen, in pixels.
+        buffers (int, optional): The number of buffers in the display's swap
+            chain (2 for double-buffering). Defaults to 2.
+
+    """
+    def __init__(self, screen_size, buffers=2):
+        self.screen_size = screen_size
+        self.buffers = buffers
+        self.invalidate()
+
+    def invalidate(self):
+        """Forces the full screen to be repainted for the next few frames.
+
+        """
+        self._history = []
+        self._scene = None
+        self._full_frames = self.buffers
+
+    def update(self, rect, scene=None):
+        """Gets the region of the screen to repaint for the next frame.
+
+        Args:
+            rect (tuple): The (x1, y1, x2, y2) bounds of everything that moves
+                on the next frame.
+            scene (optional): A value describing the static content of the next
+                frame. If different from the previous frame's, the full screen
+                will be repainted.
+
+        Returns:
+            tuple or None: The (x1, y1, x2, y2) bounds of the region to repaint,
+            or None if the full screen needs to be repainted.
+
+        """
+        if scene != self._scene:
+            self._scene = scene
+            self._full_frames = self.buffers
+        region = rect
+        for prev in self._history:
+            region = rect_union(region, prev)
+        self._history.append(rect)
+        if len(self._history) > self.buffers:
+            self._history.pop(0)
+
+        if self._full_frames > 0:
+            self._full_frames -= 1
+            return None
+        return region
+
+    def begin(self, region):
+        """Restricts all drawing to a given region until :meth:`end` is called.
+
+        Args:
+            region (tuple): The (x1, y1, x2, y2) bounds of the region to draw to.
+
+        """
+        x1, y1, x2, y2 = region
+        x1 = max(0, x1)
+        y2 = min(self.screen_size[1], y2)
+        w = max(0, min(self.screen_size[0], x2) - x1)
+        h = max(0, y2 - max(0, y1))
+        # NOTE: GL scissor boxes use a bottom-left origin
+        gl.glEnable(gl.GL_SCISSOR_TEST)
+        gl.glScissor(x1, self.screen_size[1] - y2, w, h)
+
+    def end(self):
+        """Re-enables drawing to the full screen.
+
+        """
+        gl.glDisable(gl.GL_SCISSOR_TEST)
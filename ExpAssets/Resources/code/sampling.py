@@ -0,0 +1,141 @@
+from array import array
+from time import perf_counter
+
+
+# The maximum number of channels that can be recorded per device
+MAX_CHANNELS = 6
+
+
+class GamepadSource(object):
+    """An input source that reads all sticks & triggers of a game controller.
+
+    Args:
+        pad: A :obj:`GameController` or :obj:`ControllerManager` to read from.
+
+    """
+    channels = (
+        'left_x', 'left_y', 'right_x', 'right_y', 'left_trigger', 'right_trigger'
+    )
+
+    def __init__(self, pad):
+        self.pad = pad
+
+    @property
+    def name(self):
+        return self.pad.name
+
+    def read(self):
+        lx, ly = self.pad.left_stick()
+        rx, ry = self.pad.right_stick()
+        return (lx, ly, rx, ry, self.pad.left_trigger(), self.pad.right_trigger())
+
+
+
+class DeviceSampler(object):
+    """Samples a set of input devices into separate timestamped buffers.
+
+    Each call to :meth:`sample` reads every device back-to-back, timestamping
+    the readings with a shared clock so samples from different devices can be
+    lined up afterwards. Readings are only stored when a device's values
+    change. Sources can be any object with a ``name``, a tuple of ``channels``
+    names (up to 6), and a ``read()`` method that returns the current integer
+    value of each channel.
+
+    Note that SDL only updates the state of game controllers when events are
+    pumped, so controllers should be sampled once right after each pump (once
+    per frame during trials): sampling any more often would only re-read the
+    same values. The resolution of the recorded samples is thus the pump rate.
+
+    Args:
+        sources (list): The input sources to sample from.
+        clock (callable, optional): The clock function to use for timestamps,
+            returning the time in seconds. Defaults to ``time.perf_counter``.
+
+    """
+    def __init__(self, sources, clock=perf_counter):
+        for src in sources:
+            if len(src.channels) > MAX_CHANNELS:
+                e = "Input sources can have at most {0} channels ('{1}' has {2})."
+                raise ValueError(e.format(MAX_CHANNELS, src.name, len(src.channels)))
+        self.sources = list(sources)
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        """Clears all buffers, e.g. at the start of a trial.
+
+        """
+        self._times = [array('d') for src in self.sources]
+        self._values = [array('i') for src in self.sources]
+        self._last = [None for src in self.sources]
+
+    def sample(self):
+        """Reads the current values of every input source.
+
+        Each device's reading is stored along with the current time if it
+        differs from the device's previous one.
+
+        """
+        t = self.clock()
+        for i, src in enumerate(self.sources):
+            reading = tuple(src.read())
+            if reading != self._last[i]:
+                self._values[i].extend(reading)
+                self._times[i].append(t)
+                self._last[i] = reading
+
+    def samples(self, device, origin=0.0):
+        """Gets all samples recorded for a given device since the last reset.
+
+        Args:
+            device (int): The index of the device in the list of sources.
+            origin (float, optional): The clock time (in seconds) to use as
+                time 0. Defaults to 0 (i.e. raw clock times).
+
+        Returns:
+            list: A list of (time, values) tuples, with times in milliseconds.
+
+        """
+        n = len(self.sources[device].channels)
+        values = self._values[device]
+        return [
+            ((t - origin) * 1000, tuple(values[i * n:(i + 1) * n]))
+            for i, t in enumerate(self._times[device])
+        ]
+
+    def rows(self, origin=0.0):
+        """Gets the samples for all devices as rows for the 'device_samples' table.
+
+        Args:
+            origin (float, optional): The clock time (in seconds) to use as
+                time 0. Defaults to 0 (i.e. raw clock times).
+
+        Returns:
+            list: A list of dicts with 'device', 'time', and 'ch0' to 'ch5' keys,
+            with unused channels set to None.
+
+        """
+        rows = []
+        for device in range(len(self.sources)):
+            for t, values in self.samples(device, origin):
+                row = {'device': device, 'time': t}
+                for ch in range(MAX_CHANNELS):
+                    row['ch{0}'.format(ch)] = values[ch] if ch < len(values) else None
+                rows.append(row)
+        return rows
+
+    def device_info(self):
+        """Gets the name and channel names of each device, for the 'devices' table.
+
+        Returns:
+            list: A list of dicts with 'device', 'name', and 'channels' keys.
+
+        """
+        info = []
+        for device, src in enumerate(self.sources):
+            info.append({
+                'device': device,
+                'name': src.name,
+                'channels': ",".join(src.channels),
+            })
+        return info
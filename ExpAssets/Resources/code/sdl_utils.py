@@ -34,3 +34,86 @@ def get_key_state(key):
     if scancode <= numkeys.value:
         return keys[scancode]
     return 0
+
+
+def set_event_state(event_types, enabled):
+    """Enables or disables the processing of one or more types of SDL event.
+
+    When an event type is disabled, SDL still updates its internal device
+    state for events of that type (e.g. the current mouse position or axis
+    values for a game controller) but stops adding them to the event queue,
+    meaning they don't need to be fetched and processed in Python.
+
+    Args:
+        event_types (list): A list of the SDL event types to enable or disable.
+        enabled (bool): Whether the given event types should be enabled.
+
+    Returns:
+        dict: The previous state (True if enabled) of each given event type.
+
+    """
+    new_state = sdl2.SDL_ENABLE if enabled else sdl2.SDL_IGNORE
+    prev = {}
+    for etype in event_types:
+        prev[etype] = sdl2.SDL_EventState(etype, new_state) == sdl2.SDL_ENABLE
+    return prev
+
+
+
+class EventPolicy(object):
+    """A set of SDL event types to ignore during a given phase of the task.
+
+    Applying a policy disables all of its event types, and restoring it sets
+    each of those event types back to the state it was in before the policy
+    was applied.
+
+    Args:
+        ignore (list): A list of the SDL event types to ignore while the policy
+            is active.
+
+    """
+    def __init__(self, ignore):
+        self.ignore = list(ignore)
+        self._prev = None
+
+    def apply(self):
+        if self._prev is None:
+            self._prev = set_event_state(self.ignore, False)
+
+    def restore(self):
+        if self._prev is None:
+            return
+        enabled = [etype for etype, state in self._prev.items() if state]
+        set_event_state(enabled, True)
+        self._prev = None
+
+    @property
+    def active(self):
+        """bool: Whether the policy is currently applied."""
+        return self._prev is not None
+
+
+
+class QueueStats(object):
+    """Tracks the number of events processed per frame during a trial.
+
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, queue):
+        n = len(queue)
+        self.frames += 1
+        self.total += n
+        if n > self.max:
+            self.max = n
+
+    @property
+    def mean(self):
+        """float: The mean number of events per frame."""
+        return self.total / self.frames if self.frames else 0.0
@@ -0,0 +1,144 @@
+from math import sqrt
+
+
+# The per-trial measures summarized for each phase, in table column order
+SUMMARY_MEASURES = ('angle_error', 'movement_rt')
+
+
+class RunningStats(object):
+    """Tracks the count, mean, and variance of a stream of values.
+
+    Uses Welford's algorithm, so each new value is added in constant time
+    without storing previous values and without the loss of precision that
+    comes from keeping running sums of squares.
+
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, x):
+        """Adds a new value to the running statistics.
+
+        Args:
+            x (float): The value to add.
+
+        """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        """float: The sample variance of the values, or None if fewer than two."""
+        return self._m2 / (self.n - 1) if self.n > 1 else None
+
+    @property
+    def sd(self):
+        """float: The sample standard deviation of the values, or None if fewer
+        than two.
+        """
+        var = self.variance
+        return sqrt(var) if var is not None else None
+
+
+class PhaseSummary(object):
+    """Maintains running statistics for each phase of a session.
+
+    Keeps the number of trials, errors, and timeouts for each phase, along with
+    the running mean and variance of each trial's initial angle error (the
+    signed difference between the initial movement angle and the target angle,
+    in degrees) and movement RT. Each trial is added in constant time, so the
+    summary stays up to date over the session without querying the database.
+
+    """
+    def __init__(self):
+        self._phases = {}
+
+    def add(self, trial):
+        """Adds the data for a completed trial to its phase's summary.
+
+        Args:
+            trial (dict): The trial data returned by ``trial()``, containing at
+                least the trial's phase, target angle, movement RT, response
+                RT, initial angle, and error (None if no error).
+
+        """
+        phase = self._phases.get(trial['phase'])
+        if phase is None:
+            phase = {'trials': 0, 'errors': 0, 'timeouts': 0}
+            for m in SUMMARY_MEASURES:
+                phase[m] = RunningStats()
+            self._phases[trial['phase']] = phase
+        phase['trials'] += 1
+        if trial['err'] is not None:
+            phase['errors'] += 1
+        elif trial['response_rt'] is None:
+            phase['timeouts'] += 1
+        if trial['initial_angle'] is not None:
+            diff = trial['initial_angle'] - trial['target_angle']
+            phase['angle_error'].add((diff + 180) % 360 - 180)
+        if trial['movement_rt'] is not None:
+            phase['movement_rt'].add(trial['movement_rt'])
+
+    def row(self, phase):
+        """Gets the current summary for a phase as a database row.
+
+        Args:
+            phase (str): The name of the phase to summarize.
+
+        Returns:
+            dict: The number of trials, errors, and timeouts in the phase, and
+            the count, mean, and variance of each summarized measure (None if
+            not available), or None if no trials have been added for the phase.
+
+        """
+        stats = self._phases.get(phase)
+        if stats is None:
+            return None
+        row = {
+            'phase': phase,
+            'trials': stats['trials'],
+            'errors': stats['errors'],
+            'timeouts': stats['timeouts'],
+        }
+        for m in SUMMARY_MEASURES:
+            s = stats[m]
+            row[m + '_n'] = s.n
+            row[m + '_mean'] = s.mean if s.n else None
+            row[m + '_var'] = s.variance
+        return row
+
+    def lines(self, phase):
+        """Gets a short text summary of a phase for display.
+
+        Args:
+            phase (str): The name of the phase to summarize.
+
+        Returns:
+            list: The lines of the summary (empty if no trials have been added
+            for the phase).
+
+        """
+        stats = self._phases.get(phase)
+        if stats is None:
+            return []
+        n = stats['trials']
+        lines = [
+            "{0}: {1} trials, {2:.0%} errors, {3:.0%} timeouts".format(
+                phase, n, stats['errors'] / n, stats['timeouts'] / n
+            )
+        ]
+        labels = {'angle_error': "Initial angle error", 'movement_rt': "Movement RT"}
+        units = {'angle_error': "°", 'movement_rt': " ms"}
+        for m in SUMMARY_MEASURES:
+            s = stats[m]
+            if not s.n:
+                continue
+            sd = "" if s.sd is None else ", SD = {0:.1f}{1}".format(s.sd, units[m])
+            lines.append("{0}: mean = {1:.1f}{2}{3} (n = {4})".format(
+                labels[m], s.mean, units[m], sd, s.n
+            ))
+        return lines
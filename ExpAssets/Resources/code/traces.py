@@ -0,0 +1,104 @@
+import sys
+import struct
+from array import array
+
+
+# Binary layout for raw input traces (all values little-endian):
+#  - Header: magic (4 bytes), version (uint8), channels (uint8), reserved
+#    (uint16), sample count (uint32)
+#  - Sample times: one int32 per sample, in microseconds since trial start
+#  - Sample values: one int16 per channel per sample, interleaved by sample
+TRACE_MAGIC = b"MMRT"
+TRACE_VERSION = 1
+TRACE_CHANNELS = ('stick_x', 'stick_y', 'left_trigger', 'right_trigger')
+_HEADER = struct.Struct("<4sBBHI")
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+
+def _to_little_endian(arr):
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+
+class TraceBuffer(object):
+    """A compact buffer of raw, full-resolution stick & trigger samples.
+
+    Stores each sample's time and raw 16-bit values in flat arrays, which can
+    be packed into a single binary blob (see :func:`unpack_trace` for reading
+    it back).
+
+    """
+    def __init__(self):
+        self.reset()
+
+    def __len__(self):
+        return len(self._times)
+
+    def reset(self):
+        """Clears all samples from the buffer.
+
+        """
+        self._times = array('i')
+        self._values = array('h')
+
+    def add(self, t, values):
+        """Adds a sample to the buffer.
+
+        Args:
+            t (float): The time of the sample, in seconds since trial start.
+            values (tuple): The raw stick x, stick y, left trigger, and right
+                trigger values for the sample. Values outside of the int16
+                range are clipped.
+
+        """
+        self._times.append(int(t * 1e6))
+        for v in values:
+            self._values.append(max(INT16_MIN, min(INT16_MAX, int(v))))
+
+    def pack(self):
+        """Packs the buffer's samples into a compact binary blob.
+
+        Returns:
+            bytes: The packed trace data.
+
+        """
+        header = _HEADER.pack(
+            TRACE_MAGIC, TRACE_VERSION, len(TRACE_CHANNELS), 0, len(self._times)
+        )
+        times = _to_little_endian(self._times).tobytes()
+        values = _to_little_endian(self._values).tobytes()
+        return header + times + values
+
+
+def unpack_trace(data):
+    """Unpacks a raw input trace blob created by :meth:`TraceBuffer.pack`.
+
+    Args:
+        data (bytes): The packed trace data.
+
+    Returns:
+        list: A list of (time, values) tuples for each sample, with times in
+        microseconds since the start of the trial and values as a tuple of raw
+        (stick_x, stick_y, left_trigger, right_trigger) values.
+
+    """
+    data = bytes(data)
+    magic, version, channels, _, n = _HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError("Data is not a supported raw input trace.")
+    offset = _HEADER.size
+    times = array('i')
+    times.frombytes(data[offset:offset + n * 4])
+    values = array('h')
+    values.frombytes(data[offset + n * 4:offset + n * 4 + n * channels * 2])
+    if sys.byteorder != "little":
+        times.byteswap()
+        values.byteswap()
+    return [
+        (times[i], tuple(values[i * channels:(i + 1) * channels])) for i in range(n)
+    ]
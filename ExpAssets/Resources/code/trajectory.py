@@ -0,0 +1,93 @@
+from math import hypot
+from bisect import bisect_left
+
+
+def _sed(p, a, b, xi, yi):
+    # Gets the synchronized Euclidean distance of a sample from a segment, i.e.
+    # the distance between the sample and the point interpolated along the
+    # segment at the same timestamp
+    dt = b[0] - a[0]
+    f = (p[0] - a[0]) / float(dt) if dt else 0.0
+    x = a[xi] + f * (b[xi] - a[xi])
+    y = a[yi] + f * (b[yi] - a[yi])
+    return hypot(p[xi] - x, p[yi] - y)
+
+
+def _simplify_mask(samples, tolerance, axes, keep):
+    # Marks the samples needed to keep a trajectory within a given error bound,
+    # using the Ramer-Douglas-Peucker algorithm with time-synchronized distances.
+    # Each sample's error is its largest distance across all positions, so that
+    # every position stays within the bound for the same set of kept samples.
+    stack = [(0, len(samples) - 1)]
+    while len(stack):
+        first, last = stack.pop()
+        a, b = (samples[first], samples[last])
+        max_err, max_i = (0.0, None)
+        for i in range(first + 1, last):
+            err = max(_sed(samples[i], a, b, xi, yi) for xi, yi in axes)
+            if err > max_err:
+                max_err, max_i = (err, i)
+        if max_i is not None and max_err > tolerance:
+            keep[max_i] = True
+            stack.append((first, max_i))
+            stack.append((max_i, last))
+
+
+def simplify(samples, tolerance, axes=((1, 2),)):
+    """Simplifies a cursor trajectory to within a given maximum error.
+
+    Removes samples from a trajectory such that linearly interpolating between
+    the remaining samples reproduces the position of every removed sample at
+    its original timestamp to within the given tolerance (in pixels). Since
+    the error is measured at matching timestamps, both the spatial path and
+    its timing are preserved.
+
+    Args:
+        samples (list): The trajectory samples, as tuples with the timestamp
+            as the first element.
+        tolerance (float): The maximum allowed position error, in pixels.
+        axes (tuple, optional): The (x, y) indices within each sample of each
+            position to preserve. Every position is kept within the tolerance.
+            Defaults to ``((1, 2),)``.
+
+    Returns:
+        list: The retained samples, in their original order.
+
+    """
+    n = len(samples)
+    if n < 3:
+        return list(samples)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    _simplify_mask(samples, tolerance, axes, keep)
+    return [s for s, k in zip(samples, keep) if k]
+
+
+def interpolate(samples, times, xi=1, yi=2):
+    """Reconstructs trajectory positions at given times from simplified samples.
+
+    Args:
+        samples (list): The simplified trajectory samples, as tuples with the
+            timestamp as the first element.
+        times (list): The timestamps at which to reconstruct the trajectory.
+        xi (int, optional): The index of the x position in each sample.
+        yi (int, optional): The index of the y position in each sample.
+
+    Returns:
+        list: The interpolated (time, x, y) position at each timestamp.
+
+    """
+    stamps = [s[0] for s in samples]
+    out = []
+    for t in times:
+        i = bisect_left(stamps, t)
+        if i == 0:
+            a = b = samples[0]
+        elif i >= len(samples):
+            a = b = samples[-1]
+        else:
+            a, b = (samples[i - 1], samples[i])
+        dt = b[0] - a[0]
+        f = (t - a[0]) / float(dt) if dt else 0.0
+        out.append((t, a[xi] + f * (b[xi] - a[xi]), a[yi] + f * (b[yi] - a[yi])))
+    return out
@@ -0,0 +1,82 @@
+# Shared helpers for the benchmark scripts in this folder
+
+import os
+import sys
+import json
+import runpy
+import platform
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(ROOT, "ExpAssets", "Resources", "code")
+TOOLS_DIR = os.path.join(ROOT, "tools")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Make the task's code modules importable the same way klibs does, along with
+# the offline data tools
+for path in [TOOLS_DIR, CODE_DIR]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_params():
+    # Loads the task's klibs parameter overrides as a dict
+    path = os.path.join(ROOT, "ExpAssets", "Config", "MotorMapping_params.py")
+    return runpy.run_path(path)
+
+
+def percentile(values, pct):
+    # Gets a given percentile of a list of values (nearest-rank method)
+    ordered = sorted(values)
+    if not len(ordered):
+        return float("nan")
+    rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+def summarize(times):
+    # Summarizes a list of durations (in seconds) as milliseconds
+    n = len(times)
+    return {
+        'n': n,
+        'mean': (sum(times) / n) * 1000 if n else float("nan"),
+        'p50': percentile(times, 50) * 1000,
+        'p99': percentile(times, 99) * 1000,
+        'p99.9': percentile(times, 99.9) * 1000,
+        'max': max(times) * 1000 if n else float("nan"),
+    }
+
+
+def print_table(rows, cols):
+    # Prints a list of dicts as a simple aligned text table
+    widths = {c: len(c) for c in cols}
+    fmt_rows = []
+    for row in rows:
+        fmt = {}
+        for c in cols:
+            val = row.get(c, "")
+            fmt[c] = "{:.4f}".format(val) if isinstance(val, float) else str(val)
+            widths[c] = max(widths[c], len(fmt[c]))
+        fmt_rows.append(fmt)
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    print("  ".join("-" * widths[c] for c in cols))
+    for fmt in fmt_rows:
+        print("  ".join(fmt[c].ljust(widths[c]) for c in cols))
+
+
+def save_results(name, results):
+    # Writes benchmark results to a timestamped JSON file for later comparison
+    if not os.path.isdir(RESULTS_DIR):
+        os.makedirs(RESULTS_DIR)
+    out = {
+        'benchmark': name,
+        'time': datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, "{0}_{1}.json".format(name, stamp))
+    with open(path, "w") as f:
+        json.dump(out, f, indent=2)
+    return path
@@ -0,0 +1,242 @@
+# Generates synthetic task databases for benchmarking the offline data tools
+
+import os
+import random
+import sqlite3
+from math import sin, cos, radians, degrees, atan2, hypot
+
+import _common
+
+SCHEMA_PATH = os.path.join(_common.ROOT, "ExpAssets", "Config", "MotorMapping_schema.sql")
+
+# A copy of the task's original database schema, from before the typed schema
+# revision, for creating databases in the old format
+LEGACY_SCHEMA_PATH = os.path.join(_common.ROOT, "benchmarks", "legacy_schema.sql")
+
+SCREEN_C = (960, 540)
+PPD = 45.0 # Approximate pixels per degree for a 1080p screen
+PHASES = [
+    ('baseline', 40, 0), ('pretest', 10, -45), ('training', 200, -45),
+    ('posttest', 10, -45), ('washout', 40, 0),
+]
+CONDITIONS = ['PP', 'MI', 'CC']
+
+
+def _min_jerk(p):
+    return 10 * p ** 3 - 15 * p ** 4 + 6 * p ** 5
+
+
+def _vector_angle(pos):
+    # Gets the angle of a cursor position from the screen centre (0 is up)
+    return degrees(atan2(pos[0] - SCREEN_C[0], SCREEN_C[1] - pos[1])) % 360
+
+
+def _target_loc(target_angle, target_dist):
+    # Gets the pixel location of a target the same way as the task, rounding
+    # its coordinates down to whole pixels
+    return (
+        int(SCREEN_C[0] + target_dist * sin(radians(target_angle))),
+        int(SCREEN_C[1] - target_dist * cos(radians(target_angle))),
+    )
+
+
+def _pp_trial(rng, target_angle, target_dist, aim_err, frame_ms):
+    # Simulates the logged cursor samples & response times for a physical trial
+    target = _target_loc(target_angle, target_dist)
+    aim = radians(target_angle + aim_err)
+    first = (target_dist * sin(aim), -target_dist * cos(aim))
+    curve = rng.uniform(-0.1, 0.1)
+    onset_ms = rng.uniform(180, 450)
+    reach_ms = rng.uniform(300, 600)
+    fix_ms = rng.uniform(150, 300) if abs(aim_err) > 5 else 0
+    hold_ms = rng.uniform(150, 400)
+    # Occasionally the cursor is flicked a short way out and held perfectly still
+    # before the reach, so that no samples are logged while it's held
+    flick = rng.random() < 0.1
+    flick_ms = rng.uniform(20, 150) if flick else 0
+    flick_p = rng.uniform(1.2, 3.0) * PPD / target_dist if flick else 0.0
+
+    samples = []
+    last = SCREEN_C
+    movement_rt, contact_rt, initial_angle = (None, None, None)
+    t = onset_ms - rng.uniform(0, frame_ms)
+    onset_ms += flick_ms
+    while t < onset_ms + reach_ms + fix_ms + hold_ms:
+        if t >= onset_ms - flick_ms:
+            noise = t >= onset_ms
+            if t < onset_ms + reach_ms:
+                p = max(_min_jerk(max(0.0, t - onset_ms) / reach_ms), flick_p)
+                bend = curve * 4 * p * (1 - p)
+                x = first[0] * p - first[1] * bend
+                y = first[1] * p + first[0] * bend
+            else:
+                # Corrective submovement from the initial endpoint to the target
+                p = 1.0
+                if fix_ms:
+                    p = _min_jerk(min(1.0, (t - onset_ms - reach_ms) / fix_ms))
+                x = first[0] + (target[0] - SCREEN_C[0] - first[0]) * p
+                y = first[1] + (target[1] - SCREEN_C[1] - first[1]) * p
+            pos = (
+                SCREEN_C[0] + int(x + (rng.gauss(0, 0.5) if noise else 0)),
+                SCREEN_C[1] + int(y + (rng.gauss(0, 0.5) if noise else 0)),
+            )
+            dist = hypot(pos[0] - SCREEN_C[0], pos[1] - SCREEN_C[1])
+            if dist > 0:
+                if movement_rt is None:
+                    movement_rt = t
+                if initial_angle is None and dist / PPD > 1.0 and t - movement_rt > 50:
+                    initial_angle = _vector_angle(pos)
+                over_target = hypot(pos[0] - target[0], pos[1] - target[1]) < PPD / 2
+                if contact_rt is None and over_target:
+                    contact_rt = t
+                if pos != last:
+                    samples.append((t, pos[0], pos[1], pos[0], pos[1]))
+                last = pos
+        t += frame_ms
+    return samples, movement_rt, contact_rt, t, initial_angle
+
+
+def _imagery_trial(rng, frame_ms):
+    # Simulates the logged samples & response time for an MI or CC trial, which
+    # occasionally have a small amount of stick drift
+    response_rt = rng.gauss(1500, 250)
+    samples = []
+    movement_rt = None
+    if rng.random() < 0.15:
+        movement_rt = rng.uniform(100, response_rt - 100)
+        t = movement_rt
+        last = SCREEN_C
+        while t < response_rt:
+            offset = (rng.randint(1, 8) * rng.choice([-1, 1]), rng.randint(-8, 8))
+            pos = (SCREEN_C[0] + offset[0], SCREEN_C[1] + offset[1])
+            if pos != last:
+                samples.append((t, pos[0], pos[1], pos[0], pos[1]))
+            last = pos
+            t += frame_ms * rng.randint(1, 6)
+    return samples, movement_rt, response_rt
+
+
+def make_dataset(path, participants=100, seed=1, refresh_rate=120.0, legacy=False):
+    # Creates a synthetic task database resembling real session data. Each
+    # participant gets a full session (300 trials across the five phases) in
+    # one of the three conditions, with cursor trajectories that adapt to the
+    # rotation over the course of training, occasional errors and timeouts, and
+    # KVIQ responses. Gamepad samples are logged the same way as the task (only
+    # when the cursor moves, in ms since target onset). If 'legacy' is True,
+    # the database uses the original schema, with "NA" strings for missing
+    # values, whole-ms sample times, and none of the columns added since.
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    frame_ms = 1000.0 / refresh_rate
+    na = "NA" if legacy else None
+    conn = sqlite3.connect(path)
+    with open(LEGACY_SCHEMA_PATH if legacy else SCHEMA_PATH, "r") as f:
+        conn.executescript(f.read())
+
+    trial_cols = [
+        'participant_id', 'block_num', 'trial_num', 'phase', 'trial_type',
+        'rotation', 'target_onset', 'target_dist', 'target_angle', 'movement_rt',
+        'contact_rt', 'response_rt', 'initial_angle', 'err', 'target_x',
+        'target_y',
+    ]
+    gamepad_cols = [
+        'participant_id', 'block_num', 'trial_num', 'time', 'stick_x', 'stick_y',
+    ]
+    if not legacy:
+        trial_cols.append('controller_dropouts')
+        gamepad_cols += ['display_x', 'display_y']
+    trial_q = "INSERT INTO trials ({0}) VALUES ({1})".format(
+        ", ".join(trial_cols), ", ".join(["?"] * len(trial_cols))
+    )
+    gamepad_q = "INSERT INTO gamepad ({0}) VALUES ({1})".format(
+        ", ".join(gamepad_cols), ", ".join(["?"] * len(gamepad_cols))
+    )
+    kviq_q = (
+        "INSERT INTO kviq (participant_id, movement, vividness, intensity, "
+        "physical_time, visual_time, kinaesthetic_time) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    for pid in range(1, participants + 1):
+        condition = CONDITIONS[(pid - 1) % len(CONDITIONS)]
+        conn.execute(
+            "INSERT INTO participants VALUES (?, ?, ?, ?, ?, ?)",
+            (pid, "p{0:04d}".format(pid), rng.choice("mf"), rng.randint(18, 30),
+             rng.choice("rrrrl"), "2024-01-01 12:00:00")
+        )
+        for movement in ["shoulder", "elbow", "wrist", "thumb", "foot"]:
+            conn.execute(kviq_q, (
+                pid, movement, rng.randint(1, 5), rng.randint(1, 5),
+                rng.uniform(2, 6), rng.uniform(2, 6), rng.uniform(2, 6)
+            ))
+
+        adapt = 0.0
+        rate = rng.uniform(0.01, 0.04)
+        trials, gamepad = ([], [])
+        for block, (phase, n_trials, rotation) in enumerate(PHASES, 1):
+            trial_type = condition if phase == "training" else "PP"
+            for trial in range(1, n_trials + 1):
+                target_angle = rng.randrange(0, 360)
+                target_dist = rng.randrange(int(5.0 * PPD), int(7.0 * PPD))
+                target_loc = _target_loc(target_angle, target_dist)
+                onset = rng.randrange(1000, 3000, 100)
+                err = na
+                movement_rt = contact_rt = response_rt = initial_angle = na
+                samples = []
+                if rng.random() < 0.02:
+                    err = "too_soon" if trial_type == "PP" else "stick_mi"
+                elif trial_type == "PP":
+                    aim_err = rotation + adapt + rng.gauss(0, 6)
+                    samples, mrt, crt, rrt, ia = _pp_trial(
+                        rng, target_angle, target_dist, aim_err, frame_ms
+                    )
+                    if rng.random() < 0.01:
+                        rrt = None # Timed out
+                    movement_rt = mrt if mrt is not None else na
+                    contact_rt = crt if crt is not None else na
+                    response_rt = rrt if rrt is not None else na
+                    initial_angle = ia if ia is not None else na
+                else:
+                    samples, mrt, response_rt = _imagery_trial(rng, frame_ms)
+                    movement_rt = mrt if mrt is not None else na
+                # Adaptation builds up over rotated trials and decays in washout
+                if rotation and (trial_type != "CC"):
+                    gain = 0.6 if trial_type == "MI" else 1.0
+                    adapt += rate * gain * (-rotation - adapt)
+                elif not rotation:
+                    adapt *= 0.9
+                row = (
+                    pid, block, trial, phase, trial_type, float(rotation), onset,
+                    target_dist / PPD, target_angle, movement_rt, contact_rt,
+                    response_rt, initial_angle, err, target_loc[0], target_loc[1]
+                )
+                trials.append(row if legacy else row + (0,))
+                if err != na:
+                    continue
+                for t, x, y, dx, dy in samples:
+                    if legacy:
+                        gamepad.append((pid, block, trial, int(t), float(x), float(y)))
+                    else:
+                        gamepad.append((pid, block, trial, t, float(x), float(y), dx, dy))
+        conn.executemany(trial_q, trials)
+        conn.executemany(gamepad_q, gamepad)
+        conn.commit()
+    conn.close()
+    return path
+
+
+def get_dataset(participants=100, seed=1, refresh_rate=120.0, legacy=False):
+    # Gets the path to a synthetic dataset, creating it if it doesn't exist yet.
+    # Datasets are cached in the results folder, so they only need to be
+    # generated once for a given set of options.
+    name = "dataset_{0}p_{1}hz_s{2}{3}.db".format(
+        participants, int(refresh_rate), seed, "_legacy" if legacy else ""
+    )
+    path = os.path.join(_common.RESULTS_DIR, name)
+    if not os.path.exists(path):
+        if not os.path.isdir(_common.RESULTS_DIR):
+            os.makedirs(_common.RESULTS_DIR)
+        print("Generating synthetic dataset ({0} participants)...".format(participants))
+        make_dataset(path + ".tmp", participants, seed, refresh_rate, legacy)
+        os.replace(path + ".tmp", path)
+    return path
@@ -0,0 +1,166 @@
+"""Reports the storage savings and metric errors of trajectory simplification.
+
+Generates synthetic cursor trajectories resembling those logged by the task
+(minimum-jerk reaches with curvature, corrective submovements and sensor
+noise, sampled at 120 Hz and logged only when the cursor position changes),
+then simplifies them with trajectory.simplify() at a range of tolerances. For
+each tolerance, reports the fraction of samples kept, the maximum position
+error when reconstructing the dropped samples, and the errors introduced in
+the initial movement angle and total path length computed from the stored
+samples. Lossless delta + zlib compression of the full trajectories is shown
+for comparison. Does not require klibs. Usage:
+
+    python benchmarks/bench_compression.py [--trials N] [--seed N]
+
+"""
+
+import zlib
+import random
+import struct
+import argparse
+from math import atan2, cos, sin, degrees, radians, hypot
+
+import _common
+
+from trajectory import simplify, interpolate
+
+
+ORIGIN = (960, 540)
+PPD = 45.0 # Approximate pixels per degree for a 1080p screen
+FRAME_MS = 1000 / 120.0
+TOLERANCES = [0.5, 1.0, 2.0, 4.0]
+
+
+def min_jerk(p):
+    return 10 * p ** 3 - 15 * p ** 4 + 6 * p ** 5
+
+
+def make_trajectory(rng):
+    # Generates a synthetic logged trajectory of (time, x, y, x, y) samples
+    angle = radians(rng.uniform(0, 360))
+    dist = rng.uniform(5.0, 7.0) * PPD
+    end = (dist * sin(angle), -dist * cos(angle))
+    err = radians(rng.gauss(0, 8)) # Initial direction error
+    first = (dist * sin(angle + err), -dist * cos(angle + err))
+    curve = rng.uniform(-0.15, 0.15)
+    reach_ms = rng.uniform(300, 700)
+    fix_ms = rng.uniform(150, 350)
+    samples = []
+    last = None
+    t = rng.uniform(0, FRAME_MS)
+    while t < reach_ms + fix_ms + 200:
+        if t < reach_ms:
+            p = min_jerk(t / reach_ms)
+            bend = curve * 4 * p * (1 - p)
+            x = first[0] * p - first[1] * bend
+            y = first[1] * p + first[0] * bend
+        else:
+            # Corrective submovement from the initial endpoint to the target
+            p = min_jerk(min(1.0, (t - reach_ms) / fix_ms))
+            x = first[0] + (end[0] - first[0]) * p
+            y = first[1] + (end[1] - first[1]) * p
+        pos = (
+            ORIGIN[0] + int(x + rng.gauss(0, 0.6)),
+            ORIGIN[1] + int(y + rng.gauss(0, 0.6)),
+        )
+        if pos != last and pos != ORIGIN:
+            samples.append((int(t), pos[0], pos[1], pos[0], pos[1]))
+            last = pos
+        t += FRAME_MS
+    return samples
+
+
+def initial_angle(samples):
+    # Gets the initial movement angle the same way as the task: at the first
+    # sample at least 1 degree from the origin, 50 ms after movement onset
+    onset = samples[0][0]
+    for s in samples:
+        dx, dy = (s[1] - ORIGIN[0], s[2] - ORIGIN[1])
+        if hypot(dx, dy) / PPD > 1.0 and s[0] - onset > 50:
+            return degrees(atan2(dx, -dy)) % 360
+    return None
+
+
+def path_length(samples):
+    total = 0.0
+    for a, b in zip(samples[:-1], samples[1:]):
+        total += hypot(b[1] - a[1], b[2] - a[2])
+    return total
+
+
+def angle_diff(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+def delta_zlib_size(samples):
+    # Gets the size of a trajectory with lossless delta + zlib compression
+    prev = (0, 0, 0)
+    packed = []
+    for s in samples:
+        packed.append(struct.pack("<hhh", s[0] - prev[0], s[1] - prev[1], s[2] - prev[2]))
+        prev = s[:3]
+    return len(zlib.compress(b"".join(packed), 9))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    trials = [make_trajectory(rng) for _ in range(args.trials)]
+    n_samples = sum(len(s) for s in trials)
+    sample_bytes = 12 # int32 time + 4 int16 positions
+
+    rows = []
+    lossless = sum(delta_zlib_size(s) for s in trials)
+    rows.append({
+        'method': "delta+zlib", 'kept': 1.0,
+        'size': lossless / float(n_samples * sample_bytes),
+        'max_err_px': 0.0, 'angle_err_mean': 0.0, 'angle_err_max': 0.0,
+        'path_err_mean': 0.0, 'path_err_max': 0.0,
+    })
+    for tol in TOLERANCES:
+        kept = 0
+        max_err = 0.0
+        angle_errs = []
+        path_errs = []
+        for samples in trials:
+            simple = simplify(samples, tol)
+            kept += len(simple)
+            recon = interpolate(simple, [s[0] for s in samples])
+            for s, r in zip(samples, recon):
+                max_err = max(max_err, hypot(s[1] - r[1], s[2] - r[2]))
+            a1, a2 = (initial_angle(samples), initial_angle(simple))
+            if a1 is not None and a2 is not None:
+                angle_errs.append(angle_diff(a1, a2))
+            full_len = path_length(samples)
+            path_errs.append(abs(full_len - path_length(simple)) / full_len * 100)
+        rows.append({
+            'method': "rdp {0}px".format(tol),
+            'kept': kept / float(n_samples),
+            'size': kept / float(n_samples),
+            'max_err_px': max_err,
+            'angle_err_mean': sum(angle_errs) / len(angle_errs),
+            'angle_err_max': max(angle_errs),
+            'path_err_mean': sum(path_errs) / len(path_errs),
+            'path_err_max': max(path_errs),
+        })
+
+    print("\nTrajectory compression for {0} trials ({1} samples):\n".format(
+        args.trials, n_samples
+    ))
+    cols = [
+        'method', 'kept', 'size', 'max_err_px', 'angle_err_mean', 'angle_err_max',
+        'path_err_mean', 'path_err_max',
+    ]
+    _common.print_table(rows, cols)
+    print("\n('size' is relative to uncompressed; angle errors in degrees, path "
+          "length errors in %)")
+    path = _common.save_results("compression", rows)
+    print("Results saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
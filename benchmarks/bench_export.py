@@ -0,0 +1,123 @@
+"""Measures the throughput and peak memory use of the Parquet data export.
+
+Generates synthetic task databases of increasing size (see _dataset.py), then
+exports each one with tools/export_parquet.py, both streaming rows in chunks
+(the default) and reading each participant's rows all at once. Every export
+runs in a fresh subprocess so that the peak memory use of the main process
+and of the largest worker process can be measured separately. A dataset with
+a higher gamepad sampling rate is included to show how memory scales with the
+amount of data per participant. Requires pyarrow, and the `resource` module
+for memory measurements (i.e. not Windows). Usage:
+
+    python benchmarks/bench_export.py [--participants N] [--jobs N]
+                                      [--chunk-rows N]
+
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from time import perf_counter
+
+import _common
+import _dataset
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _peak_rss_mb(who):
+    # Gets the peak resident memory of this process or its children, in MB
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(who).ru_maxrss
+    scale = 1e6 if sys.platform == "darwin" else 1e3 # bytes on macOS, KB on Linux
+    return peak / scale
+
+
+def run_export(db_path, chunk_rows, jobs):
+    # Runs a full export in a fresh subprocess, returning its results
+    out_dir = tempfile.mkdtemp(prefix="bench_export_")
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--run-one", db_path, out_dir,
+        "--chunk-rows", str(chunk_rows),
+    ]
+    if jobs:
+        cmd += ["--jobs", str(jobs)]
+    try:
+        output = subprocess.check_output(cmd)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return json.loads(output.decode("utf-8").strip().split("\n")[-1])
+
+
+def run_one(db_path, out_dir, chunk_rows, jobs):
+    # Exports a database and prints the elapsed time, data size and peak memory
+    import export_parquet
+    start = perf_counter()
+    exported, n_rows, n_bytes = export_parquet.export_all(
+        db_path, out_dir, jobs=jobs, chunk_rows=chunk_rows
+    )
+    elapsed = perf_counter() - start
+    print(json.dumps({
+        'participants': exported,
+        'rows': n_rows,
+        'mb': n_bytes / 1e6,
+        'seconds': elapsed,
+        'main_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF if resource else None),
+        'worker_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN if resource else None),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--participants", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=10000)
+    parser.add_argument("--run-one", nargs=2, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one[0], args.run_one[1], args.chunk_rows, args.jobs)
+        return
+
+    n = args.participants
+    datasets = [
+        ("{0}p @ 120Hz".format(n // 4), _dataset.get_dataset(n // 4)),
+        ("{0}p @ 120Hz".format(n // 2), _dataset.get_dataset(n // 2)),
+        ("{0}p @ 120Hz".format(n), _dataset.get_dataset(n)),
+        ("{0}p @ 480Hz".format(n // 4), _dataset.get_dataset(n // 4, refresh_rate=480.0)),
+    ]
+    rows = []
+    for label, path in datasets:
+        for chunk_rows in [args.chunk_rows, 0]:
+            res = run_export(path, chunk_rows, args.jobs)
+            rows.append({
+                'dataset': label,
+                'chunks': chunk_rows if chunk_rows else "none",
+                'rows': res['rows'],
+                'seconds': res['seconds'],
+                'rows/s': int(res['rows'] / res['seconds']),
+                'main_mb': res['main_rss_mb'],
+                'worker_mb': res['worker_rss_mb'],
+            })
+
+    print("\nParquet export ({0} worker processes):\n".format(
+        args.jobs if args.jobs else os.cpu_count()
+    ))
+    cols = ['dataset', 'chunks', 'rows', 'seconds', 'rows/s', 'main_mb', 'worker_mb']
+    _common.print_table(rows, cols)
+    print("\n('main_mb' and 'worker_mb' are the peak resident memory of the main "
+          "process and of the largest worker process)")
+    path = _common.save_results("export", rows)
+    print("Results saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Measures input-to-display latency using a simulated game controller.
+
+Creates an SDL virtual joystick, opens it through gamepad.GameController, and
+applies step changes to its right stick x-axis from a background thread at
+random intervals. A render loop paced to a simulated refresh rate reads the
+stick, draws the cursor into an offscreen software render target, "flips" it,
+and reads the cursor pixel back from the rendered frame. For each step, the
+time until the new value was read, until flip() returned for the first frame
+containing it, and until the moved cursor was visible in the rendered frame
+are recorded. Runs headless under the SDL dummy video driver. Usage:
+
+    python benchmarks/bench_input_latency.py [--steps N] [--refresh HZ]
+
+"""
+
+import os
+import random
+import argparse
+import threading
+from ctypes import byref, cast, POINTER, c_uint32
+from time import perf_counter, sleep
+
+import _common
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import sdl2
+from sdl2 import joystick as jy
+from sdl2 import gamecontroller as gc
+
+from gamepad import gamepad_init, get_controllers
+
+
+WIDTH, HEIGHT = (800, 200)
+CURSOR_SIZE = 10
+STEP_VALUES = [-20000, 20000]
+CURSOR_COLOR = (255, 0, 0, 255)
+STICK_AXIS = 2 # Virtual joystick axis mapped to the right stick's x-axis
+TIMEOUT = 5.0 # Give up waiting on a step after this many seconds
+
+
+def stick_to_x(value):
+    # Converts a raw stick x value into a cursor x position
+    return int(WIDTH / 2 + (value / 32768.0) * (WIDTH / 2 - CURSOR_SIZE))
+
+
+class StepDriver(threading.Thread):
+    # Applies step changes to the virtual stick at random intervals
+    def __init__(self, stick, count, min_gap, max_gap, seed):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.stick = stick
+        self.count = count
+        self.gaps = (min_gap, max_gap)
+        self.rng = random.Random(seed)
+        self.steps = []
+
+    def run(self):
+        for i in range(self.count):
+            sleep(self.rng.uniform(*self.gaps))
+            value = STEP_VALUES[i % 2]
+            jy.SDL_JoystickSetVirtualAxis(self.stick, STICK_AXIS, value)
+            self.steps.append((value, perf_counter()))
+
+
+class OffscreenTarget(object):
+    # A software render target standing in for the window's back buffer
+    def __init__(self):
+        self.surface = sdl2.SDL_CreateRGBSurfaceWithFormat(
+            0, WIDTH, HEIGHT, 32, sdl2.SDL_PIXELFORMAT_RGBA8888
+        )
+        self.renderer = sdl2.SDL_CreateSoftwareRenderer(self.surface)
+        self.cursor = sdl2.SDL_Rect(0, 0, CURSOR_SIZE, CURSOR_SIZE)
+        fmt = self.surface.contents.format
+        self.cursor_px = sdl2.SDL_MapRGBA(fmt, *CURSOR_COLOR)
+
+    def draw(self, x):
+        sdl2.SDL_SetRenderDrawColor(self.renderer, 128, 128, 128, 255)
+        sdl2.SDL_RenderClear(self.renderer)
+        self.cursor.x = x - CURSOR_SIZE // 2
+        self.cursor.y = HEIGHT // 2 - CURSOR_SIZE // 2
+        sdl2.SDL_SetRenderDrawColor(self.renderer, *CURSOR_COLOR)
+        sdl2.SDL_RenderFillRect(self.renderer, self.cursor)
+
+    def present(self):
+        sdl2.SDL_RenderPresent(self.renderer)
+
+    def cursor_at(self, x):
+        # Reads back the rendered pixel at the expected cursor location
+        surf = self.surface.contents
+        pixels = cast(surf.pixels, POINTER(c_uint32))
+        return pixels[(HEIGHT // 2) * (surf.pitch // 4) + x] == self.cursor_px
+
+    def close(self):
+        sdl2.SDL_DestroyRenderer(self.renderer)
+        sdl2.SDL_FreeSurface(self.surface)
+
+
+def run_config(pad, stick, input_mode, redraw, args):
+    target = OffscreenTarget()
+    frame_time = 1.0 / args.refresh
+    driver = StepDriver(stick, args.steps, 0.1, 0.3, args.seed)
+
+    # Reset stick and flush any stale events before starting
+    jy.SDL_JoystickSetVirtualAxis(stick, STICK_AXIS, 0)
+    sdl2.SDL_PumpEvents()
+    sdl2.SDL_FlushEvents(sdl2.SDL_FIRSTEVENT, sdl2.SDL_LASTEVENT)
+
+    event = sdl2.SDL_Event()
+    stick_x = 0
+    drawn_x = None
+    pending = None # [step_time, flip_time, expected_x] for the current step
+    lat = {'read': [], 'flip': [], 'visible': []}
+    next_frame = perf_counter() + frame_time
+
+    driver.start()
+    last_change = perf_counter()
+    while driver.is_alive() or pending or len(lat['read']) < len(driver.steps):
+        if perf_counter() - last_change > TIMEOUT:
+            print("Warning: timed out waiting for step to be displayed.")
+            break
+        # Get the latest stick value, either by polling or from the event queue
+        sdl2.SDL_PumpEvents()
+        if input_mode == "poll":
+            stick_x = pad.right_stick()[0]
+            while sdl2.SDL_PollEvent(byref(event)):
+                pass
+        else:
+            while sdl2.SDL_PollEvent(byref(event)):
+                if event.type == sdl2.SDL_CONTROLLERAXISMOTION:
+                    if event.caxis.axis == gc.SDL_CONTROLLER_AXIS_RIGHTX:
+                        stick_x = event.caxis.value
+        read_time = perf_counter()
+
+        # Check whether a new step has been read this frame
+        n_read = len(lat['read']) + (1 if pending else 0)
+        if n_read < len(driver.steps):
+            value, step_time = driver.steps[n_read]
+            if stick_x == value and not pending:
+                lat['read'].append(read_time - step_time)
+                last_change = read_time
+                pending = [step_time, None, stick_to_x(value)]
+
+        # Draw the frame and wait until the next simulated refresh to 'flip'
+        x = stick_to_x(stick_x)
+        if redraw == "full" or x != drawn_x:
+            target.draw(x)
+            drawn_x = x
+            while perf_counter() < next_frame:
+                pass
+            target.present()
+        else:
+            while perf_counter() < next_frame:
+                pass
+        flip_time = perf_counter()
+        next_frame += frame_time
+        if next_frame < flip_time:
+            next_frame = flip_time + frame_time
+
+        # Read back the rendered frame to see if the moved cursor is visible
+        if pending:
+            if pending[1] is None and drawn_x == pending[2]:
+                pending[1] = flip_time
+            if pending[1] is not None and target.cursor_at(pending[2]):
+                lat['flip'].append(pending[1] - pending[0])
+                lat['visible'].append(perf_counter() - pending[0])
+                last_change = perf_counter()
+                pending = None
+
+    target.close()
+    return lat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--refresh", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO) != 0:
+        raise RuntimeError(sdl2.SDL_GetError().decode("utf-8"))
+    gamepad_init()
+    index = jy.SDL_JoystickAttachVirtual(jy.SDL_JOYSTICK_TYPE_GAMECONTROLLER, 6, 15, 0)
+    if index < 0:
+        raise RuntimeError("Unable to create a virtual joystick for the benchmark.")
+    pad = [c for c in get_controllers() if c._index == index][0]
+    pad.initialize()
+    stick = jy.SDL_JoystickFromInstanceID(jy.SDL_JoystickGetDeviceInstanceID(index))
+
+    results = []
+    for input_mode in ["poll", "event"]:
+        for redraw in ["full", "changed"]:
+            lat = run_config(pad, stick, input_mode, redraw, args)
+            for stage in ["read", "flip", "visible"]:
+                res = _common.summarize(lat[stage])
+                res['input'] = input_mode
+                res['redraw'] = redraw
+                res['stage'] = stage
+                results.append(res)
+
+    pad.close()
+    jy.SDL_JoystickDetachVirtual(index)
+    sdl2.SDL_Quit()
+
+    print("\nStep-to-stage latency (ms), {0} steps at {1} Hz:\n".format(
+        args.steps, args.refresh
+    ))
+    cols = ['input', 'redraw', 'stage', 'n', 'mean', 'p50', 'p99', 'max']
+    _common.print_table(results, cols)
+    path = _common.save_results("input_latency", results)
+    print("\nResults saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Compares vectorized and per-trial computation of trial kinematics.
+
+Generates a synthetic task database (see _dataset.py) and computes each
+trial's kinematic measures (peak velocity, time to peak velocity, path
+length, max deviation, endpoint error and movement time) with
+tools/kinematics.py, timing the database reads and the vectorized NumPy pass
+separately. The same measures are then computed with a plain Python loop over
+each trial's samples (the way they'd typically be computed in an analysis
+script) to check that both give the same results and compare their speed.
+Requires numpy. Usage:
+
+    python benchmarks/bench_kinematics.py [--participants N]
+
+"""
+
+import argparse
+from math import hypot
+from time import perf_counter
+
+import numpy as np
+
+import _common
+import _dataset
+
+import dbutils
+import kinematics
+
+
+def loop_kinematics(trials, samples, ids, origins, ppd):
+    # Computes the kinematics for each trial separately with plain Python loops
+    by_trial = {}
+    points = zip(samples['time'].tolist(), samples['x'].tolist(), samples['y'].tolist())
+    for i, p in zip(ids.tolist(), points):
+        by_trial.setdefault(i, []).append(p)
+    out = {m: [] for m in kinematics.MEASURES}
+    for i in range(len(trials)):
+        pts = by_trial.get(i, [])
+        ox, oy = origins[i]
+        tx, ty = (trials['target_x'][i], trials['target_y'][i])
+        k = ppd[i]
+        if not len(pts):
+            for m in kinematics.MEASURES:
+                out[m].append(float("nan"))
+            continue
+        path = hypot(pts[0][1] - ox, pts[0][2] - oy)
+        peak, peak_t = (float("nan"), None)
+        for a, b in zip(pts[:-1], pts[1:]):
+            step = hypot(b[1] - a[1], b[2] - a[2])
+            path += step
+            if b[0] > a[0]:
+                speed = step / (b[0] - a[0]) * 1000
+                if peak_t is None or speed > peak:
+                    peak, peak_t = (speed, (a[0] + b[0]) / 2)
+        line_len = hypot(tx - ox, ty - oy)
+        dev = max(
+            abs((tx - ox) * (p[2] - oy) - (ty - oy) * (p[1] - ox)) / line_len for p in pts
+        )
+        out['peak_velocity'].append(peak / k)
+        out['time_to_peak'].append(
+            peak_t - pts[0][0] if peak_t is not None else float("nan")
+        )
+        out['path_length'].append(path / k)
+        out['max_deviation'].append(dev / k)
+        out['endpoint_error'].append(hypot(pts[-1][1] - tx, pts[-1][2] - ty) / k)
+        out['movement_time'].append(pts[-1][0] - pts[0][0])
+    return {m: np.array(v) for m, v in out.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--participants", type=int, default=100)
+    args = parser.parse_args()
+
+    conn = dbutils.connect(_dataset.get_dataset(args.participants))
+    pids = dbutils.participant_ids(conn)
+
+    start = perf_counter()
+    trials, samples, ids = kinematics.load_trajectories(conn, pids, kinematics.TRIAL_COLS)
+    load_time = perf_counter() - start
+    conn.close()
+
+    start = perf_counter()
+    origins, ppd = kinematics.trial_geometry(trials)
+    geometry_time = perf_counter() - start
+
+    start = perf_counter()
+    targets = np.column_stack([trials['target_x'], trials['target_y']])
+    fast = kinematics.compute_kinematics(
+        ids, samples['time'], samples['x'], samples['y'], origins, targets, ppd
+    )
+    vector_time = perf_counter() - start
+
+    start = perf_counter()
+    slow = loop_kinematics(trials, samples, ids, origins, ppd)
+    loop_time = perf_counter() - start
+
+    max_diff = {}
+    for m in kinematics.MEASURES:
+        same_nan = np.array_equal(np.isnan(fast[m]), np.isnan(slow[m]))
+        diff = np.nanmax(np.abs(fast[m] - slow[m])) if same_nan else float("inf")
+        max_diff[m] = float(diff)
+
+    n = len(trials)
+    rows = [
+        {'step': 'load (SQLite)', 'seconds': load_time, 'trials/s': int(n / load_time)},
+        {'step': 'screen geometry', 'seconds': geometry_time,
+         'trials/s': int(n / geometry_time)},
+        {'step': 'vectorized', 'seconds': vector_time, 'trials/s': int(n / vector_time)},
+        {'step': 'per-trial loop', 'seconds': loop_time, 'trials/s': int(n / loop_time)},
+    ]
+    print("\nTrial kinematics for {0} trials ({1} samples):\n".format(n, len(samples)))
+    _common.print_table(rows, ['step', 'seconds', 'trials/s'])
+    speedup = loop_time / vector_time
+    print("\nVectorized speedup over per-trial loop: {0:.1f}x".format(speedup))
+    print("Max difference between methods:")
+    for m, diff in max_diff.items():
+        print("  {0}: {1:.3g}".format(m, diff))
+    results = {'steps': rows, 'trials': n, 'samples': len(samples), 'max_diff': max_diff}
+    path = _common.save_results("kinematics", results)
+    print("Results saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
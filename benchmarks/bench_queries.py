@@ -0,0 +1,154 @@
+"""Compares common analysis query times before and after the schema migration.
+
+Generates a synthetic database using the old schema (with "NA"-able text
+columns and no indexes, see _dataset.py), migrates a copy of it to the
+current schema with tools/migrate_db.py, and then times a set of typical
+analysis queries on both: fetching single-trial trajectories, fetching all
+samples for a participant, summarizing initial angles and errors by phase,
+and filtering on reaction times. Each query is written for both schemas (e.g.
+`movement_rt != 'NA'` vs `movement_rt IS NOT NULL`) and their results are
+checked for equality. Does not require klibs. Usage:
+
+    python benchmarks/bench_queries.py [--participants N] [--repeats N]
+
+"""
+
+import os
+import shutil
+import random
+import argparse
+from time import perf_counter
+
+import _common
+import _dataset
+
+import dbutils
+import migrate_db
+
+
+QUERIES = [
+    # name, legacy query, typed query, parameter sets
+    ('trial_trajectory',
+     'SELECT "time", stick_x, stick_y FROM gamepad '
+     'WHERE participant_id = ? AND block_num = ? AND trial_num = ? ORDER BY "time"',
+     None, 'trials'),
+    ('participant_samples',
+     'SELECT block_num, trial_num, "time", stick_x, stick_y FROM gamepad '
+     'WHERE participant_id = ? ORDER BY block_num, trial_num, "time"',
+     None, 'participants'),
+    ('participant_trials',
+     "SELECT block_num, trial_num, phase, target_angle, target_x, target_y FROM trials "
+     "WHERE participant_id = ? ORDER BY block_num, trial_num",
+     None, 'participants'),
+    ('samples_per_trial',
+     "SELECT participant_id, block_num, trial_num, COUNT(*) FROM gamepad "
+     "GROUP BY participant_id, block_num, trial_num",
+     None, None),
+    ('angle_by_phase',
+     "SELECT participant_id, phase, AVG(CAST(initial_angle AS REAL) - target_angle) "
+     "FROM trials WHERE initial_angle != 'NA' GROUP BY participant_id, phase",
+     "SELECT participant_id, phase, AVG(initial_angle - target_angle) "
+     "FROM trials WHERE initial_angle IS NOT NULL GROUP BY participant_id, phase",
+     None),
+    ('errors_by_phase',
+     "SELECT phase, err, COUNT(*) FROM trials WHERE err != 'NA' GROUP BY phase, err",
+     "SELECT phase, err, COUNT(*) FROM trials WHERE err IS NOT NULL GROUP BY phase, err",
+     None),
+    ('fast_movement_rts',
+     "SELECT participant_id, COUNT(*) FROM trials WHERE movement_rt != 'NA' "
+     "AND CAST(movement_rt AS REAL) < 150 GROUP BY participant_id",
+     "SELECT participant_id, COUNT(*) FROM trials WHERE movement_rt < 150 "
+     "GROUP BY participant_id",
+     None),
+]
+
+
+def _rounded(rows):
+    # Rounds float values so query results from both schemas can be compared
+    # (numbers stored as text in the old schema only have 15 significant digits)
+    out = []
+    for row in rows:
+        out.append(tuple(
+            float("{0:.9g}".format(v)) if isinstance(v, float) else v for v in row
+        ))
+    return out
+
+
+def time_query(conn, query, param_sets, repeats):
+    # Times a query over a list of parameter sets, returning the median time
+    # per query execution and the results of the last run
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        results = [conn.execute(query, p).fetchall() for p in param_sets]
+        times.append((perf_counter() - start) / len(param_sets))
+    return _common.percentile(times, 50), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--participants", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    legacy_path = _dataset.get_dataset(args.participants, legacy=True)
+    typed_path = legacy_path.replace(".db", "_migrated.db")
+    shutil.copy(legacy_path, typed_path)
+
+    conn = dbutils.connect(typed_path, readonly=False)
+    start = perf_counter()
+    migrate_db.migrate(conn, migrate_db.plan_migration(conn, dbutils.SCHEMA_PATH))
+    migrate_time = perf_counter() - start
+    conn.close()
+
+    legacy = dbutils.connect(legacy_path)
+    typed = dbutils.connect(typed_path)
+    rng = random.Random(args.seed)
+    trials = legacy.execute("SELECT participant_id, block_num, trial_num FROM trials")
+    params = {
+        'trials': rng.sample(trials.fetchall(), 200),
+        'participants': [(p,) for p in rng.sample(dbutils.participant_ids(legacy), 10)],
+        None: [()],
+    }
+
+    rows = []
+    mismatches = 0
+    for name, legacy_q, typed_q, param_key in QUERIES:
+        param_sets = params[param_key]
+        t_old, res_old = time_query(legacy, legacy_q, param_sets, args.repeats)
+        t_new, res_new = time_query(typed, typed_q or legacy_q, param_sets, args.repeats)
+        same = all(_rounded(a) == _rounded(b) for a, b in zip(res_old, res_new))
+        mismatches += 0 if same else 1
+        rows.append({
+            'query': name,
+            'runs': len(param_sets),
+            'before_ms': t_old * 1000,
+            'after_ms': t_new * 1000,
+            'speedup': t_old / t_new,
+            'same': same,
+        })
+    legacy.close()
+    typed.close()
+
+    sizes = (os.path.getsize(legacy_path) / 1e6, os.path.getsize(typed_path) / 1e6)
+    os.remove(typed_path)
+
+    print("\nQuery times before and after migration ({0} participants):\n".format(
+        args.participants
+    ))
+    cols = ['query', 'runs', 'before_ms', 'after_ms', 'speedup', 'same']
+    _common.print_table(rows, cols)
+    print("\n(times are the median per query execution over {0} repeats)".format(
+        args.repeats
+    ))
+    print("Migration time: {0:.2f} s".format(migrate_time))
+    print("Database size: {0:.1f} MB before, {1:.1f} MB after".format(*sizes))
+    print("Queries with mismatched results: {0}".format(mismatches))
+    results = {'queries': rows, 'migrate_seconds': migrate_time, 'size_mb': sizes}
+    path = _common.save_results("queries", results)
+    print("Results saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmarks the effect of realtime trial mode on trial loop tail latency.
+
+Simulates the per-frame allocation pattern of the trial loop (event lists,
+sample tuples, small dicts with reference cycles) on top of a large heap of
+long-lived objects, then compares per-iteration timings with and without
+RealtimeMode. Usage:
+
+    python benchmarks/bench_realtime.py [--trials N] [--frames N]
+
+"""
+
+import argparse
+from time import perf_counter
+
+import _common
+from realtime import RealtimeMode
+
+
+class _Node(object):
+    # Small object that participates in reference cycles, like SDL event
+    # wrappers and klibs stimulus objects do
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.children = []
+        if parent:
+            parent.children.append(self)
+
+
+def _make_heap(size):
+    # Creates a large set of long-lived container objects (approximating
+    # loaded stimuli, trial lists, and klibs runtime state)
+    heap = []
+    for i in range(size):
+        root = _Node()
+        _Node(root)
+        heap.append({'id': i, 'node': root, 'vals': [i, i + 1]})
+    return heap
+
+
+def _frame(samples):
+    # Approximates the garbage created by one iteration of the trial loop
+    events = [_Node() for _ in range(4)]
+    for e in events:
+        _Node(e)
+    samples.append((len(samples), 512, 384))
+    return sum(i * i for i in range(200))
+
+
+def run_trials(trials, frames, realtime=None):
+    times = []
+    pauses = 0
+    for _ in range(trials):
+        samples = []
+        if realtime:
+            realtime.enter_trial()
+        for _ in range(frames):
+            start = perf_counter()
+            _frame(samples)
+            times.append(perf_counter() - start)
+        if realtime:
+            pauses += len(realtime.exit_trial())
+    return times, pauses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--frames", type=int, default=1500)
+    parser.add_argument("--heap", type=int, default=200000)
+    args = parser.parse_args()
+
+    heap = _make_heap(args.heap)
+    results = []
+
+    times, _ = run_trials(args.trials, args.frames)
+    res = _common.summarize(times)
+    res['mode'] = "default"
+    res['gc_pauses'] = "-"
+    results.append(res)
+
+    rt = RealtimeMode(priority=True)
+    status = rt.start()
+    times, pauses = run_trials(args.trials, args.frames, rt)
+    rt.stop()
+    res = _common.summarize(times)
+    res['mode'] = "realtime"
+    res['gc_pauses'] = pauses
+    results.append(res)
+
+    print("\nPer-iteration loop time (ms), {0} trials x {1} frames:\n".format(
+        args.trials, args.frames
+    ))
+    cols = ['mode', 'n', 'mean', 'p50', 'p99', 'p99.9', 'max', 'gc_pauses']
+    _common.print_table(results, cols)
+    print("\nPriority raised: {0}, CPU pinned: {1}".format(
+        status['priority'], status['affinity']
+    ))
+    path = _common.save_results("realtime", results)
+    print("Results saved to {0}".format(path))
+    del heap
+
+
+if __name__ == "__main__":
+    main()
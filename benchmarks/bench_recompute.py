@@ -0,0 +1,158 @@
+"""Measures the speed of recomputing trial measures under different criteria.
+
+Generates a synthetic task database (see _dataset.py), checks that
+tools/recompute_measures.py reproduces the recorded movement RTs, initial
+angles, and contact RTs with the task's own criteria (including the trials
+where the cursor is flicked out and held still past the angle delay, so that
+the angle is taken on a frame without a logged sample), and compares the time
+taken by its vectorized pass with a plain Python loop over each trial's
+samples (the same checks the task runs each frame). A grid of alternative
+criteria is then evaluated with different numbers of worker processes.
+Requires numpy. Usage:
+
+    python benchmarks/bench_recompute.py [--participants N] [--jobs N]
+
+"""
+
+import os
+import argparse
+from math import sqrt, atan2, degrees, floor
+from time import perf_counter
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import _common
+import _dataset
+
+import dbutils
+import kinematics
+import recompute_measures as rm
+
+
+# The grid of criteria used for measuring parallel throughput
+GRID = {
+    'onset_dist': [0.0, 0.25],
+    'angle_dist': [0.5, 1.0, 2.0],
+    'angle_delay': [0.0, 50.0, 100.0],
+    'contact_size': [0.5, 1.0],
+}
+
+
+def loop_recompute(trials, samples, ids, origins, ppd, frame_ms, criteria):
+    # Recomputes the measures for each trial separately, checking each sample
+    # in order the same way as the task does each frame (along with the frame
+    # after the angle delay if the cursor was held still until then)
+    onset_dist, angle_dist, angle_delay, contact_size = criteria
+    by_trial = {}
+    points = zip(samples['time'].tolist(), samples['x'].tolist(), samples['y'].tolist())
+    for i, p in zip(ids.tolist(), points):
+        by_trial.setdefault(i, []).append(p)
+    out = {m: [] for m in rm.MEASURES}
+    for i in range(len(trials)):
+        cx, cy = origins[i]
+        tx, ty = (trials['target_x'][i], trials['target_y'][i])
+        k = ppd[i]
+        radius = floor(contact_size * k) / 2
+        frame = frame_ms[i]
+        movement_rt, initial_angle, contact_rt = (None, None, None)
+        trial_samples = by_trial.get(i, [])
+        for j, (t, x, y) in enumerate(trial_samples):
+            dist = sqrt((x - cx) ** 2 + (y - cy) ** 2) / k
+            if movement_rt is None and dist > onset_dist:
+                movement_rt = t
+            if initial_angle is None and dist > angle_dist and movement_rt is not None:
+                waited = t - movement_rt > angle_delay
+                if not waited and frame == frame:
+                    # Was there a frame after the delay before the cursor moved again?
+                    next_t = float("inf")
+                    if j + 1 < len(trial_samples):
+                        next_t = trial_samples[j + 1][0]
+                    frames = floor((movement_rt + angle_delay - t) / frame) + 1
+                    waited = t + frames * frame < next_t - frame / 2
+                if waited:
+                    initial_angle = degrees(atan2(x - cx, cy - y)) % 360
+            if contact_rt is None and sqrt((x - tx) ** 2 + (y - ty) ** 2) < radius:
+                contact_rt = t
+        for m, value in zip(rm.MEASURES, [movement_rt, initial_angle, contact_rt]):
+            out[m].append(float("nan") if value is None else value)
+    return {m: np.array(v) for m, v in out.items()}
+
+
+def time_grid(data, grid, jobs):
+    # Times the evaluation of a grid of criteria with a given number of workers
+    start = perf_counter()
+    pool = ProcessPoolExecutor(
+        max_workers=jobs, initializer=rm._init_worker, initargs=(data,)
+    )
+    with pool:
+        results = list(pool.map(rm._recompute_worker, grid))
+    return perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--participants", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    conn = dbutils.connect(_dataset.get_dataset(args.participants))
+    pids = dbutils.participant_ids(conn)
+    start = perf_counter()
+    trials, samples, ids = kinematics.load_trajectories(conn, pids, rm.TRIAL_COLS)
+    load_time = perf_counter() - start
+    conn.close()
+
+    origins, ppd = rm.task_geometry(trials)
+    targets = np.column_stack([trials['target_x'], trials['target_y']])
+    frame_ms = rm.frame_intervals(trials, ids, samples['time'])
+    data = (
+        ids, samples['time'], samples['x'], samples['y'], origins, targets, ppd,
+        frame_ms,
+    )
+    n_checked, mismatches = rm.check_runtime(trials, data)
+
+    defaults = [value for _, value in rm.CRITERIA]
+    start = perf_counter()
+    fast = rm.recompute(data, defaults)
+    vector_time = perf_counter() - start
+    start = perf_counter()
+    slow = loop_recompute(trials, samples, ids, origins, ppd, frame_ms, defaults)
+    loop_time = perf_counter() - start
+    differ = sum(
+        int(np.sum(~np.isclose(fast[m], slow[m], rtol=0, atol=1e-9, equal_nan=True)))
+        for m in rm.MEASURES
+    )
+
+    grid = list(product(*[GRID[name] for name, _ in rm.CRITERIA]))
+    rows = [
+        {'step': 'load (SQLite)', 'sets': 1, 'seconds': load_time},
+        {'step': 'vectorized', 'sets': 1, 'seconds': vector_time},
+        {'step': 'per-trial loop', 'sets': 1, 'seconds': loop_time},
+    ]
+    for jobs in sorted(set([1, args.jobs])):
+        elapsed, _ = time_grid(data, grid, jobs)
+        label = "grid ({0} worker{1})".format(jobs, "s" if jobs > 1 else "")
+        rows.append({'step': label, 'sets': len(grid), 'seconds': elapsed})
+    for row in rows:
+        row['trials/s'] = int(len(trials) * row['sets'] / row['seconds'])
+
+    print("\nRecomputed measures for {0} trials ({1} samples):\n".format(
+        len(trials), len(samples)
+    ))
+    _common.print_table(rows, ['step', 'sets', 'seconds', 'trials/s'])
+    print("\nVectorized speedup over per-trial loop: {0:.1f}x".format(
+        loop_time / vector_time
+    ))
+    print("Values differing between methods: {0}".format(differ))
+    print("Mismatches with recorded values ({0} trials): {1}".format(
+        n_checked, ", ".join("{0} {1}".format(v, m) for m, v in mismatches.items())
+    ))
+    results = {'steps': rows, 'trials': len(trials), 'mismatches': mismatches}
+    path = _common.save_results("recompute", results)
+    print("Results saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Microbenchmarks for the task's stimulus drawing path, run offscreen.
+
+Times the rendering of each task stimulus (the cursor and target ellipses,
+the fixation cross, and the demo arrows), the NumpySurface compositing used
+by KVIQ's render_text(), and the klibs fill()/blit() calls and buffer swaps
+used to compose trial frames, at each of the lab's screen configurations.
+Trial frames are timed both with per-stimulus blits and when drawn from a
+single stimulus atlas texture. PP frames with a moving cursor are also timed
+with full-screen redraws and with dirty-region repaints, checking that both
+produce the same frames.
+
+GL stages need an OpenGL context, which is created in a hidden window using
+SDL's 'offscreen' video driver (EGL, e.g. Mesa's llvmpipe on a GPU-less
+machine). If no context can be created (e.g. under the 'dummy' driver), the
+GL stages are skipped and only the CPU-side stages are timed. Requires
+klibs to be installed (e.g. run with `pipenv run`). Usage:
+
+    python benchmarks/bench_rendering.py [--reps N] [--compare results.json]
+
+"""
+
+import os
+import sys
+import json
+import argparse
+from math import hypot, tan, radians
+from time import perf_counter
+
+import _common
+
+os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+sys.path.insert(0, _common.ROOT)
+
+import numpy as np
+import sdl2
+from klibs import P
+from klibs.KLGraphics import fill, blit, NumpySurface
+from klibs.KLGraphics import KLDraw as kld
+
+import experiment as ex
+from atlas import StimulusAtlas
+from regions import DirtyRegions, stim_size, centered_rect, rects_overlap
+
+
+# Screen configurations used for the study: (label, resolution, diagonal)
+SCREENS = [
+    ("15.6in_1080p", (1920, 1080), 15.6),
+    ("21.5in_1080p", (1920, 1080), 21.5),
+    ("27in_1440p", (2560, 1440), 27.0),
+    ("15.6in_4k_hidpi", (3840, 2160), 15.6),
+]
+
+
+def set_screen(res, diag, view_distance=57):
+    # Updates the klibs runtime parameters for a given screen configuration
+    P.screen_x, P.screen_y = res
+    P.screen_c = (res[0] // 2, res[1] // 2)
+    px_per_cm = hypot(*res) / (diag * 2.54)
+    P.ppd = px_per_cm * 2 * view_distance * tan(radians(0.5))
+
+
+def time_it(func, reps, sync=None):
+    # Gets the mean time (in ms) per call for a given function
+    func()
+    if sync:
+        sync()
+    start = perf_counter()
+    for _ in range(reps):
+        func()
+    if sync:
+        sync()
+    return (perf_counter() - start) / reps * 1000
+
+
+class GLContext(object):
+    # A hidden window with an OpenGL context set up the same way as klibs's
+    def __init__(self, res):
+        from OpenGL import GL as gl
+        self.gl = gl
+        flags = sdl2.SDL_WINDOW_OPENGL | sdl2.SDL_WINDOW_HIDDEN
+        self.window = sdl2.SDL_CreateWindow(b"bench", 0, 0, res[0], res[1], flags)
+        if not self.window:
+            raise RuntimeError(sdl2.SDL_GetError().decode("utf-8"))
+        self.context = sdl2.SDL_GL_CreateContext(self.window)
+        if not self.context:
+            sdl2.SDL_DestroyWindow(self.window)
+            raise RuntimeError(sdl2.SDL_GetError().decode("utf-8"))
+        gl.glViewport(0, 0, res[0], res[1])
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glLoadIdentity()
+        gl.glOrtho(0, res[0], res[1], 0, 0, 1)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glDisable(gl.GL_DEPTH_TEST)
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+    def finish(self):
+        self.gl.glFinish()
+
+    def swap(self):
+        sdl2.SDL_GL_SwapWindow(self.window)
+
+    def close(self):
+        sdl2.SDL_GL_DeleteContext(self.context)
+        sdl2.SDL_DestroyWindow(self.window)
+
+
+def make_stimuli():
+    # Creates the task stimuli using the same sizes as MotorMapping.setup()
+    deg = ex.deg_to_px
+    stim = {
+        'cursor': kld.Ellipse(deg(P.cursor_size), fill=ex.TRANSLUCENT_RED),
+        'target': kld.Ellipse(deg(0.3), fill=ex.WHITE),
+        'fixation': kld.FixationCross(deg(0.5), deg(0.06), rotation=45, fill=ex.WHITE),
+    }
+    dist = (2 * deg(5.0) + deg(7.0)) / 3 / 2
+    hlw = deg(0.4)
+    stim['arrow'], _ = ex.demo_arrow(deg(3.5), deg(0.15), hlw, hlw, dist, angle=135)
+    stim['arrow_outline'], _ = ex.demo_arrow(
+        deg(3.5), deg(0.15), hlw, hlw, dist, outline=deg(0.05), angle=180
+    )
+    for s in stim.values():
+        s.render()
+    return stim
+
+
+def composite_text(chunks, spacing, width):
+    # Replicates the NumpySurface compositing step of KVIQ.render_text()
+    total_height = sum(c.height for c in chunks) + spacing * (len(chunks) - 1)
+    surf = NumpySurface(width=width, height=total_height)
+    y_pos = 0
+    for chunk in chunks:
+        if y_pos > 0:
+            y_pos += spacing
+        surf.blit(chunk, 8, (width // 2, y_pos), blend=False)
+        y_pos += chunk.height
+    surf.render()
+    return surf
+
+
+def bench_screen(label, res, diag, reps):
+    set_screen(res, diag)
+    results = {}
+
+    # Time CPU-side rendering of each stimulus
+    deg = ex.deg_to_px
+    results['render_cursor'] = time_it(
+        lambda: kld.Ellipse(deg(P.cursor_size), fill=ex.TRANSLUCENT_RED).render(), reps
+    )
+    results['render_target'] = time_it(
+        lambda: kld.Ellipse(deg(0.3), fill=ex.WHITE).render(), reps
+    )
+    results['render_fixation'] = time_it(
+        lambda: kld.FixationCross(
+            deg(0.5), deg(0.06), rotation=45, fill=ex.WHITE
+        ).render(), reps
+    )
+    hlw = deg(0.4)
+    results['render_arrow'] = time_it(
+        lambda: kld.Arrow(
+            deg(3.5), deg(0.15), hlw, hlw, fill=ex.WHITE, rotation=135
+        ).render(), reps
+    )
+
+    # Time compositing of a KVIQ-sized block of text (4 paragraphs of 2 lines)
+    width = int(P.screen_x * 0.8)
+    line_h = deg(0.45) * 2
+    chunks = [
+        NumpySurface(np.full((line_h * 2, int(width * 0.9), 4), 255, dtype=np.uint8))
+        for _ in range(4)
+    ]
+    results['kviq_composite'] = time_it(
+        lambda: composite_text(chunks, deg(0.5), width), reps
+    )
+
+    # Time GL fill/blit/swap and composed trial frames, if possible
+    try:
+        ctx = GLContext(res)
+    except Exception as e:
+        print("  Skipping GL stages for {0}: {1}".format(label, e))
+        return results
+
+    stim = make_stimuli()
+    target_loc = ex.vector_to_pos(P.screen_c, deg(6.0), 45)
+    fix, target, cursor = (stim['fixation'], stim['target'], stim['cursor'])
+    sync = ctx.finish
+    results['fill'] = time_it(lambda: fill(), reps, sync)
+    results['blit_cursor'] = time_it(lambda: blit(cursor, 5, P.screen_c), reps, sync)
+    results['blit_target'] = time_it(lambda: blit(target, 5, target_loc), reps, sync)
+    results['blit_fixation'] = time_it(lambda: blit(fix, 5, P.screen_c), reps, sync)
+    results['blit_arrow'] = time_it(
+        lambda: blit(stim['arrow'], 5, P.screen_c), reps, sync
+    )
+    results['swap'] = time_it(ctx.swap, reps, sync)
+
+    def pp_frame():
+        fill()
+        blit(fix, 5, P.screen_c)
+        blit(target, 5, target_loc)
+        blit(cursor, 5, (P.screen_c[0] + 40, P.screen_c[1] - 30))
+        ctx.swap()
+
+    def demo_frame():
+        fill()
+        blit(fix, 5, P.screen_c)
+        blit(target, 5, target_loc)
+        blit(stim['arrow'], 5, (P.screen_c[0] - 100, P.screen_c[1]))
+        blit(stim['arrow_outline'], 5, (P.screen_c[0] + 100, P.screen_c[1]))
+        blit(cursor, 5, P.screen_c)
+        ctx.swap()
+
+    results['frame_pp'] = time_it(pp_frame, reps, sync)
+    results['frame_demo'] = time_it(demo_frame, reps, sync)
+
+    # Time the same trial frame drawn from a stimulus atlas, including the
+    # one-off cost of building the atlas
+    start = perf_counter()
+    atlas = StimulusAtlas([fix, target, cursor])
+    sync()
+    results['atlas_build'] = (perf_counter() - start) * 1000
+
+    def pp_frame_atlas():
+        fill()
+        atlas.draw([
+            (fix, 5, P.screen_c),
+            (target, 5, target_loc),
+            (cursor, 5, (P.screen_c[0] + 40, P.screen_c[1] - 30)),
+        ])
+        ctx.swap()
+
+    results['frame_pp_atlas'] = time_it(pp_frame_atlas, reps, sync)
+    atlas.delete()
+
+    # Time PP frames with a moving cursor, repainting either the full screen or
+    # only the regions around the cursor
+    results['frame_pp_moving'], _ = moving_frames(ctx, stim, target_loc, reps)
+    dirty = DirtyRegions(res)
+    results['frame_pp_dirty'], _ = moving_frames(ctx, stim, target_loc, reps, dirty)
+
+    # Make sure dirty-region repaints produce the same frames as full redraws
+    dirty.invalidate()
+    _, partial = moving_frames(ctx, stim, target_loc, 30, dirty, readback=True)
+    _, full = moving_frames(ctx, stim, target_loc, 30, readback=True)
+    mismatches = sum([(a != b).any() for a, b in zip(full, partial)])
+    if mismatches:
+        print("  Warning: {0} dirty-region frames differed from full redraws".format(
+            mismatches
+        ))
+    ctx.close()
+    return results
+
+
+def moving_frames(ctx, stim, target_loc, n, dirty=None, readback=False):
+    # Draws PP frames with the cursor moving along a fixed path, returning the
+    # mean time per frame (in ms) and, optionally, the contents of each frame
+    gl = ctx.gl
+    fix, target, cursor = (stim['fixation'], stim['target'], stim['cursor'])
+    sizes = {id(s): stim_size(s) for s in (fix, target, cursor)}
+    frames = []
+    ctx.finish()
+    start = perf_counter()
+    for i in range(n):
+        step = i % 200
+        pos = (P.screen_c[0] + step * 2, P.screen_c[1] - step)
+        stimuli = [(fix, 5, P.screen_c), (target, 5, target_loc)]
+        region = None
+        if dirty:
+            region = dirty.update(centered_rect(sizes[id(cursor)], pos))
+        if region:
+            stimuli = [
+                (s, reg, loc) for s, reg, loc in stimuli
+                if rects_overlap(centered_rect(sizes[id(s)], loc), region)
+            ]
+            dirty.begin(region)
+        fill()
+        for s, reg, loc in stimuli + [(cursor, 5, pos)]:
+            blit(s, reg, loc)
+        if region:
+            dirty.end()
+        if readback:
+            w, h = (P.screen_x, P.screen_y)
+            px = gl.glReadPixels(0, 0, w, h, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+            frames.append(np.frombuffer(px, dtype=np.uint8).copy())
+        ctx.swap()
+    ctx.finish()
+    return (perf_counter() - start) / n * 1000, frames
+
+
+def compare(results, path):
+    # Prints the ratio of each timing to the same timing in a previous run
+    with open(path, "r") as f:
+        old = json.load(f)['results']
+    rows = []
+    for label, stages in results.items():
+        for stage, ms in stages.items():
+            prev = old.get(label, {}).get(stage)
+            if prev:
+                rows.append({
+                    'screen': label, 'stage': stage, 'old_ms': prev, 'new_ms': ms,
+                    'ratio': ms / prev,
+                })
+    print("\nComparison with {0}:\n".format(path))
+    _common.print_table(rows, ['screen', 'stage', 'old_ms', 'new_ms', 'ratio'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--reps", type=int, default=200)
+    parser.add_argument("--compare", type=str, default=None)
+    args = parser.parse_args()
+
+    if sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO) != 0:
+        raise RuntimeError(sdl2.SDL_GetError().decode("utf-8"))
+    params = _common.load_params()
+    for key in ["default_fill_color", "cursor_size"]:
+        setattr(P, key, params[key])
+
+    results = {}
+    rows = []
+    for label, res, diag in SCREENS:
+        print("Benchmarking {0} ({1}x{2})...".format(label, *res))
+        results[label] = bench_screen(label, res, diag, args.reps)
+        for stage, ms in results[label].items():
+            rows.append({'screen': label, 'stage': stage, 'ms': ms})
+    sdl2.SDL_Quit()
+
+    print("\nMean time per call (ms):\n")
+    _common.print_table(rows, ['screen', 'stage', 'ms'])
+    if args.compare:
+        compare(results, args.compare)
+    path = _common.save_results("rendering", results)
+    print("\nResults saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
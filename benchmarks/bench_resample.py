@@ -0,0 +1,133 @@
+"""Compares vectorized and per-trial resampling of cursor trajectories.
+
+Generates a synthetic task database (see _dataset.py) and resamples every
+trial's trajectory to a fixed number of time- and path-normalized points in a
+target-aligned frame with tools/resample_trajectories.py. The same trajectories
+are then resampled one trial at a time with np.interp (the way they'd
+typically be resampled in an analysis script) to check that both give the same
+results and compare their speed. Also times writing the results to a
+memory-mapped array store and averaging trajectories by phase from it.
+Requires numpy. Usage:
+
+    python benchmarks/bench_resample.py [--participants N] [--points N]
+
+"""
+
+import os
+import shutil
+import argparse
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+import _common
+import _dataset
+
+import dbutils
+import kinematics
+import resample_trajectories as rs
+
+
+def loop_resample(trials, samples, ids, origins, ppd, n_points):
+    # Resamples each trial's trajectory separately with np.interp
+    out = {mode: np.full((len(trials), n_points, 2), np.nan) for mode in rs.MODES}
+    bounds = np.searchsorted(ids, np.arange(len(trials) + 1))
+    for i in range(len(trials)):
+        s = samples[bounds[i]:bounds[i + 1]]
+        if not len(s):
+            continue
+        x, y = (s['x'], s['y'])
+        path = np.r_[0.0, np.cumsum(np.hypot(np.diff(x), np.diff(y)))]
+        a = np.radians(trials['target_angle'][i])
+        for mode, v in [('time_normalized', s['time']), ('path_normalized', path)]:
+            q = np.linspace(v[0], v[-1], n_points)
+            dx = np.interp(q, v, x) - origins[i, 0]
+            dy = np.interp(q, v, y) - origins[i, 1]
+            out[mode][i, :, 0] = (dx * np.sin(a) - dy * np.cos(a)) / ppd[i]
+            out[mode][i, :, 1] = (dx * np.cos(a) + dy * np.sin(a)) / ppd[i]
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--participants", type=int, default=100)
+    parser.add_argument("--points", type=int, default=rs.N_POINTS)
+    args = parser.parse_args()
+
+    conn = dbutils.connect(_dataset.get_dataset(args.participants))
+    pids = dbutils.participant_ids(conn)
+    start = perf_counter()
+    trials, samples, ids = kinematics.load_trajectories(conn, pids, rs.TRIAL_COLS)
+    load_time = perf_counter() - start
+    conn.close()
+    origins, ppd = rs.task_geometry(trials)
+
+    start = perf_counter()
+    t, x, y = (np.ascontiguousarray(samples[c]) for c in ['time', 'x', 'y'])
+    along, across = rs.target_aligned(ids, x, y, origins, trials['target_angle'], ppd)
+    values = {'time_normalized': t, 'path_normalized': rs.path_distance(ids, x, y)}
+    fast = {}
+    for mode in rs.MODES:
+        fast[mode] = rs.resample(ids, values[mode], along, across, len(trials), args.points)
+    vector_time = perf_counter() - start
+
+    start = perf_counter()
+    slow = loop_resample(trials, samples, ids, origins, ppd, args.points)
+    loop_time = perf_counter() - start
+    max_diff = {}
+    for mode in rs.MODES:
+        same_nan = np.array_equal(np.isnan(fast[mode]), np.isnan(slow[mode]))
+        diff = np.nanmax(np.abs(fast[mode] - slow[mode])) if same_nan else float("inf")
+        max_diff[mode] = float(diff)
+
+    # Write the results to a memory-mapped store, then read it back to get
+    # the average trajectory for each phase
+    out_dir = tempfile.mkdtemp(prefix="bench_resample_")
+    try:
+        start = perf_counter()
+        path = os.path.join(out_dir, "time_normalized.npy")
+        store = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float32, shape=fast['time_normalized'].shape
+        )
+        store[:] = fast['time_normalized']
+        store.flush()
+        del store
+        write_time = perf_counter() - start
+        size_mb = os.path.getsize(path) / 1e6
+
+        start = perf_counter()
+        store = np.load(path, mmap_mode="r")
+        for phase in np.unique(trials['phase']):
+            np.nanmean(store[trials['phase'] == phase], axis=0)
+        del store
+        read_time = perf_counter() - start
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    n = len(trials)
+    rows = [
+        {'step': 'load (SQLite)', 'seconds': load_time, 'trials/s': int(n / load_time)},
+        {'step': 'vectorized', 'seconds': vector_time, 'trials/s': int(n / vector_time)},
+        {'step': 'per-trial loop', 'seconds': loop_time, 'trials/s': int(n / loop_time)},
+        {'step': 'write store', 'seconds': write_time, 'trials/s': int(n / write_time)},
+        {'step': 'phase means', 'seconds': read_time, 'trials/s': int(n / read_time)},
+    ]
+    print("\nResampled {0} trials ({1} samples) to {2} points:\n".format(
+        n, len(samples), args.points
+    ))
+    _common.print_table(rows, ['step', 'seconds', 'trials/s'])
+    print("\nVectorized speedup over per-trial loop: {0:.1f}x".format(
+        loop_time / vector_time
+    ))
+    print("Store size: {0:.1f} MB per resampling mode".format(size_mb))
+    print("Max difference between methods (degrees):")
+    for mode, diff in max_diff.items():
+        print("  {0}: {1:.3g}".format(mode, diff))
+    results = {'steps': rows, 'trials': n, 'points': args.points, 'max_diff': max_diff}
+    path = _common.save_results("resample", results)
+    print("Results saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
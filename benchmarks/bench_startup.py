@@ -0,0 +1,216 @@
+"""Profiles the task's cold-start time, broken down by module import and init step.
+
+Imports the task's main module in a series of fresh Python interpreters with
+Python's import profiler enabled (-X importtime), reporting the median total
+launch time along with the median import cost of each of the task's own code
+modules and each top-level package they import. Then times the main
+initialization steps run at startup (SDL init, gamepad init and custom
+controller mappings, controller enumeration, and stimulus creation). If a
+controller mapping database is given, the time to load it with and without a
+cache of its validated mappings is also measured. Importing
+the full task and creating stimuli requires klibs to be installed (e.g. run
+with `pipenv run`), but other modules can be profiled without it. Usage:
+
+    python benchmarks/bench_startup.py [--runs N] [--module NAME] [--mapping-db PATH]
+
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+from time import perf_counter
+
+import _common
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, _common.ROOT)
+
+
+def project_modules():
+    # Gets the names of the task's own Python modules
+    names = ["experiment"]
+    for f in sorted(os.listdir(_common.CODE_DIR)):
+        if f.endswith(".py"):
+            names.append(f[:-3])
+    return names
+
+
+def launch(module):
+    # Imports a module in a fresh interpreter, returning the total launch time
+    # and the import times (self, cumulative) in ms for each module imported,
+    # along with the name of the module that first imported it
+    code = "import sys; sys.path[:0] = [{0!r}, {1!r}]; import {2}".format(
+        _common.CODE_DIR, _common.ROOT, module
+    )
+    cmd = [sys.executable, "-X", "importtime", "-c", code]
+    start = perf_counter()
+    proc = subprocess.run(cmd, cwd=_common.ROOT, capture_output=True, text=True)
+    elapsed = perf_counter() - start
+    if proc.returncode != 0:
+        err = proc.stderr.strip().split("\n")[-1]
+        raise RuntimeError("Unable to import '{0}': {1}".format(module, err))
+
+    # NOTE: Imports are logged after they finish, so each module is listed
+    # before the module that imported it
+    imports = []
+    parents = {}
+    lines = proc.stderr.split("\n")
+    for line in reversed(lines):
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split("|")
+        self_ms = int(self_us.split(":")[-1]) / 1000.0
+        depth = (len(name) - len(name.lstrip())) // 2
+        parents[depth] = name.strip()
+        parent = parents.get(depth - 1, None)
+        imports.append((name.strip(), parent, self_ms, int(cumulative_us) / 1000.0))
+    return elapsed * 1000, imports
+
+
+def median(values):
+    return _common.percentile(values, 50)
+
+
+def profile_imports(module, runs):
+    # Gets the median total launch time and per-module import costs
+    baseline, startup = launch("sys")
+    startup = set(name for name, _, _, _ in startup)
+    baseline = median([baseline] + [launch("sys")[0] for _ in range(runs - 1)])
+
+    # Get the import times for the task's modules, and for the packages they
+    # directly import (excluding those loaded by the interpreter at launch)
+    totals = []
+    costs = {}
+    ours = set(project_modules())
+    for _ in range(runs):
+        total, imports = launch(module)
+        totals.append(total)
+        run_costs = {}
+        for name, parent, self_ms, cumulative_ms in imports:
+            package = name.split(".")[0]
+            if name in ours:
+                key = (name, "project")
+            elif (parent in ours or parent is None) and name not in startup:
+                key = (package, "package")
+            else:
+                continue
+            prev = run_costs.get(key, (0.0, 0.0))
+            run_costs[key] = (prev[0] + self_ms, prev[1] + cumulative_ms)
+        for key, times in run_costs.items():
+            costs.setdefault(key, []).append(times)
+
+    rows = []
+    for (name, kind), times in costs.items():
+        rows.append({
+            'module': name,
+            'type': kind,
+            'self_ms': median([t[0] for t in times]),
+            'cumulative_ms': median([t[1] for t in times]),
+        })
+    rows.sort(key=lambda r: r['cumulative_ms'], reverse=True)
+    return median(totals), baseline, rows
+
+
+def time_step(label, func, results):
+    start = perf_counter()
+    out = func()
+    results.append({'step': label, 'ms': (perf_counter() - start) * 1000})
+    return out
+
+
+def profile_init(mapping_db=None):
+    # Times the main initialization steps run when launching the task
+    import sdl2
+    from mappings import (
+        CUSTOM_MAPPINGS, load_mapping_db, add_controller_mappings,
+        _create_controller_mapping,
+    )
+    from gamepad import get_controllers
+
+    results = []
+    time_step("sdl_init_video", lambda: sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO), results)
+    time_step(
+        "sdl_init_gamecontroller",
+        lambda: sdl2.SDL_InitSubSystem(sdl2.SDL_INIT_GAMECONTROLLER), results
+    )
+    def add_mappings():
+        mappings = []
+        for guid, name, mapping in CUSTOM_MAPPINGS:
+            mappings.append(_create_controller_mapping(guid, name, mapping))
+        add_controller_mappings(mappings)
+    time_step("custom_mappings", add_mappings, results)
+
+    # If provided, time loading a controller database with and without a cache
+    if mapping_db:
+        cache_dir = tempfile.mkdtemp()
+        load = lambda: load_mapping_db(mapping_db, cache_dir=cache_dir)
+        time_step("mapping_db_uncached", load, results)
+        mappings = time_step("mapping_db_cached", load, results)
+        time_step("mapping_db_add", lambda: add_controller_mappings(mappings), results)
+        shutil.rmtree(cache_dir)
+    time_step("get_controllers", get_controllers, results)
+
+    try:
+        from klibs import P
+        import experiment as ex
+    except ImportError:
+        print("klibs not available, skipping stimulus creation step.")
+    else:
+        from klibs.KLGraphics import KLDraw as kld
+        P.screen_x, P.screen_y = (1920, 1080)
+        P.screen_c = (960, 540)
+        P.ppd = 45.0
+        P.cursor_size = _common.load_params()['cursor_size']
+        def make_stimuli():
+            deg = ex.deg_to_px
+            stim = [
+                kld.Ellipse(deg(P.cursor_size), fill=ex.TRANSLUCENT_RED),
+                kld.Ellipse(deg(0.3), fill=ex.WHITE),
+                kld.FixationCross(deg(0.5), deg(0.06), rotation=45, fill=ex.WHITE),
+            ]
+            hlw = deg(0.4)
+            dist = (2 * deg(5.0) + deg(7.0)) / 3 / 2
+            for angle in [90, 135, 180]:
+                stim.append(ex.demo_arrow(deg(3.5), deg(0.15), hlw, hlw, dist, angle)[0])
+            for s in stim:
+                s.render()
+        time_step("stimuli", make_stimuli, results)
+
+    sdl2.SDL_Quit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--module", type=str, default="experiment")
+    parser.add_argument("--mapping-db", type=str, default=None)
+    args = parser.parse_args()
+
+    total, baseline, rows = profile_imports(args.module, args.runs)
+    print("\nMedian import cost per module ({0} runs):\n".format(args.runs))
+    _common.print_table(rows, ['module', 'type', 'self_ms', 'cumulative_ms'])
+    print("\nCold start (import {0}): {1:.1f} ms ({2:.1f} ms interpreter)".format(
+        args.module, total, baseline
+    ))
+
+    steps = profile_init(args.mapping_db)
+    print("\nInitialization steps:\n")
+    _common.print_table(steps, ['step', 'ms'])
+
+    results = {
+        'module': args.module,
+        'cold_start_ms': total,
+        'interpreter_ms': baseline,
+        'imports': rows,
+        'init': steps,
+    }
+    path = _common.save_results("startup", results)
+    print("\nResults saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""Benchmarks the per-iteration cost of the trial loop's response logic.
+
+Runs the state-machine trial loop in experiment.py and a reference copy of the
+original single-function loop against the same scripted stick/trigger input
+and a simulated 120 Hz frame clock, comparing the trial data and cursor
+samples produced by each exactly. Rendering, event pumping and database writes
+are replaced with no-ops so that only the per-frame response logic is timed.
+Requires klibs to be installed (e.g. run with `pipenv run`). Usage:
+
+    python benchmarks/bench_trial_loop.py [--trials N] [--seed N]
+
+The task now logs cursor sample times at full precision where the original
+loop truncated them to whole ms, so sample times are expected to differ by up
+to 1 ms on any trial with movement (the largest difference is reported). The
+original loop also treated an initial angle of exactly 0 degrees as unset and
+replaced it on the next frame, so trials where that happens are expected to
+differ as well. Any other difference is a regression.
+
+"""
+
+import os
+import sys
+import random
+import argparse
+from time import perf_counter
+
+import _common
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, _common.ROOT)
+
+from klibs import P
+from klibs.KLExceptions import TrialException
+import experiment as ex
+from summary import PhaseSummary
+
+
+FRAME_RATE = 120.0
+
+
+class ScriptedClock(object):
+    # A fake trial clock that advances by one frame each time events are pumped
+    def __init__(self):
+        self.now = 0.0
+        self.frame = 0
+
+    def tick(self):
+        self.frame += 1
+        self.now = self.frame / FRAME_RATE
+        return []
+
+    def time(self):
+        return self.now
+
+
+class ScriptedEvents(object):
+    # A minimal stand-in for the klibs EventManager using the scripted clock
+    def __init__(self, clock, target_onset):
+        self.clock = clock
+        self.onsets = {'target_on': target_onset, 'timeout': target_onset + 15000}
+
+    def before(self, label):
+        return self.clock.now * 1000 < self.onsets[label]
+
+    def after(self, label):
+        return self.clock.now * 1000 >= self.onsets[label]
+
+
+class NullDatabase(object):
+    def insert(self, *args, **kwargs):
+        pass
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def make_script(rng, exp, trial_type, onset_frames):
+    # Generates per-frame (cursor offset, trigger) input for a simulated trial
+    script = []
+    dx = exp.target_loc[0] - P.screen_c[0]
+    dy = exp.target_loc[1] - P.screen_c[1]
+    behaviour = rng.choice(["normal", "normal", "normal", "early", "held", "miss"])
+    if trial_type == "PP":
+        reach_start = onset_frames + rng.randint(20, 60)
+        reach_len = rng.randint(30, 80)
+        for i in range(onset_frames + 400):
+            trig = 0.0
+            if i < reach_start:
+                off = (0, 0)
+                if behaviour == "early" and i > onset_frames // 2:
+                    off = (dx * 0.5, dy * 0.5)
+                if behaviour == "held" and i < 3:
+                    trig = 0.8
+            else:
+                p = min(1.0, (i - reach_start) / float(reach_len))
+                curve = 0.2 * p * (1 - p)
+                off = (dx * p - dy * curve, dy * p + dx * curve)
+                if behaviour == "miss" and p >= 1.0:
+                    off = (dx * 1.3, dy * 1.3)
+                if p >= 1.0 and i > reach_start + reach_len + 10:
+                    trig = 1.0
+                elif 0.9 < p < 1.0:
+                    trig = 0.3
+            script.append((off, trig))
+    else:
+        press = onset_frames + int(1.5 * FRAME_RATE) + rng.randint(-30, 30)
+        for i in range(onset_frames + 400):
+            trig = 1.0 if i >= press else 0.0
+            off = (rng.randint(-2, 2), rng.randint(-2, 2))
+            if behaviour == "early" and i > onset_frames + 20:
+                off = (dx * 0.5, dy * 0.5)
+            if behaviour == "held" and i < 3:
+                trig = 0.8
+            if behaviour == "miss":
+                trig = 0.0
+            script.append((off, trig))
+    return script
+
+
+def legacy_trial(exp):
+    # Reference copy of the trial loop before it was split into state handlers
+    movement_rt = None
+    contact_rt = None
+    response_rt = None
+    initial_angle = None
+    axis_data = []
+    last_x, last_y = (-1, -1)
+    mod_x, mod_y = P.input_mappings[exp.joystick_map]
+
+    target_on = None
+    target_drawn = False
+    first_loop = True
+    over_target = False
+    while exp.evm.before('timeout'):
+        q = ex.pump()
+        ex.ui_request(queue=q)
+        lt, rt = exp.get_triggers()
+        jx, jy = exp.get_stick_position(rotation=exp.rotation)
+        input_time = ex.precise_time()
+        cursor_pos = (
+            P.screen_c[0] + int(jx * exp.cursor_dist_max * mod_x),
+            P.screen_c[1] + int(jy * exp.cursor_dist_max * mod_y)
+        )
+        triggers_released = lt < 0.2 and rt < 0.2
+        cursor_movement = ex.linear_dist(cursor_pos, P.screen_c)
+        if target_on:
+            if not movement_rt and cursor_movement > 0:
+                movement_rt = input_time - target_on
+            if not initial_angle and ex.px_to_deg(cursor_movement) > 1.0:
+                if input_time - (target_on + movement_rt) > 0.05:
+                    initial_angle = ex.vector_angle(P.screen_c, cursor_pos)
+        err = "NA"
+        if cursor_movement > exp.cursor_size:
+            if exp.trial_type == "MI":
+                err = "stick_mi"
+            elif exp.trial_type == "CC":
+                err = "stick_cc"
+            elif exp.trial_type == "PP" and not target_on:
+                err = "too_soon"
+        if first_loop:
+            first_loop = False
+            if not triggers_released:
+                err = "start_triggers"
+        elif exp.evm.before('target_on'):
+            if not triggers_released:
+                err = "too_soon"
+        if err != "NA":
+            if target_on:
+                break
+            else:
+                raise TrialException("Recycling trial!")
+        if target_on and cursor_movement:
+            any_change = (cursor_pos[0] != last_x) or (cursor_pos[1] != last_y)
+            if any_change:
+                axis_sample = (
+                    int((input_time - target_on) * 1000), cursor_pos[0], cursor_pos[1]
+                )
+                axis_data.append(axis_sample)
+            last_x = cursor_pos[0]
+            last_y = cursor_pos[1]
+        redraw = exp.trial_type == "PP" or not target_on
+        if redraw:
+            ex.fill()
+            ex.blit(exp.fixation, 5, P.screen_c)
+            if exp.evm.after('target_on'):
+                ex.blit(exp.target, 5, exp.target_loc)
+                target_drawn = True
+            ex.blit(exp.cursor, 5, cursor_pos)
+            ex.flip()
+        if not target_on and target_drawn:
+            target_on = ex.precise_time()
+        dist_to_target = ex.linear_dist(cursor_pos, exp.target_loc)
+        if dist_to_target < (exp.cursor_size / 2):
+            if not contact_rt:
+                contact_rt = ex.precise_time() - target_on
+            triggers_released = lt < 0.2 and rt < 0.2
+            if not over_target and triggers_released:
+                over_target = True
+        else:
+            over_target = False
+        can_respond = over_target or exp.trial_type != "PP"
+        if can_respond and (lt > 0.5 or rt > 0.5):
+            response_rt = ex.precise_time() - target_on
+            break
+
+    return {
+        "target_onset": exp.target_onset if target_on else "NA",
+        "movement_rt": "NA" if movement_rt is None else movement_rt * 1000,
+        "contact_rt": "NA" if contact_rt is None else contact_rt * 1000,
+        "response_rt": "NA" if response_rt is None else response_rt * 1000,
+        "initial_angle": "NA" if initial_angle is None else initial_angle,
+        "err": err,
+    }, axis_data
+
+
+def setup_experiment():
+    # Creates a task object with the attributes needed by the trial loop
+    P.screen_x, P.screen_y = (1920, 1080)
+    P.screen_c = (960, 540)
+    P.ppd = 45.0
+    P.development_mode = False
+    P.show_gamepad_debug = False
+    P.participant_id, P.block_number, P.trial_number = (1, 1, 1)
+    params = _common.load_params()
+    P.cursor_size = params['cursor_size']
+    P.input_mappings = params['input_mappings']
+    P.trajectory_tolerance = 0
+
+    exp = object.__new__(ex.MotorMapping)
+    exp.cursor_size = ex.deg_to_px(P.cursor_size)
+    exp.cursor_dist_max = ex.deg_to_px(8.0)
+    exp.target_dist_min = ex.deg_to_px(5.0)
+    exp.target_dist_max = ex.deg_to_px(7.0)
+    exp.fixation = exp.target = exp.cursor = None
+    exp.lower_middle = (P.screen_c[0], int(P.screen_y * 0.75))
+    exp.errs = {
+        err: None for err in
+        ["too_soon", "too_slow", "start_triggers", "stick_mi", "stick_cc", "continue"]
+    }
+    exp.gamepad = None
+    exp.joystick_map = "normal"
+    exp.show_debug = False
+    exp.predictor = None
+    exp.atlas = None
+    exp.dirty = None
+    exp.sampler = None
+    exp.trace = None
+    exp.realtime = None
+    exp.phase = "training"
+    exp.rotation = 0
+    exp.db = NullDatabase()
+    exp.queue_stats = ex.QueueStats()
+    exp.summary = PhaseSummary()
+    exp.show_feedback = _noop
+    return exp
+
+
+def run_trial(exp, clock, script, impl):
+    # Runs a single scripted trial with either the 'new' or 'legacy' loop
+    def stick(left=False, rotation=0):
+        off, _ = script[min(clock.frame, len(script) - 1)]
+        return (off[0] / exp.cursor_dist_max, off[1] / exp.cursor_dist_max)
+    def triggers():
+        _, trig = script[min(clock.frame, len(script) - 1)]
+        return (trig, 0.0)
+    exp.get_stick_position = stick
+    exp.get_triggers = triggers
+
+    clock.now, clock.frame = (0.0, 0)
+    start = perf_counter()
+    try:
+        if impl == "new":
+            dat = exp.trial()
+            axis = None
+        else:
+            dat, axis = legacy_trial(exp)
+    except TrialException:
+        dat, axis = ("recycled", None)
+    elapsed = perf_counter() - start
+    return dat, axis, elapsed, clock.frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--trials", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    exp = setup_experiment()
+    clock = ScriptedClock()
+    for name in ["fill", "blit", "flip", "ui_request", "message", "wait_for_input"]:
+        setattr(ex, name, _noop)
+    ex.pump = clock.tick
+    ex.precise_time = clock.time
+
+    # Capture axis data written by the new loop for comparison
+    written = []
+    exp.db.insert = lambda rows, table: written.append(rows)
+
+    rng = random.Random(args.seed)
+    timings = {'new': [0.0, 0], 'legacy': [0.0, 0]}
+    mismatches = {'trial data': 0, 'sample positions': 0, 'sample times': 0}
+    max_time_diff = 0.0
+    keys = [
+        "target_onset", "movement_rt", "contact_rt", "response_rt",
+        "initial_angle", "err",
+    ]
+    for n in range(args.trials):
+        exp.trial_type = rng.choice(["PP", "MI", "CC"])
+        exp._init_frame_handlers()
+        exp.target_angle = rng.randrange(0, 360)
+        exp.target_dist = rng.randrange(exp.target_dist_min, exp.target_dist_max)
+        exp.target_loc = ex.vector_to_pos(P.screen_c, exp.target_dist, exp.target_angle)
+        exp.target_onset = rng.randrange(1000, 3000, 100)
+        onset_frames = int(exp.target_onset / 1000.0 * FRAME_RATE)
+        script = make_script(rng, exp, exp.trial_type, onset_frames)
+        exp.evm = ScriptedEvents(clock, exp.target_onset)
+
+        del written[:]
+        new, _, t_new, frames = run_trial(exp, clock, script, "new")
+        old, old_axis, t_old, frames_old = run_trial(exp, clock, script, "legacy")
+        timings['new'][0] += t_new
+        timings['new'][1] += frames
+        timings['legacy'][0] += t_old
+        timings['legacy'][1] += frames_old
+
+        differs = []
+        if new == "recycled" or old == "recycled":
+            if new != old:
+                differs.append('trial data')
+        else:
+            # The original loop used "NA" for missing values (now NULLs)
+            old = {k: None if v == "NA" else v for k, v in old.items()}
+            if not all(new[k] == old[k] for k in keys):
+                differs.append('trial data')
+            if old["err"] is None:
+                new_axis = [(r['time'], r['stick_x'], r['stick_y']) for r in written[0]]
+                if [s[1:] for s in new_axis] != [s[1:] for s in old_axis]:
+                    differs.append('sample positions')
+                elif [s[0] for s in new_axis] != [s[0] for s in old_axis]:
+                    differs.append('sample times')
+                    for a, b in zip(new_axis, old_axis):
+                        max_time_diff = max(max_time_diff, abs(a[0] - b[0]))
+        for kind in differs:
+            mismatches[kind] += 1
+        if 'trial data' in differs or 'sample positions' in differs:
+            print("Mismatch on trial {0} ({1}):".format(n + 1, exp.trial_type))
+            print("  new:    {0}".format(new))
+            print("  legacy: {0}".format(old))
+
+    results = []
+    for impl in ["legacy", "new"]:
+        total, frames = timings[impl]
+        results.append({
+            'loop': impl,
+            'frames': frames,
+            'us_per_frame': (total / frames) * 1e6,
+        })
+    print("\nPer-iteration trial loop cost ({0} trials):\n".format(args.trials))
+    _common.print_table(results, ['loop', 'frames', 'us_per_frame'])
+    print("\nTrials with mismatched outputs (compared exactly):")
+    for kind, count in mismatches.items():
+        print("  - {0}: {1}".format(kind, count))
+    print("Largest difference in sample times: {0:.3f} ms".format(max_time_diff))
+    path = _common.save_results("trial_loop", results)
+    print("Results saved to {0}".format(path))
+
+
+if __name__ == "__main__":
+    main()
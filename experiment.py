@@ -5,6 +5,7 @@ __author__ = "Austin Hurst"
 from math import sqrt
 from random import randrange, shuffle
 from ctypes import c_int, byref
+from concurrent.futures import ThreadPoolExecutor
 
 import sdl2
 import klibs
@@ -23,9 +24,11 @@ from klibs.KLUserInterface import (
     any_key, mouse_pos, ui_request, hide_cursor, smart_sleep,
 )
 
-from KVIQ import KVIQ
-from gamepad import gamepad_init, get_controllers
+from gamepad import gamepad_init, get_controllers, ControllerManager
 from klibs_wip import Block
+from realtime import RealtimeMode
+from regions import DirtyRegions, centered_rect, rects_overlap, stim_size
+from sdl_utils import EventPolicy, QueueStats
 
 # Define colours for use in the experiment
 WHITE = (255, 255, 255)
@@ -37,16 +40,57 @@ TRANSLUCENT_RED = (255, 0, 0, 96)
 AXIS_MAX = 32768
 TRIGGER_MAX = 32767
 
+# Define the states of the trial loop
+START = 0        # First frame of the trial
+PRE_TARGET = 1   # Waiting for the target to appear
+TARGET_ON = 2    # Target on screen, cursor not over target
+OVER_TARGET = 3  # Cursor over target with triggers released (PP only)
+RESPONSE = 4     # Trigger pressed when a response was allowed
+ERROR = 5        # Participant made an error
+
+
+class TrialState(object):
+    # Response data collected over the course of a single trial
+    def __init__(self):
+        self.target_on = None
+        self.movement_rt = None
+        self.contact_rt = None
+        self.response_rt = None
+        self.initial_angle = None
+        self.err = "NA"
+        self.axis_data = []
+        self.last_pos = (-1, -1)
+        self.display_pos = None
+
 
 class MotorMapping(klibs.Experiment):
 
     def setup(self):
 
+        # Define custom session structure & trial counts
+        structure = [
+            Block({}, label='baseline', trials=40),
+            Block({}, label='pretest', trials=10),
+            Block({}, label='training', trials=200),
+            Block({}, label='posttest', trials=10),
+            Block({}, label='washout', trials=40),
+        ]
+
+        # Create the task stimuli and trial sequence in the background while the
+        # KVIQ runs. Anything that uses SDL or the klibs text renderer (e.g.
+        # gamepad init, error messages) is left for the main thread, since
+        # neither are safe to use from multiple threads at once.
+        pool = ThreadPoolExecutor(max_workers=1)
+        stimuli_ready = pool.submit(self._init_stimuli)
+        trials_ready = pool.submit(generate_trials, structure)
+        pool.shutdown(wait=False)
+
         # Prior to starting the task, run through the KVIQ
         handedness = self.db.select(
             'participants', columns=['handedness'], where={'id': P.participant_id}
         )[0][0]
         if P.collect_kviq:
+            from KVIQ import KVIQ # Only import the KVIQ when needed
             kviq = KVIQ(handedness == "l")
             responses = kviq.run()
             for movement, dat in responses.items():
@@ -54,45 +98,24 @@ class MotorMapping(klibs.Experiment):
                 dat['movement'] = movement
                 self.db.insert(dat, table='kviq')
 
-        # Initialize stimulus sizes and layout
-        screen_h_deg = (P.screen_y / 2.0) / deg_to_px(1.0)
-        fixation_size = deg_to_px(0.5)
-        fixation_thickness = deg_to_px(0.06)
-        self.cursor_size = deg_to_px(P.cursor_size)
-        self.target_size = deg_to_px(0.3)
-        self.target_dist_min = deg_to_px(5.0)
-        self.target_dist_max = deg_to_px(7.0)
-        self.cursor_dist_max = deg_to_px(8.0)
-        self.lower_middle = (P.screen_c[0], int(P.screen_y * 0.75))
-        self.msg_loc = (P.screen_c[0], int(P.screen_y * 0.4))
+        # Wait for any background setup to finish (re-raising any errors)
+        stimuli_ready.result()
+        self.blocks, self.block_labels = trials_ready.result()
+        P.blocks_per_experiment = len(self.blocks)
+        self.phase = None
 
-        # Initialize task stimuli
-        self.cursor = kld.Ellipse(self.cursor_size, fill=TRANSLUCENT_RED)
-        self.target = kld.Ellipse(self.target_size, fill=WHITE)
-        self.fixation = kld.FixationCross(
-            fixation_size, fixation_thickness, rotation=45, fill=WHITE
-        )
-        if P.development_mode and P.show_gamepad_debug:
-            add_text_style('debug', '0.3deg')
+        self.show_debug = P.development_mode and P.show_gamepad_debug
 
-        # Generate additional task demo stimuli
-        target_dist = (2 * self.target_dist_min + self.target_dist_max) / 3
-        dist = target_dist / 2 # Distance between screen center & arrow midpoint
-        tl = deg_to_px(3.5) # Arrow tail length
-        tls = deg_to_px(1.5) # Arrow tail length (small)
-        tw = deg_to_px(0.15) # Arrow tail thickness
-        hlw = deg_to_px(0.4) # Arrow head length/width
-        lt = deg_to_px(0.05) # Arrow outline thickness
-        self.demo_arrows = {
-            'cursor90': demo_arrow(tl, tw, hlw, hlw, dist, angle=90),
-            'cursor135': demo_arrow(tl, tw, hlw, hlw, dist, angle=135),
-            'joystick135': demo_arrow(tl, tw, hlw, hlw, dist, outline=lt, angle=135),
-            'joystick180': demo_arrow(tl, tw, hlw, hlw, dist, outline=lt, angle=180),
-            'cursor90_small': demo_arrow(tls, tw, hlw, hlw, dist * 0.65, angle=90),
-            'cursor_adj': demo_arrow(
-                (tl + tls) / 2, tw, hlw, hlw, dist * 1.4, angle=120, rotation=162
-            ),
-        }
+        # If enabled, extrapolate the drawn cursor to compensate for display lag
+        self.predictor = None
+        if P.cursor_prediction:
+            from prediction import CursorPredictor
+            self.predictor = CursorPredictor(
+                P.screen_c, self.cursor_dist_max, 1.0 / P.refresh_rate,
+                offset=P.cursor_prediction_offset / 1000.0,
+            )
+        if self.show_debug:
+            add_text_style('debug', '0.3deg')
 
         # Define quadrants for targets
         self.quadrants = {
@@ -102,17 +125,65 @@ class MotorMapping(klibs.Experiment):
             'd': (270, 360),
         }
 
-        # Initialize gamepad (if present)
+        # Initialize gamepad (if present), reconnecting automatically if unplugged
         self.gamepad = None
-        gamepad_init()
+        gamepad_init(P.controller_db)
         controllers = get_controllers()
         if len(controllers):
-            self.gamepad = controllers[0]
-            self.gamepad.initialize()
-            print(self.gamepad._info)
+            pad = controllers[0]
+            pad.initialize()
+            print(pad._info)
+            self.gamepad = ControllerManager(pad)
+
+        # If enabled, record all sticks & triggers of every connected controller
+        # on each frame of every trial
+        self.sampler = None
+        self.extra_pads = []
+        if P.record_devices:
+            from sampling import DeviceSampler, GamepadSource
+            sources = [GamepadSource(self.gamepad)] if self.gamepad else []
+            for pad in controllers[1:]:
+                pad.initialize()
+                self.extra_pads.append(pad)
+                sources.append(GamepadSource(pad))
+            self.sampler = DeviceSampler(sources, clock=precise_time)
+            txt = "Recording {0} input device(s) once per frame ({1:.0f} Hz)."
+            print(txt.format(len(sources), P.refresh_rate))
+            for info in self.sampler.device_info():
+                info['participant_id'] = P.participant_id
+                self.db.insert(info, table='devices')
         self.joystick_map = "normal"
         self.rotation = 0
 
+        # If enabled, record full-resolution raw stick & trigger traces
+        self.trace = None
+        if P.record_raw_traces:
+            from traces import TraceBuffer
+            self.trace = TraceBuffer()
+        self.raw_stick = (0, 0)
+        self.raw_triggers = (0, 0)
+
+        # Define the SDL event types to ignore during trials. Controller axes are
+        # polled directly, so axis motion events are never needed. Raw joystick
+        # button events are left enabled since SDL2 uses them to generate
+        # controller button events.
+        trial_ignore = [
+            sdl2.SDL_JOYAXISMOTION,
+            sdl2.SDL_JOYBALLMOTION,
+            sdl2.SDL_JOYHATMOTION,
+            sdl2.SDL_CONTROLLERAXISMOTION,
+        ]
+        if self.gamepad:
+            # If using a gamepad, mouse input is irrelevant during trials
+            trial_ignore += [sdl2.SDL_MOUSEMOTION, sdl2.SDL_MOUSEWHEEL]
+        self.trial_events = EventPolicy(trial_ignore)
+        self.queue_stats = QueueStats()
+
+        # Keep running per-phase statistics over the session
+        from summary import PhaseSummary
+        self.summary = PhaseSummary()
+        self.summary_saved = False
+
         # Define error messages for the task
         err_txt = {
             "too_soon": (
@@ -138,23 +209,38 @@ class MotorMapping(klibs.Experiment):
         for key, txt in err_txt.items():
             self.errs[key] = message(txt, align="center")
 
-        # Define custom session structure & trial counts
-        structure = [
-            Block({}, label='baseline', trials=40),
-            Block({}, label='pretest', trials=10),
-            Block({}, label='training', trials=200),
-            Block({}, label='posttest', trials=10),
-            Block({}, label='washout', trials=40),
-        ]
-        self.blocks, self.block_labels = generate_trials(structure)
-        P.blocks_per_experiment = len(self.blocks)
-        self.phase = None
+        # If enabled, pack the trial stimuli & messages into a single texture
+        self.atlas = None
+        if P.stimulus_atlas:
+            from atlas import StimulusAtlas
+            stimuli = [self.fixation, self.target, self.cursor]
+            self.atlas = StimulusAtlas(stimuli + list(self.errs.values()))
+
+        # If enabled, only repaint the parts of the screen that change between
+        # trial frames (disabled when showing gamepad debug info)
+        self.dirty = None
+        if P.dirty_rendering and not self.show_debug:
+            self.dirty = DirtyRegions((P.screen_x, P.screen_y))
+            self.stim_sizes = {}
+            for stim in [self.fixation, self.target, self.cursor]:
+                self.stim_sizes[id(stim)] = stim_size(stim)
+
+        # If enabled, isolate trials from GC pauses and scheduling noise
+        self.realtime = None
+        if P.realtime_trials:
+            self.realtime = RealtimeMode(cpus=P.realtime_cpus)
+            status = self.realtime.start()
+            if not status['priority']:
+                print("Note: unable to raise process priority for realtime trials.")
 
         # Run a visual demo explaining the task
         self.task_demo()
 
 
     def block(self):
+        prev_phase = self.phase
+        self.summary_saved = False
+
         # Hide mouse cursor if not already hidden
         hide_cursor()
 
@@ -210,6 +296,7 @@ class MotorMapping(klibs.Experiment):
         self.phase = self.block_labels[P.block_number - 1]
         self.trial_type = P.condition if self.phase == "training" else "PP"
         self.rotation = 0 if self.phase in ["baseline", "washout"] else -45
+        self._init_frame_handlers()
         if self.phase == "training":
             block_msg = block_msgs["training_" + P.condition]
             if P.condition == "MI":
@@ -226,6 +313,12 @@ class MotorMapping(klibs.Experiment):
         fill()
         blit(msg, 5, self.msg_loc)
         blit(msg2, 5, self.lower_middle)
+        if P.development_mode and prev_phase:
+            # Show how the participant did in the previous phase
+            lines = self.summary.lines(prev_phase)
+            if lines:
+                summary = message("\n".join(lines), align="center")
+                blit(summary, 8, (P.screen_c[0], int(P.screen_y * 0.05)))
         flip()
         wait_for_input(self.gamepad)
 
@@ -246,10 +339,18 @@ class MotorMapping(klibs.Experiment):
             break_txt.append("\nKeep in mind the 45° counter-clockwise rotation!")
         if self.phase == "training" and P.trial_number > 1:
             if (P.trial_number - 1) % 40 == 0:
+                if P.development_mode:
+                    # Show how the participant is doing so far in the phase
+                    lines = self.summary.lines(self.phase)
+                    break_txt.append("\n" + "\n".join(lines))
                 self.show_demo_text(
                     break_txt, stim_set=[], msg_y=int(0.45 * P.screen_y)
                 )
 
+        # If the controller was unplugged, wait for it to be reconnected
+        if self.gamepad and not self.gamepad.connected:
+            self._wait_for_controller()
+
         # Generate trial factors
         quadrant = self.quadrant_list[P.trial_number - 1]
         angle_min, angle_max = self.quadrants[quadrant]
@@ -266,87 +367,112 @@ class MotorMapping(klibs.Experiment):
         mouse_pos(position=P.screen_c)
         hide_cursor()
 
+        # Suspend garbage collection until the end of the trial
+        if self.realtime:
+            self.realtime.enter_trial()
+
+        # Stop SDL from queuing events we don't need during the trial
+        if P.filter_trial_events:
+            self.trial_events.apply()
+        self.queue_stats.reset()
+
 
     def trial(self):
+        try:
+            return self._run_trial()
+        except TrialException:
+            # Recycled trials skip trial_clean_up, so collect the trial's garbage
+            # and re-enable the GC here
+            if self.realtime:
+                self.realtime.exit_trial()
+            raise
+        except BaseException:
+            # If the trial crashes, restore the GC and process priority before
+            # the error propagates
+            if self.realtime:
+                self.realtime.stop()
+            raise
+
+
+    def _run_trial(self):
 
         # Initialize trial response data
-        movement_rt = None
-        contact_rt = None
-        response_rt = None
-        initial_angle = None
-        axis_data = []
-        last_x, last_y = (-1, -1)
+        t = TrialState()
+        dropouts = self.gamepad.dropouts if self.gamepad else 0
 
         # Get joystick mapping for the trial
         mod_x, mod_y = P.input_mappings[self.joystick_map]
 
         # Initialize trial stimuli
         fill(MIDGREY)
-        blit(self.fixation, 5, P.screen_c)
-        blit(self.cursor, 5, P.screen_c)
+        self._blit_all([
+            (self.fixation, 5, P.screen_c),
+            (self.cursor, 5, P.screen_c),
+        ])
         flip()
 
-        target_on = None
-        target_drawn = False
-        first_loop = True
-        over_target = False
+        if self.dirty:
+            self.dirty.invalidate()
+
+        handlers = self.frame_handlers
+        predictor = self.predictor
+        sampler = self.sampler
+        if sampler:
+            sampler.reset()
+        trace = self.trace
+        if trace:
+            trace.reset()
+        trial_start = precise_time()
+        if predictor:
+            predictor.reset()
+        state = START
         while self.evm.before('timeout'):
             q = pump()
             ui_request(queue=q)
+            self.queue_stats.add(q)
 
             # Get latest joystick/trigger data from gamepad
             if self.gamepad:
                 self.gamepad.update()
+            if sampler:
+                sampler.sample()
 
             # Filter, standardize, and possibly invert the axis & trigger data
             lt, rt = self.get_triggers()
             jx, jy = self.get_stick_position(rotation=self.rotation)
             input_time = precise_time()
+            if trace is not None:
+                trace.add(input_time - trial_start, self.raw_stick + self.raw_triggers)
             cursor_pos = (
                 P.screen_c[0] + int(jx * self.cursor_dist_max * mod_x),
                 P.screen_c[1] + int(jy * self.cursor_dist_max * mod_y)
             )
-
-            # Handle input based on trial type and trials phase
-            triggers_released = lt < 0.2 and rt < 0.2
             cursor_movement = linear_dist(cursor_pos, P.screen_c)
-            if target_on:
-                # As soon as cursor moves after target onset, log movement RT
-                if not movement_rt and cursor_movement > 0:
-                    movement_rt = input_time - target_on
-                # Once cursor has moved slightly away from origin, log initial angle
-                if not initial_angle and px_to_deg(cursor_movement) > 1.0:
-                    # Wait at least 50 ms after first movement before calculating angle
-                    # (otherwise we get lots of 270s due to no y-axis change)
-                    if input_time - (target_on + movement_rt) > 0.05:
-                        initial_angle = vector_angle(P.screen_c, cursor_pos)
-
-            # Detect/handle different types of trial error
-            err = "NA"
-            if cursor_movement > self.cursor_size:
-                if self.trial_type == "MI":
-                    err = "stick_mi"
-                elif self.trial_type == "CC":
-                    err = "stick_cc"
-                elif self.trial_type == "PP" and not target_on:
-                    err = "too_soon"
-            if first_loop:
-                first_loop = False
-                if not triggers_released:
-                    err = "start_triggers"
-            elif self.evm.before('target_on'):
-                if not triggers_released:
-                    err = "too_soon"
+
+            # Get the position to draw the cursor at (the response checks always
+            # use the raw cursor position)
+            t.display_pos = cursor_pos
+            if predictor:
+                predictor.add(input_time, cursor_pos)
+                t.display_pos = predictor.predict()
+
+            # Run the checks for the current state of the trial
+            state = handlers[state](t, cursor_pos, cursor_movement, lt, rt, input_time)
+            if state == RESPONSE:
+                break
 
             # If the participant did something wrong, show them a feedback message
-            if err != "NA":
+            if state == ERROR:
+                err = t.err
                 self.show_feedback(self.errs[err], duration=2.0)
                 fill()
-                blit(self.errs[err], 5, P.screen_c)
-                blit(self.errs['continue'], 5, self.lower_middle)
+                self._blit_all([
+                    (self.errs[err], 5, P.screen_c),
+                    (self.errs['continue'], 5, self.lower_middle),
+                ])
                 flip()
                 wait_for_input(self.gamepad)
-                if target_on:
+                if t.target_on:
                     # NOTE: Do we want to recycle stick MI/CC errors as well?
                     # If so, should we still record when people make these errors
                     # regardless?
@@ -355,72 +481,33 @@ class MotorMapping(klibs.Experiment):
                     # If target hasn't appeared yet, recycle the trial
                     raise TrialException("Recycling trial!")
 
-            # Log continuous cursor x/y data for each frame
-            if target_on and cursor_movement:
-                # Only log samples where position actually changes (to save space)
-                any_change = (cursor_pos[0] != last_x) or (cursor_pos[1] != last_y)
-                if any_change:
-                    axis_sample = (
-                        int((input_time - target_on) * 1000), # timestamp
-                        cursor_pos[0], # joystick x
-                        cursor_pos[1], # joystick y
-                    )
-                    axis_data.append(axis_sample)
-                last_x = cursor_pos[0]
-                last_y = cursor_pos[1]
-            
-            # Actually draw stimuli to the screen
-            redraw = self.trial_type == "PP" or not target_on
-            if redraw:
-                fill()
-                blit(self.fixation, 5, P.screen_c)
-                if self.evm.after('target_on'):
-                    blit(self.target, 5, self.target_loc)
-                    target_drawn = True
-                blit(self.cursor, 5, cursor_pos)
-                if P.development_mode and P.show_gamepad_debug:
-                    self.show_gamepad_debug()
-                flip()
-
-            # Get timestamp for when target drawn to the screen
-            if not target_on and target_drawn:
-                target_on = precise_time()
-                
-            # Check if the cursor is currently over the target
-            dist_to_target = linear_dist(cursor_pos, self.target_loc)
-            if dist_to_target < (self.cursor_size / 2):
-                # Get timestamp for when cursor first touches target
-                if not contact_rt:
-                    contact_rt = precise_time() - target_on
-                # To prevent participants from holding triggers down while moving the
-                # stick (making the task much easier), the experiment only counts the
-                # cursor as being over the target if both triggers are released while
-                # over it.
-                triggers_released = lt < 0.2 and rt < 0.2
-                if not over_target and triggers_released:
-                    over_target = True
-            else:
-                over_target = False
-
-            # If either trigger pressed when it is possible to respond, end the trial
-            can_respond = over_target or self.trial_type != "PP"
-            if can_respond and (lt > 0.5 or rt > 0.5):
-                response_rt = precise_time() - target_on
-                break
+        # Check whether the controller was disconnected during the trial
+        if self.gamepad:
+            dropouts = self.gamepad.dropouts - dropouts
+        else:
+            dropouts = 0
 
         # Show RT feedback for 1 second (may remove this)
-        if response_rt:
-            rt_sec = "{:.3f}".format(response_rt)
+        if t.response_rt:
+            rt_sec = "{:.3f}".format(t.response_rt)
             feedback = message(rt_sec)
             self.show_feedback(feedback, duration=1.5)
-        elif err == "NA":
+        elif t.err == "NA":
             feedback = self.errs['too_slow']
             self.show_feedback(feedback, duration=2.5)
 
         # Write raw axis data to database
-        if err == "NA":
+        tolerance = None
+        if t.err == "NA":
+            # If enabled, drop any samples that can be reconstructed from the
+            # others (within the given tolerance) by linear interpolation
+            axis_data = t.axis_data
+            if P.trajectory_tolerance:
+                from trajectory import simplify
+                tolerance = P.trajectory_tolerance
+                axis_data = simplify(axis_data, tolerance, axes=((1, 2), (3, 4)))
             rows = []
-            for timestamp, stick_x, stick_y in axis_data:
+            for timestamp, stick_x, stick_y, display_x, display_y in axis_data:
                 rows.append({
                     'participant_id': P.participant_id,
                     'block_num': P.block_number,
@@ -428,34 +515,94 @@ class MotorMapping(klibs.Experiment):
                     'time': timestamp,
                     'stick_x': stick_x,
                     'stick_y': stick_y,
+                    'display_x': display_x,
+                    'display_y': display_y,
                 })
             self.db.insert(rows, table='gamepad')
 
-        return {
+            # Write data for all recorded devices to the database, with times in
+            # ms since target onset (like the gamepad table)
+            if sampler:
+                rows = sampler.rows(origin=t.target_on)
+                for row in rows:
+                    row['participant_id'] = P.participant_id
+                    row['block_num'] = P.block_number
+                    row['trial_num'] = P.trial_number
+                self.db.insert(rows, table='device_samples')
+
+            # Write the raw stick & trigger trace for the trial to the database
+            if trace is not None:
+                onset = None
+                if t.target_on:
+                    onset = (t.target_on - trial_start) * 1000
+                self.db.insert({
+                    'participant_id': P.participant_id,
+                    'block_num': P.block_number,
+                    'trial_num': P.trial_number,
+                    'samples': len(trace),
+                    'target_on': onset,
+                    'data': trace.pack(),
+                }, table='raw_traces')
+
+        trial_data = {
             "block_num": P.block_number,
             "trial_num": P.trial_number,
             "phase": self.phase,
             "trial_type": self.trial_type,
             "rotation": self.rotation,
-            "target_onset": self.target_onset if target_on else "NA",
+            "target_onset": self.target_onset if t.target_on else None,
             "target_dist": px_to_deg(self.target_dist),
             "target_angle": self.target_angle,
-            "movement_rt": "NA" if movement_rt is None else movement_rt * 1000,
-            "contact_rt": "NA" if contact_rt is None else contact_rt * 1000,
-            "response_rt": "NA" if response_rt is None else response_rt * 1000,
-            "initial_angle": "NA" if initial_angle is None else initial_angle,
-            "err": err,
+            "movement_rt": None if t.movement_rt is None else t.movement_rt * 1000,
+            "contact_rt": None if t.contact_rt is None else t.contact_rt * 1000,
+            "response_rt": None if t.response_rt is None else t.response_rt * 1000,
+            "initial_angle": t.initial_angle,
+            "err": None if t.err == "NA" else t.err,
             "target_x": self.target_loc[0],
             "target_y": self.target_loc[1],
+            "controller_dropouts": dropouts,
+            "trajectory_tolerance": tolerance,
         }
+        self.summary.add(trial_data)
+        return trial_data
 
 
     def trial_clean_up(self):
-        pass
+        # Re-enable any event types ignored during the trial
+        self.trial_events.restore()
+        if P.development_mode and P.show_queue_stats:
+            stats = self.queue_stats
+            txt = "Events per frame: mean = {0:.2f}, max = {1} ({2} frames)"
+            print(txt.format(stats.mean, stats.max, stats.frames))
+
+        # Collect any garbage from the trial and log any GC pauses during it
+        if self.realtime:
+            rows = []
+            for generation, duration in self.realtime.exit_trial():
+                rows.append({
+                    'participant_id': P.participant_id,
+                    'block_num': P.block_number,
+                    'trial_num': P.trial_number,
+                    'generation': generation,
+                    'duration': duration * 1000,
+                })
+            if len(rows):
+                self.db.insert(rows, table='gc_pauses')
+
+        # Once the last trial of the block is done, save the running summary for
+        # the block's phase (recycled trials are added to the end of the block)
+        block = self.blocks[P.block_number - 1]
+        if block.i >= block.length:
+            self._save_summary()
 
 
     def clean_up(self):
-        
+
+        # If the session ended partway through a block, save the running summary
+        # for its phase so far
+        if self.phase and not self.summary_saved:
+            self._save_summary()
+
         end_txt = (
             "You're all done, thanks for participating!\nPress any button to exit."
         )
@@ -467,6 +614,12 @@ class MotorMapping(klibs.Experiment):
 
         if self.gamepad:
             self.gamepad.close()
+        for pad in self.extra_pads:
+            pad.close()
+        if self.realtime:
+            self.realtime.stop()
+        if self.atlas:
+            self.atlas.delete()
 
 
     def show_demo_text(self, msgs, stim_set, duration=2.0, wait=True, msg_y=None):
@@ -664,6 +817,251 @@ class MotorMapping(klibs.Experiment):
         )
 
 
+    def _init_stimuli(self):
+        # Creates the task stimuli (run in a background thread during setup)
+
+        # Initialize stimulus sizes and layout
+        fixation_size = deg_to_px(0.5)
+        fixation_thickness = deg_to_px(0.06)
+        self.cursor_size = deg_to_px(P.cursor_size)
+        self.target_size = deg_to_px(0.3)
+        self.target_dist_min = deg_to_px(5.0)
+        self.target_dist_max = deg_to_px(7.0)
+        self.cursor_dist_max = deg_to_px(8.0)
+        self.lower_middle = (P.screen_c[0], int(P.screen_y * 0.75))
+        self.msg_loc = (P.screen_c[0], int(P.screen_y * 0.4))
+
+        # Initialize task stimuli
+        self.cursor = kld.Ellipse(self.cursor_size, fill=TRANSLUCENT_RED)
+        self.target = kld.Ellipse(self.target_size, fill=WHITE)
+        self.fixation = kld.FixationCross(
+            fixation_size, fixation_thickness, rotation=45, fill=WHITE
+        )
+
+        # Generate additional task demo stimuli
+        target_dist = (2 * self.target_dist_min + self.target_dist_max) / 3
+        dist = target_dist / 2 # Distance between screen center & arrow midpoint
+        tl = deg_to_px(3.5) # Arrow tail length
+        tls = deg_to_px(1.5) # Arrow tail length (small)
+        tw = deg_to_px(0.15) # Arrow tail thickness
+        hlw = deg_to_px(0.4) # Arrow head length/width
+        lt = deg_to_px(0.05) # Arrow outline thickness
+        self.demo_arrows = {
+            'cursor90': demo_arrow(tl, tw, hlw, hlw, dist, angle=90),
+            'cursor135': demo_arrow(tl, tw, hlw, hlw, dist, angle=135),
+            'joystick135': demo_arrow(tl, tw, hlw, hlw, dist, outline=lt, angle=135),
+            'joystick180': demo_arrow(tl, tw, hlw, hlw, dist, outline=lt, angle=180),
+            'cursor90_small': demo_arrow(tls, tw, hlw, hlw, dist * 0.65, angle=90),
+            'cursor_adj': demo_arrow(
+                (tl + tls) / 2, tw, hlw, hlw, dist * 1.4, angle=120, rotation=162
+            ),
+        }
+
+        # Pre-render all stimuli so they're ready to draw
+        for stim in [self.cursor, self.target, self.fixation]:
+            stim.render()
+        for arrow, loc in self.demo_arrows.values():
+            arrow.render()
+
+
+    def _init_frame_handlers(self):
+        # Selects the trial loop handler for each state based on the trial type
+        if self.trial_type == "PP":
+            self.movement_err = "too_soon"
+            self.check_target = self._pp_check_target
+            self.frame_handlers = {
+                START: self._frame_start,
+                PRE_TARGET: self._frame_pre_target,
+                TARGET_ON: self._pp_target_on,
+                OVER_TARGET: self._pp_over_target,
+            }
+        else:
+            self.movement_err = "stick_mi" if self.trial_type == "MI" else "stick_cc"
+            self.check_target = self._imagery_check_target
+            self.frame_handlers = {
+                START: self._frame_start,
+                PRE_TARGET: self._frame_pre_target,
+                TARGET_ON: self._imagery_target_on,
+            }
+
+
+    def _frame_start(self, t, pos, movement, lt, rt, input_time):
+        # On the first frame, make sure the triggers are released before starting
+        if movement > self.cursor_size:
+            t.err = self.movement_err
+        if not (lt < 0.2 and rt < 0.2):
+            t.err = "start_triggers"
+        if t.err != "NA":
+            return ERROR
+        return self._draw_pre_target(t, pos, lt, rt)
+
+
+    def _frame_pre_target(self, t, pos, movement, lt, rt, input_time):
+        # Before the target appears, check for early movements or responses
+        if movement > self.cursor_size:
+            t.err = self.movement_err
+        if self.evm.before('target_on') and not (lt < 0.2 and rt < 0.2):
+            t.err = "too_soon"
+        if t.err != "NA":
+            return ERROR
+        return self._draw_pre_target(t, pos, lt, rt)
+
+
+    def _draw_pre_target(self, t, pos, lt, rt):
+        # Draws the current frame, showing the target if it's time for it to appear
+        show_target = self.evm.after('target_on')
+        self._draw_frame(t.display_pos, show_target)
+        if not show_target:
+            return PRE_TARGET
+        # Get timestamp for when target drawn to the screen
+        t.target_on = precise_time()
+        return self.check_target(t, pos, lt, rt)
+
+
+    def _pp_target_on(self, t, pos, movement, lt, rt, input_time):
+        self._update_movement(t, pos, movement, input_time)
+        self._draw_frame(t.display_pos, True)
+        return self._pp_check_target(t, pos, lt, rt)
+
+
+    def _pp_check_target(self, t, pos, lt, rt):
+        # Check if the cursor is currently over the target
+        if linear_dist(pos, self.target_loc) < (self.cursor_size / 2):
+            # Get timestamp for when cursor first touches target
+            if not t.contact_rt:
+                t.contact_rt = precise_time() - t.target_on
+            # To prevent participants from holding triggers down while moving the
+            # stick (making the task much easier), the experiment only counts the
+            # cursor as being over the target if both triggers are released while
+            # over it.
+            if lt < 0.2 and rt < 0.2:
+                return OVER_TARGET
+        return TARGET_ON
+
+
+    def _pp_over_target(self, t, pos, movement, lt, rt, input_time):
+        self._update_movement(t, pos, movement, input_time)
+        self._draw_frame(t.display_pos, True)
+        if not linear_dist(pos, self.target_loc) < (self.cursor_size / 2):
+            return TARGET_ON
+        # If either trigger pressed while over the target, end the trial
+        if lt > 0.5 or rt > 0.5:
+            t.response_rt = precise_time() - t.target_on
+            return RESPONSE
+        return OVER_TARGET
+
+
+    def _imagery_target_on(self, t, pos, movement, lt, rt, input_time):
+        # For MI and CC trials, the screen isn't updated after the target appears
+        self._update_movement(t, pos, movement, input_time)
+        if movement > self.cursor_size:
+            t.err = self.movement_err
+            return ERROR
+        return self._imagery_check_target(t, pos, lt, rt)
+
+
+    def _imagery_check_target(self, t, pos, lt, rt):
+        if not t.contact_rt:
+            if linear_dist(pos, self.target_loc) < (self.cursor_size / 2):
+                t.contact_rt = precise_time() - t.target_on
+        # If either trigger pressed, end the trial
+        if lt > 0.5 or rt > 0.5:
+            t.response_rt = precise_time() - t.target_on
+            return RESPONSE
+        return TARGET_ON
+
+
+    def _update_movement(self, t, pos, movement, input_time):
+        if not movement:
+            return
+        # As soon as cursor moves after target onset, log movement RT
+        if not t.movement_rt:
+            t.movement_rt = input_time - t.target_on
+        # Once cursor has moved slightly away from origin, log initial angle
+        if t.initial_angle is None and px_to_deg(movement) > 1.0:
+            # Wait at least 50 ms after first movement before calculating angle
+            # (otherwise we get lots of 270s due to no y-axis change)
+            if input_time - (t.target_on + t.movement_rt) > 0.05:
+                t.initial_angle = vector_angle(P.screen_c, pos)
+        # Log continuous cursor x/y data, but only for samples where position
+        # actually changes (to save space)
+        if pos != t.last_pos:
+            axis_sample = (
+                (input_time - t.target_on) * 1000, # timestamp (ms)
+                pos[0], # joystick x
+                pos[1], # joystick y
+                t.display_pos[0], # drawn cursor x
+                t.display_pos[1], # drawn cursor y
+            )
+            t.axis_data.append(axis_sample)
+        t.last_pos = pos
+
+
+    def _draw_frame(self, cursor_pos, show_target):
+        stimuli = [(self.fixation, 5, P.screen_c)]
+        if show_target:
+            stimuli.append((self.target, 5, self.target_loc))
+
+        # If using dirty-region rendering, get the region of the screen to repaint
+        # and skip any static stimuli outside of it
+        region = None
+        if self.dirty:
+            cursor_size = self.stim_sizes[id(self.cursor)]
+            cursor_rect = centered_rect(cursor_size, cursor_pos)
+            region = self.dirty.update(cursor_rect, scene=show_target)
+            if region:
+                stimuli = [
+                    (stim, reg, loc) for stim, reg, loc in stimuli
+                    if rects_overlap(
+                        centered_rect(self.stim_sizes[id(stim)], loc), region
+                    )
+                ]
+                self.dirty.begin(region)
+
+        stimuli.append((self.cursor, 5, cursor_pos))
+        fill()
+        self._blit_all(stimuli)
+        if region:
+            self.dirty.end()
+        if self.show_debug:
+            self.show_gamepad_debug()
+        flip()
+        if self.predictor:
+            self.predictor.flipped(precise_time())
+
+
+    def _blit_all(self, stimuli):
+        # Draws a list of (stimulus, registration, location) tuples, using the
+        # stimulus atlas for any stimuli in it (if enabled)
+        if self.atlas:
+            self.atlas.draw(stimuli)
+        else:
+            for stim, registration, location in stimuli:
+                blit(stim, registration, location)
+
+
+    def _save_summary(self):
+        # Writes the running summary for the current phase to the database
+        row = self.summary.row(self.phase)
+        if row:
+            row['participant_id'] = P.participant_id
+            row['block_num'] = P.block_number
+            self.db.insert(row, table='phase_summary')
+        self.summary_saved = True
+
+
+    def _wait_for_controller(self):
+        # Waits for the participant's controller to be reconnected
+        txt = "Controller disconnected!\nPlease reconnect it to continue."
+        msg = message(txt, align="center")
+        while not self.gamepad.connected:
+            ui_request()
+            self.gamepad.update()
+            fill()
+            blit(msg, 5, P.screen_c)
+            flip()
+
+
     def show_gamepad_debug(self):
         if not self.gamepad:
             return
@@ -696,7 +1094,7 @@ class MotorMapping(klibs.Experiment):
             if self.gamepad:
                 self.gamepad.update()
             fill()
-            blit(msg, 5, location)
+            self._blit_all([(msg, 5, location)])
             flip()
         
     
@@ -713,6 +1111,7 @@ class MotorMapping(klibs.Experiment):
             raw_x = int((mouse_x - P.screen_c[0]) * scale_factor)
             raw_y = int((mouse_y - P.screen_c[1]) * scale_factor)
 
+        self.raw_stick = (raw_x, raw_y)
         return joystick_scaled(raw_x, raw_y, rotation=rotation)
 
     
@@ -729,6 +1128,7 @@ class MotorMapping(klibs.Experiment):
                 if self.evm.trial_time_ms > 100:
                     raw_lt, raw_rt = (32767, 32767)
 
+        self.raw_triggers = (raw_lt, raw_rt)
         return (raw_lt / TRIGGER_MAX, raw_rt / TRIGGER_MAX)
 
 
@@ -0,0 +1,266 @@
+"""Computes group-level adaptation statistics with bootstrapping and permutations.
+
+Summarizes each participant's initial movement angle error (the signed
+difference between the initial angle and the target angle, in degrees) for
+each phase of the task, along with the following adaptation measures:
+
+  - learning: the change in error from the pretest to the posttest
+  - aftereffect: the change in error from baseline to washout
+
+Participants are grouped by condition (the trial type of their training
+trials: PP, MI, or CC). For each condition, 95% bootstrap confidence intervals
+are computed for the mean of each phase and measure by resampling participants
+with replacement, and each pair of conditions is compared with a two-sided
+permutation test on the difference of their means. Results are printed and
+saved as a tab-separated file (ExpAssets/Data/adaptation_stats.txt unless
+--out is given). Requires numpy. Usage:
+
+    python tools/adaptation_stats.py [--db PATH] [--out PATH] [--resamples N]
+        [--seed N] [--jobs N] [--scaling]
+
+The participant summaries are computed once, and the --resamples bootstrap and
+permutation resamples (10,000 by default) are split into fixed-size chunks
+that are spread across --jobs worker processes (one per CPU core by default).
+Each chunk has its own random seed derived from --seed, so the results are the
+same no matter how many processes are used. Adding --scaling runs the
+resampling with increasing numbers of processes (up to --jobs) and prints how
+the runtime scales.
+
+"""
+
+import os
+import csv
+import argparse
+from time import perf_counter
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dbutils
+
+
+PHASES = ['baseline', 'pretest', 'training', 'posttest', 'washout']
+CONDITIONS = ['PP', 'MI', 'CC']
+
+# The adaptation measures, as differences between phase means
+CONTRASTS = [('learning', 'posttest', 'pretest'), ('aftereffect', 'washout', 'baseline')]
+
+# The number of resamples drawn in each chunk of work
+CHUNK_SIZE = 1000
+
+# The confidence level for the bootstrap intervals
+CI_LEVEL = 95.0
+
+OUT_PATH = os.path.join(dbutils.DATA_DIR, "adaptation_stats.txt")
+
+
+def angle_error(initial_angle, target_angle):
+    # Gets the signed difference between two angles, from -180 to 180 degrees
+    return (initial_angle - target_angle + 180) % 360 - 180
+
+
+def participant_summaries(conn):
+    # Gets each participant's condition and mean initial angle error for each
+    # phase and adaptation measure (NaN if a participant has no initial angles
+    # for a phase). Returns the participant ids, conditions, and measure names,
+    # and a (participants, measures) array of values.
+    dtype = np.dtype([
+        ('participant_id', 'i8'), ('phase', 'U12'), ('trial_type', 'U4'),
+        ('initial_angle', 'f8'), ('target_angle', 'f8'),
+    ])
+    query = "SELECT {0} FROM trials WHERE err IS NULL".format(", ".join(dtype.names))
+    trials = np.array([tuple(r) for r in conn.execute(query)], dtype=dtype)
+
+    pids, p_idx = np.unique(trials['participant_id'], return_inverse=True)
+    phase_idx = np.array(
+        [PHASES.index(p) if p in PHASES else -1 for p in trials['phase']], dtype=np.intp
+    )
+    error = angle_error(trials['initial_angle'], trials['target_angle'])
+    use = (phase_idx >= 0) & ~np.isnan(error)
+    cells = p_idx[use] * len(PHASES) + phase_idx[use]
+    size = len(pids) * len(PHASES)
+    sums = np.bincount(cells, weights=error[use], minlength=size)
+    counts = np.bincount(cells, minlength=size)
+    with np.errstate(invalid="ignore"):
+        means = (sums / counts).reshape(len(pids), len(PHASES))
+
+    # Each participant's condition is the trial type of their training trials
+    conditions = np.full(len(pids), "", dtype="U4")
+    training = trials['phase'] == "training"
+    conditions[p_idx[training]] = trials['trial_type'][training]
+
+    names = list(PHASES) + [name for name, _, _ in CONTRASTS]
+    diffs = [
+        means[:, PHASES.index(a)] - means[:, PHASES.index(b)] for _, a, b in CONTRASTS
+    ]
+    values = np.column_stack([means] + diffs)
+    return pids, conditions, names, values
+
+
+def _groups(conditions, values):
+    # Gets the non-missing values of each measure for each condition
+    groups = {}
+    for m in range(values.shape[1]):
+        for c in CONDITIONS:
+            v = values[(conditions == c) & ~np.isnan(values[:, m]), m]
+            groups[(m, c)] = v
+    return groups
+
+
+def resample_chunk(conditions, values, seed, n):
+    # Draws 'n' bootstrap resamples of each condition's mean for every measure,
+    # and 'n' label permutations of the difference in means for every pair of
+    # conditions, using the given seed. Returns dicts of arrays of the
+    # resampled means and differences.
+    rng = np.random.default_rng(seed)
+    groups = _groups(conditions, values)
+    boot, perm = ({}, {})
+    for (m, c), v in groups.items():
+        if len(v):
+            idx = rng.integers(0, len(v), size=(n, len(v)))
+            boot[(m, c)] = v[idx].mean(axis=1)
+        else:
+            boot[(m, c)] = np.full(n, np.nan)
+    for m in range(values.shape[1]):
+        for a, b in combinations(CONDITIONS, 2):
+            va, vb = (groups[(m, a)], groups[(m, b)])
+            if not (len(va) and len(vb)):
+                perm[(m, a, b)] = np.full(n, np.nan)
+                continue
+            # Shuffle the pooled values for each permutation, then split them
+            # back into groups of the original sizes
+            pooled = np.tile(np.concatenate([va, vb]), (n, 1))
+            shuffled = rng.permuted(pooled, axis=1)
+            perm[(m, a, b)] = (
+                shuffled[:, :len(va)].mean(axis=1) - shuffled[:, len(va):].mean(axis=1)
+            )
+    return boot, perm
+
+
+def run_resampling(conditions, values, resamples, seed, jobs=None):
+    # Draws all bootstrap and permutation resamples in chunks across a pool of
+    # worker processes. Each chunk is given its own seed from the main seed, so
+    # results don't depend on the number of workers.
+    sizes = [CHUNK_SIZE] * (resamples // CHUNK_SIZE)
+    if resamples % CHUNK_SIZE:
+        sizes.append(resamples % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(resample_chunk, conditions, values, s, n)
+            for s, n in zip(seeds, sizes)
+        ]
+        chunks = [f.result() for f in futures]
+    boot = {k: np.concatenate([c[0][k] for c in chunks]) for k in chunks[0][0]}
+    perm = {k: np.concatenate([c[1][k] for c in chunks]) for k in chunks[0][1]}
+    return boot, perm
+
+
+def summarize(conditions, values, names, boot, perm):
+    # Gets the estimate, confidence interval, and p-value (where applicable) for
+    # each condition and pair of conditions for every measure
+    groups = _groups(conditions, values)
+    tail = (100 - CI_LEVEL) / 2
+    rows = []
+    for m, name in enumerate(names):
+        for c in CONDITIONS:
+            v = groups[(m, c)]
+            low, high = (np.nan, np.nan)
+            if len(v):
+                low, high = np.percentile(boot[(m, c)], [tail, 100 - tail])
+            rows.append({
+                'measure': name, 'group': c, 'n': len(v),
+                'estimate': v.mean() if len(v) else np.nan,
+                'ci_low': low, 'ci_high': high, 'p_value': np.nan,
+            })
+        for a, b in combinations(CONDITIONS, 2):
+            va, vb = (groups[(m, a)], groups[(m, b)])
+            diff, p = (np.nan, np.nan)
+            if len(va) and len(vb):
+                diff = va.mean() - vb.mean()
+                null = perm[(m, a, b)]
+                p = (np.sum(np.abs(null) >= abs(diff) - 1e-12) + 1) / (len(null) + 1)
+            rows.append({
+                'measure': name, 'group': "{0}-{1}".format(a, b),
+                'n': len(va) + len(vb), 'estimate': diff,
+                'ci_low': np.nan, 'ci_high': np.nan, 'p_value': p,
+            })
+    return rows
+
+
+def print_scaling(conditions, values, resamples, seed, max_jobs):
+    # Times the resampling with increasing numbers of worker processes, checking
+    # that the results are identical for each
+    counts = []
+    n = 1
+    while n < max_jobs:
+        counts.append(n)
+        n *= 2
+    counts.append(max_jobs)
+    print("\nResampling runtime by number of processes:")
+    print("  {0:>5}  {1:>8}  {2:>7}  {3}".format("jobs", "seconds", "speedup", "same"))
+    first, base = (None, None)
+    for jobs in counts:
+        start = perf_counter()
+        boot, perm = run_resampling(conditions, values, resamples, seed, jobs)
+        elapsed = perf_counter() - start
+        if first is None:
+            first, base = ((boot, perm), elapsed)
+        same = all(
+            np.array_equal(a[k], b[k], equal_nan=True)
+            for a, b in zip(first, (boot, perm)) for k in a
+        )
+        print("  {0:>5}  {1:>8.2f}  {2:>6.2f}x  {3}".format(
+            jobs, elapsed, base / elapsed, "yes" if same else "NO"
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", type=str, default=dbutils.DB_PATH)
+    parser.add_argument("--out", type=str, default=OUT_PATH)
+    parser.add_argument("--resamples", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--scaling", action="store_true")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    conn = dbutils.connect(args.db)
+    dbutils.check_migrated(conn)
+    pids, conditions, names, values = participant_summaries(conn)
+    conn.close()
+    counts = ", ".join(
+        "{0} {1}".format(np.sum(conditions == c), c) for c in CONDITIONS
+    )
+    print("Summarized {0} participants ({1}) in {2:.2f} s".format(
+        len(pids), counts, perf_counter() - start
+    ))
+
+    start = perf_counter()
+    boot, perm = run_resampling(conditions, values, args.resamples, args.seed, args.jobs)
+    print("Drew {0} resamples with {1} processes in {2:.2f} s".format(
+        args.resamples, args.jobs, perf_counter() - start
+    ))
+    rows = summarize(conditions, values, names, boot, perm)
+
+    cols = ['measure', 'group', 'n', 'estimate', 'ci_low', 'ci_high', 'p_value']
+    print("\n{0:<12} {1:<6} {2:>4} {3:>9} {4:>9} {5:>9} {6:>8}".format(*cols))
+    for row in rows:
+        txt = "{measure:<12} {group:<6} {n:>4} {estimate:>9.2f} {ci_low:>9.2f} "
+        txt += "{ci_high:>9.2f} {p_value:>8.4f}"
+        print(txt.format(**row).replace("nan", "  -"))
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(cols)
+        for row in rows:
+            writer.writerow(["NA" if row[c] != row[c] else row[c] for c in cols])
+    print("\nResults saved to {0}".format(args.out))
+
+    if args.scaling:
+        print_scaling(conditions, values, args.resamples, args.seed, args.jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Shared helpers for the offline data tools in this folder
+
+import os
+import sqlite3
+from urllib.request import pathname2url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT, "ExpAssets", "MotorMapping.db")
+DATA_DIR = os.path.join(ROOT, "ExpAssets", "Data")
+SCHEMA_PATH = os.path.join(ROOT, "ExpAssets", "Config", "MotorMapping_schema.sql")
+
+# Columns stored as text so that they could hold "NA" in databases created
+# before the typed schema (see migrate_db.py), but which otherwise always
+# contain numbers
+NA_NUMERIC = {
+    'trials': [
+        'target_onset', 'movement_rt', 'contact_rt', 'response_rt', 'initial_angle',
+    ],
+    'raw_traces': ['target_on'],
+}
+
+
+def connect(path=None, readonly=True):
+    # Opens a connection to the task database (read-only by default)
+    path = os.path.abspath(path if path else DB_PATH)
+    if not os.path.exists(path):
+        raise IOError("No database found at '{0}'.".format(path))
+    if readonly:
+        uri = "file:{0}?mode=ro".format(pathname2url(path))
+        return sqlite3.connect(uri, uri=True)
+    return sqlite3.connect(path)
+
+
+def participant_ids(conn):
+    # Gets the ids of all participants in the database, in order
+    rows = conn.execute("SELECT id FROM participants ORDER BY id").fetchall()
+    return [r[0] for r in rows]
+
+
+def check_migrated(conn):
+    # Raises an error if the trials table still has the schema from before the
+    # typed schema revision, which stores missing values as "NA" text
+    cols = conn.execute("PRAGMA table_info(trials)").fetchall()
+    if any(c[1] in NA_NUMERIC['trials'] and "text" in c[2].lower() for c in cols):
+        raise RuntimeError(
+            "Database stores missing values as 'NA' (run tools/migrate_db.py to "
+            "convert it)."
+        )
+
+
+def column_types(conn, table):
+    # Gets the name and value type ('int', 'float', 'str', or 'bytes') of each
+    # column in a table, treating columns in NA_NUMERIC as floats
+    types = []
+    na_numeric = NA_NUMERIC.get(table, [])
+    for col in conn.execute("PRAGMA table_info({0})".format(table)).fetchall():
+        name, decl = (col[1], col[2].lower())
+        if name in na_numeric or "float" in decl or "real" in decl:
+            kind = "float"
+        elif "int" in decl:
+            kind = "int"
+        elif "blob" in decl:
+            kind = "bytes"
+        else:
+            kind = "str"
+        types.append((name, kind))
+    return types
+
+
+def clean_column(values, kind):
+    # Converts "NA" strings in a column of values to None, and any numbers
+    # stored as text to floats
+    if kind == "float":
+        return [None if v is None or v == "NA" else float(v) for v in values]
+    elif kind == "str":
+        return [None if v == "NA" else v for v in values]
+    return list(values)
@@ -0,0 +1,366 @@
+"""Exports the task's trial, gamepad, and KVIQ data to partitioned Parquet files.
+
+Each participant's data is read and written by a separate worker process, with
+output partitioned by participant (and by task phase for the trials and
+gamepad tables) using Hive-style folder names:
+
+    <out>/trials/participant_id=<id>/phase=<phase>/part-0.parquet
+    <out>/gamepad/participant_id=<id>/phase=<phase>/part-0.parquet
+    <out>/kviq/participant_id=<id>/part-0.parquet
+
+"NA" values are written as nulls, with any numeric columns stored as text (so
+they could hold "NA") written as floats. The full dataset can then be loaded
+with e.g. `pyarrow.dataset.dataset(path, partitioning="hive")` or
+`pandas.read_parquet(path)`. Requires pyarrow (`pip install pyarrow`). Usage:
+
+    python tools/export_parquet.py [--db PATH] [--out DIR] [--jobs N]
+                                   [--incremental] [--verify] [--chunk-rows N]
+
+Each export also writes a manifest.json to the output folder recording the
+columns and types of each table, along with the row counts, data checksum,
+and export time of each participant. With --incremental, only participants
+that are new or whose row counts have changed since the last export are
+re-exported (and participants no longer in the database are removed), giving
+output identical to a full export. If the columns of any table have changed
+since the last export (e.g. after updating the database with
+tools/migrate_db.py), everything is re-exported instead. With
+--verify, the checksums of all other participants are also checked, catching
+any rows that were modified in place.
+
+To keep memory use bounded regardless of how much data each participant has,
+rows are read from the database and appended to the output files in chunks
+of at most --chunk-rows rows (0 reads each participant's rows all at once).
+Gamepad samples are written in (participant_id, block_num, trial_num, time)
+order.
+
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from time import perf_counter
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import dbutils
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# The tables to export, along with the columns to partition each one by
+TABLES = {
+    'trials': ['participant_id', 'phase'],
+    'gamepad': ['participant_id', 'phase'],
+    'kviq': ['participant_id'],
+}
+
+# The sort order of each table's rows within each participant (by id if not listed)
+ORDER_BY = {
+    'gamepad': 'participant_id, block_num, trial_num, "time", id',
+}
+
+# The maximum number of rows to read from the database at once
+CHUNK_ROWS = 10000
+
+# The name of the file in the output folder listing what has been exported, and
+# the version of the export format (exports with a different format version,
+# chunk size, or table columns are always fully re-exported)
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 3
+
+
+def _arrow_type(kind):
+    return {
+        'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(),
+        'bytes': pa.binary(),
+    }[kind]
+
+
+def output_types(conn, table):
+    # Gets the name and value type of each column exported for a table, adding
+    # a task phase column for tables partitioned by phase that don't have one
+    types = [(name, kind) for name, kind in dbutils.column_types(conn, table)]
+    types = [(name, kind) for name, kind in types if name != 'id']
+    if 'phase' in TABLES[table] and 'phase' not in [name for name, _ in types]:
+        types.append(('phase', 'str'))
+    return types
+
+
+def read_chunks(conn, table, pid, phases, chunk_rows=CHUNK_ROWS):
+    # Reads a table's rows for a participant in chunks of at most 'chunk_rows'
+    # rows (or all at once if 0). Each chunk is returned as both the raw rows
+    # and a list of cleaned column values, with a task phase column added if
+    # the table doesn't have one.
+    types = [(name, kind) for name, kind in dbutils.column_types(conn, table)]
+    types = [(name, kind) for name, kind in types if name != 'id']
+    names = [name for name, kind in types]
+    query = "SELECT {0} FROM {1} WHERE participant_id = ? ORDER BY {2}".format(
+        ", ".join('"{0}"'.format(n) for n in names), table, ORDER_BY.get(table, "id")
+    )
+    add_phase = 'phase' in TABLES[table] and 'phase' not in names
+    cursor = conn.execute(query, (pid,))
+    while True:
+        rows = cursor.fetchmany(chunk_rows) if chunk_rows else cursor.fetchall()
+        if not len(rows):
+            break
+        raw = list(zip(*rows))
+        columns = [dbutils.clean_column(col, kind) for col, (_, kind) in zip(raw, types)]
+        if add_phase:
+            blocks = raw[names.index('block_num')]
+            trials = raw[names.index('trial_num')]
+            columns.append([phases.get(bt) for bt in zip(blocks, trials)])
+        yield rows, columns
+        if not chunk_rows:
+            break
+
+
+class PartitionWriter(object):
+    # Incrementally writes a table's rows to Parquet files, one per partition
+
+    def __init__(self, out_dir, table, types):
+        part_cols = TABLES[table]
+        self._dir = os.path.join(out_dir, table)
+        self._names = [name for name, _ in types]
+        indices = list(enumerate(self._names))
+        self._part_idx = [i for i, name in indices if name in part_cols]
+        self._data_idx = [i for i, name in indices if name not in part_cols]
+        self._schema = pa.schema(
+            [(types[i][0], _arrow_type(types[i][1])) for i in self._data_idx]
+        )
+        self._writers = {}
+
+    def _open(self, key):
+        folder = self._dir
+        for i, value in zip(self._part_idx, key):
+            folder = os.path.join(folder, "{0}={1}".format(self._names[i], value))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "part-0.parquet")
+        return path, pq.ParquetWriter(path, self._schema)
+
+    def write(self, columns):
+        # Split the rows into runs with the same partition values (since rows are
+        # sorted, each partition is usually a single run)
+        keys = list(zip(*[columns[i] for i in self._part_idx]))
+        runs = [(keys[0], 0, len(keys))]
+        if len(set(keys)) > 1:
+            runs = []
+            start = 0
+            for i in range(1, len(keys) + 1):
+                if i == len(keys) or keys[i] != keys[start]:
+                    runs.append((keys[start], start, i))
+                    start = i
+
+        for key, start, end in runs:
+            if key not in self._writers:
+                self._writers[key] = self._open(key)
+            arrays = [
+                pa.array(columns[i][start:end], type=field.type)
+                for i, field in zip(self._data_idx, self._schema)
+            ]
+            arrow_tbl = pa.Table.from_arrays(arrays, schema=self._schema)
+            self._writers[key][1].write_table(arrow_tbl)
+
+    def close(self):
+        # Closes all open files, returning the total number of bytes written
+        written = 0
+        for path, writer in self._writers.values():
+            writer.close()
+            written += os.path.getsize(path)
+        self._writers = {}
+        return written
+
+
+def table_signatures(conn):
+    # Gets the row count and last row id of each participant in each exported
+    # table, which are used to quickly detect new or changed participants
+    sigs = {}
+    for table in TABLES:
+        query = "SELECT participant_id, COUNT(*), MAX(id) FROM {0} GROUP BY {1}"
+        for pid, count, last_id in conn.execute(query.format(table, "participant_id")):
+            sig = sigs.setdefault(pid, {'rows': {}, 'last_id': {}})
+            sig['rows'][table] = count
+            sig['last_id'][table] = last_id
+    for sig in sigs.values():
+        for table in TABLES:
+            sig['rows'].setdefault(table, 0)
+            sig['last_id'].setdefault(table, None)
+    return sigs
+
+
+def export_participant(db_path, out_dir, pid, checksum=None, chunk_rows=CHUNK_ROWS):
+    # Exports all tables for a single participant, returning the participant's
+    # data checksum, along with the number of rows and bytes written. If a
+    # checksum is given, the participant's data is only written if it differs.
+    conn = dbutils.connect(db_path)
+    phase_rows = conn.execute(
+        "SELECT block_num, trial_num, phase FROM trials WHERE participant_id = ?", (pid,)
+    )
+    phases = {(b, t): phase for b, t, phase in phase_rows}
+    result = _export_tables(conn, out_dir, pid, phases, chunk_rows, checksum is None)
+    if checksum is not None and result[0] != checksum:
+        result = _export_tables(conn, out_dir, pid, phases, chunk_rows, True)
+    conn.close()
+    return result
+
+
+def _export_tables(conn, out_dir, pid, phases, chunk_rows, write):
+    # Streams each table's rows for a participant into the checksum and (if
+    # writing) into the participant's Parquet files, one chunk at a time
+    digest = hashlib.sha256()
+    n_rows, n_bytes = (0, 0)
+    for table in TABLES:
+        types = output_types(conn, table)
+        digest.update(repr((table, types)).encode("utf-8"))
+        if write:
+            # Remove any previous export for the participant so no stale files remain
+            remove_participant(out_dir, table, pid)
+            writer = PartitionWriter(out_dir, table, types)
+        for rows, columns in read_chunks(conn, table, pid, phases, chunk_rows):
+            digest.update("".join(map(repr, rows)).encode("utf-8"))
+            if write:
+                writer.write(columns)
+                n_rows += len(rows)
+        if write:
+            n_bytes += writer.close()
+    return digest.hexdigest(), n_rows, n_bytes
+
+
+def remove_participant(out_dir, table, pid):
+    old = os.path.join(out_dir, table, "participant_id={0}".format(pid))
+    if os.path.isdir(old):
+        shutil.rmtree(old)
+
+
+def load_manifest(out_dir, chunk_rows, types):
+    # Loads the export manifest for an output folder, returning None if there
+    # isn't one or it was written with a different format version, chunk size,
+    # or set of table columns & types
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        content = json.load(f)
+    if content.get('version') != MANIFEST_VERSION or content['chunk_rows'] != chunk_rows:
+        return None
+    if content['types'] != types:
+        return None
+    return {int(pid): info for pid, info in content['participants'].items()}
+
+
+def save_manifest(out_dir, manifest, chunk_rows, types):
+    # Writes the manifest to a temporary file first so that an interrupted
+    # export never leaves a truncated manifest behind
+    path = os.path.join(out_dir, MANIFEST)
+    content = {
+        'version': MANIFEST_VERSION,
+        'chunk_rows': chunk_rows,
+        'types': types,
+        'participants': {str(pid): manifest[pid] for pid in sorted(manifest)},
+    }
+    with open(path + ".tmp", "w") as f:
+        json.dump(content, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def export_all(db_path, out_dir, incremental=False, verify=False, jobs=None,
+               chunk_rows=CHUNK_ROWS):
+    # Exports participants in parallel and updates the manifest, returning the
+    # number of participants exported, along with the total number of rows
+    # and bytes written. In incremental mode, only participants that are new
+    # or whose row counts have changed since the last export are processed
+    # (or, if verifying, those whose data checksums have changed).
+    conn = dbutils.connect(db_path)
+    pids = dbutils.participant_ids(conn)
+    sigs = table_signatures(conn)
+    # Stored as lists of [name, type] pairs so they compare equal after a JSON
+    # round trip
+    types = {t: [list(col) for col in output_types(conn, t)] for t in TABLES}
+    conn.close()
+
+    manifest = load_manifest(out_dir, chunk_rows, types) if incremental else None
+    if manifest is None:
+        manifest = {}
+        for table in TABLES:
+            if os.path.isdir(os.path.join(out_dir, table)):
+                shutil.rmtree(os.path.join(out_dir, table))
+    todo = []
+    for pid in pids:
+        empty = {'rows': {t: 0 for t in TABLES}, 'last_id': {t: None for t in TABLES}}
+        sig = sigs.get(pid, empty)
+        prev = manifest.get(pid)
+        if prev and prev['rows'] == sig['rows'] and prev['last_id'] == sig['last_id']:
+            if not verify:
+                continue
+            todo.append((pid, sig, prev['checksum']))
+        else:
+            todo.append((pid, sig, None))
+
+    # Remove any participants that are no longer in the database
+    for pid in set(manifest) - set(pids):
+        for table in TABLES:
+            remove_participant(out_dir, table, pid)
+        del manifest[pid]
+
+    exported, n_rows, n_bytes = (0, 0, 0)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(export_participant, db_path, out_dir, pid, checksum, chunk_rows)
+            for pid, sig, checksum in todo
+        ]
+        for (pid, sig, old_checksum), f in zip(todo, futures):
+            checksum, rows, size = f.result()
+            if checksum == old_checksum:
+                continue
+            exported += 1
+            n_rows += rows
+            n_bytes += size
+            manifest[pid] = {
+                'rows': sig['rows'],
+                'last_id': sig['last_id'],
+                'checksum': checksum,
+                'exported': datetime.now().isoformat(timespec="seconds"),
+            }
+    os.makedirs(out_dir, exist_ok=True)
+    save_manifest(out_dir, manifest, chunk_rows, types)
+    return exported, n_rows, n_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", type=str, default=dbutils.DB_PATH)
+    default_out = os.path.join(dbutils.DATA_DIR, "parquet")
+    parser.add_argument("--out", type=str, default=default_out)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--verify", action="store_true")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if pa is None:
+        raise RuntimeError(
+            "pyarrow is required for Parquet export (install with 'pip install pyarrow')."
+        )
+
+    start = perf_counter()
+    incremental = args.incremental or args.verify
+    exported, n_rows, n_bytes = export_all(
+        args.db, args.out, incremental, args.verify, args.jobs, args.chunk_rows
+    )
+    elapsed = perf_counter() - start
+
+    print("Exported {0} participants ({1} rows, {2:.1f} MB) to {3}".format(
+        exported, n_rows, n_bytes / 1e6, args.out
+    ))
+    print("Elapsed: {0:.2f} s ({1:.0f} rows/s, {2:.1f} participants/s)".format(
+        elapsed, n_rows / elapsed if elapsed else 0, exported / elapsed if elapsed else 0
+    ))
+
+
+if __name__ == "__main__":
+    main()
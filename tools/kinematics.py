@@ -0,0 +1,289 @@
+"""Computes kinematic measures for every trial and saves them to the database.
+
+Reads the cursor trajectories for all trials from the gamepad table in bulk
+and computes the following for each trial in a single vectorized pass:
+
+  - peak_velocity: the peak cursor speed (degrees/s)
+  - time_to_peak: the time from movement onset to peak speed (ms)
+  - path_length: the total distance travelled by the cursor (degrees)
+  - max_deviation: the largest perpendicular distance of the cursor from the
+    straight line between the start position and the target (degrees)
+  - endpoint_error: the distance between the final cursor position and the
+    target (degrees)
+  - movement_time: the time from movement onset to the last cursor movement (ms)
+
+Trajectories start from the middle of the screen, and speeds are computed
+between consecutive logged samples (i.e. cursor positions that changed). Since
+the screen size isn't stored in the database, each participant's screen
+centre and pixels-per-degree are recovered from the targets' pixel locations,
+distances, and angles. Trials whose trajectories were simplified by the task
+(see trajectory_tolerance in the params file) are missing samples that these
+measures depend on, so their measures are left empty. Results are written to
+the trial_kinematics table (replacing any existing rows for the same
+participants), which can be added to older databases with tools/migrate_db.py.
+Requires numpy. Usage:
+
+    python tools/kinematics.py [--db PATH] [--batch N] [--jobs N]
+
+Participants are processed in batches of --batch participants (25 by default)
+spread across --jobs worker processes (one per CPU core by default).
+
+"""
+
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dbutils
+
+
+# The measures computed for each trial, in table column order
+MEASURES = [
+    'peak_velocity', 'time_to_peak', 'path_length', 'max_deviation',
+    'endpoint_error', 'movement_time',
+]
+
+# The maximum number of participants to process in a single pass
+BATCH_SIZE = 25
+
+# The trial info needed to compute the measures
+TRIAL_COLS = [
+    ('target_x', 'f8'), ('target_y', 'f8'), ('target_dist', 'f8'), ('target_angle', 'f8'),
+]
+
+# The data type for cursor samples read from the database
+SAMPLE_DTYPE = np.dtype([
+    ('participant_id', 'i8'), ('block_num', 'i8'), ('trial_num', 'i8'),
+    ('time', 'f8'), ('x', 'f8'), ('y', 'f8'),
+])
+
+
+def trial_keys(pid, block, trial):
+    # Combines participant, block and trial numbers into single sortable keys
+    pid, block, trial = (np.asarray(a, dtype=np.int64) for a in (pid, block, trial))
+    return (pid << 32) | (block << 16) | trial
+
+
+def segment_reduce(ufunc, values, ids, n):
+    # Reduces an array of values grouped by sorted integer ids (e.g. getting
+    # the maximum value for each trial), returning NaN for ids with no values
+    out = np.full(n, np.nan)
+    if not len(ids):
+        return out
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    out[ids[starts]] = ufunc.reduceat(values, starts)
+    return out
+
+
+def screen_geometry(target_x, target_y, target_dist, target_angle):
+    # Recovers the screen centre (in pixels) and pixels-per-degree for a set of
+    # trials from their targets' locations, distances (in degrees) and angles
+    # (0 is up, 90 is right), which are related by:
+    #   x = cx + ppd * dist * sin(angle), y = cy - ppd * dist * cos(angle)
+    n = len(target_x)
+    if n < 2:
+        return (np.nan, np.nan), np.nan
+    rad = np.radians(target_angle)
+    a = np.zeros((2 * n, 3))
+    a[:n, 0] = 1
+    a[n:, 1] = 1
+    a[:n, 2] = target_dist * np.sin(rad)
+    a[n:, 2] = -target_dist * np.cos(rad)
+    b = np.concatenate([target_x, target_y]).astype(np.float64)
+    (cx, cy, ppd), _, _, _ = np.linalg.lstsq(a, b, rcond=None)
+    return (cx, cy), ppd
+
+
+def compute_kinematics(ids, t, x, y, origins, targets, ppd):
+    # Computes the kinematic measures for a set of cursor trajectories at once.
+    # 'ids' is the trial index of each sample (with each trial's samples stored
+    # contiguously in time order), 't' is each sample's time in ms, and 'x' and
+    # 'y' are the cursor positions in pixels. 'origins' and 'targets' are the
+    # (n_trials, 2) start and target positions, and 'ppd' is the pixels per
+    # degree for each trial. Returns a dict of arrays of the number of samples
+    # and each measure for each trial, with NaN for trials without enough data.
+    n = len(targets)
+    ids = np.asarray(ids, dtype=np.intp)
+    t, x, y = (np.asarray(a, dtype=np.float64) for a in (t, x, y))
+    out = {'samples': np.bincount(ids, minlength=n)}
+    if not len(ids):
+        for m in MEASURES:
+            out[m] = np.full(n, np.nan)
+        return out
+
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)] - 1
+    first, last = (np.full(n, -1), np.full(n, -1))
+    first[ids[starts]] = starts
+    last[ids[ends]] = ends
+    has_data = first >= 0
+    ox, oy = (origins[ids, 0], origins[ids, 1])
+
+    # Distances between consecutive samples within each trial (plus the distance
+    # from the start position to each trial's first sample)
+    same = ids[1:] == ids[:-1]
+    step = np.hypot(np.diff(x), np.diff(y))
+    path = segment_reduce(np.add, step[same], ids[1:][same], n)
+    path[np.isnan(path) & has_data] = 0
+    first_step = np.hypot(x[first] - origins[:, 0], y[first] - origins[:, 1])
+    out['path_length'] = np.where(has_data, path + first_step, np.nan)
+
+    # Speed between each pair of consecutive samples, timed at their midpoint
+    dt = np.diff(t)
+    valid = same & (dt > 0)
+    speed = step[valid] / dt[valid] * 1000
+    speed_ids = ids[1:][valid]
+    speed_t = (t[1:][valid] + t[:-1][valid]) / 2
+    peak = segment_reduce(np.maximum, speed, speed_ids, n)
+    at_peak = np.flatnonzero(speed == peak[speed_ids])
+    peak_i = segment_reduce(np.minimum, at_peak, speed_ids[at_peak], n)
+    has_peak = ~np.isnan(peak_i)
+    onset = np.where(has_data, t[first], np.nan)
+    out['peak_velocity'] = peak
+    out['time_to_peak'] = np.full(n, np.nan)
+    out['time_to_peak'][has_peak] = (
+        speed_t[peak_i[has_peak].astype(np.intp)] - onset[has_peak]
+    )
+
+    # Perpendicular distance of each sample from the start-target line
+    line = targets - origins
+    line_len = np.hypot(line[:, 0], line[:, 1])
+    cross = line[ids, 0] * (y - oy) - line[ids, 1] * (x - ox)
+    deviation = np.abs(cross) / line_len[ids]
+    out['max_deviation'] = segment_reduce(np.maximum, deviation, ids, n)
+
+    # Final position error and movement duration
+    out['endpoint_error'] = np.where(
+        has_data, np.hypot(x[last] - targets[:, 0], y[last] - targets[:, 1]), np.nan
+    )
+    out['movement_time'] = np.where(has_data, t[last] - onset, np.nan)
+
+    # Convert distances to degrees
+    for m in ['path_length', 'max_deviation', 'endpoint_error', 'peak_velocity']:
+        out[m] = out[m] / ppd
+    return out
+
+
+def load_trajectories(conn, pids, trial_cols):
+    # Reads the info for each trial of a set of participants along with their
+    # cursor samples, in order. Returns the trials as a structured array (with
+    # participant_id, block_num, trial_num, the requested trial columns given
+    # as (name, dtype) tuples, and the trajectory_tolerance each trial's
+    # samples were simplified with, or NaN if they weren't), the samples as a
+    # structured array (see SAMPLE_DTYPE), and the index of the trial for each
+    # sample.
+    where = "participant_id IN ({0})".format(", ".join(str(int(p)) for p in pids))
+    trial_dtype = np.dtype(
+        [('participant_id', 'i8'), ('block_num', 'i8'), ('trial_num', 'i8')] +
+        trial_cols + [('trajectory_tolerance', 'f8')]
+    )
+    # Databases from before trajectories could be simplified have no tolerances
+    cols = [c[1] for c in conn.execute("PRAGMA table_info(trials)").fetchall()]
+    names = list(trial_dtype.names)
+    if 'trajectory_tolerance' not in cols:
+        names[-1] = "NULL"
+    query = "SELECT {0} FROM trials WHERE {1} ORDER BY {2}".format(
+        ", ".join(names), where, "participant_id, block_num, trial_num"
+    )
+    rows = [tuple(r) for r in conn.execute(query)]
+    trials = np.array(rows, dtype=trial_dtype)
+    query = (
+        'SELECT participant_id, block_num, trial_num, "time", stick_x, stick_y '
+        'FROM gamepad WHERE {0} ORDER BY participant_id, block_num, trial_num, "time"'
+    )
+    samples = np.fromiter(conn.execute(query.format(where)), dtype=SAMPLE_DTYPE)
+
+    keys = trial_keys(trials['participant_id'], trials['block_num'], trials['trial_num'])
+    sample_keys = trial_keys(
+        samples['participant_id'], samples['block_num'], samples['trial_num']
+    )
+    ids = np.minimum(np.searchsorted(keys, sample_keys), max(len(keys) - 1, 0))
+    matched = keys[ids] == sample_keys if len(keys) else np.zeros(len(ids), bool)
+    return trials, samples[matched], ids[matched]
+
+
+def trial_geometry(trials):
+    # Gets the start position of the cursor and pixels-per-degree for each trial
+    origins = np.full((len(trials), 2), np.nan)
+    ppd = np.full(len(trials), np.nan)
+    for pid in np.unique(trials['participant_id']):
+        rows = trials['participant_id'] == pid
+        t = trials[rows]
+        centre, ppd[rows] = screen_geometry(
+            t['target_x'], t['target_y'], t['target_dist'], t['target_angle']
+        )
+        origins[rows] = centre
+    return origins, ppd
+
+
+def process_batch(db_path, pids):
+    # Computes the kinematics for all trials of a set of participants
+    conn = dbutils.connect(db_path)
+    trials, samples, ids = load_trajectories(conn, pids, TRIAL_COLS)
+    conn.close()
+    origins, ppd = trial_geometry(trials)
+    targets = np.column_stack([trials['target_x'], trials['target_y']])
+    results = compute_kinematics(
+        ids, samples['time'], samples['x'], samples['y'], origins, targets, ppd
+    )
+    simplified = ~np.isnan(trials['trajectory_tolerance'])
+    for m in MEASURES:
+        results[m][simplified] = np.nan
+    cols = ['participant_id', 'block_num', 'trial_num', 'trajectory_tolerance']
+    return trials[cols], results
+
+
+def save_results(conn, pids, trials, results):
+    # Replaces the kinematics rows for a set of participants
+    cols = ['participant_id', 'block_num', 'trial_num', 'samples'] + MEASURES
+    where = "participant_id IN ({0})".format(", ".join(str(int(p)) for p in pids))
+    columns = [trials[c].tolist() for c in cols[:3]] + [results['samples'].tolist()]
+    for m in MEASURES:
+        values = results[m]
+        columns.append([None if v != v else v for v in values.tolist()])
+    with conn:
+        conn.execute("DELETE FROM trial_kinematics WHERE {0}".format(where))
+        conn.executemany("INSERT INTO trial_kinematics ({0}) VALUES ({1})".format(
+            ", ".join(cols), ", ".join(["?"] * len(cols))
+        ), zip(*columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", type=str, default=dbutils.DB_PATH)
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE)
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    conn = dbutils.connect(args.db, readonly=False)
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master")]
+    if "trial_kinematics" not in tables:
+        raise RuntimeError(
+            "Database has no trial_kinematics table (run tools/migrate_db.py to add it)."
+        )
+
+    start = perf_counter()
+    pids = dbutils.participant_ids(conn)
+    batches = [pids[i:i + args.batch] for i in range(0, len(pids), args.batch)]
+    n_trials, n_simplified = (0, 0)
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(process_batch, args.db, batch) for batch in batches]
+        for batch, f in zip(batches, futures):
+            trials, results = f.result()
+            save_results(conn, batch, trials, results)
+            n_trials += len(trials)
+            n_simplified += int(np.sum(~np.isnan(trials['trajectory_tolerance'])))
+    conn.close()
+    elapsed = perf_counter() - start
+    print("Computed kinematics for {0} trials ({1} participants) in {2:.2f} s".format(
+        n_trials, len(pids), elapsed
+    ))
+    if n_simplified:
+        txt = "Skipped {0} trials with simplified trajectories (no measures saved)"
+        print(txt.format(n_simplified))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Updates an existing task database in place to match the current schema.
+
+Running `klibs db-rebuild` after changing MotorMapping_schema.sql deletes all
+recorded data. This script instead compares each table in the database with
+the schema file and rebuilds any table whose columns differ, copying every row
+across with its original id. Columns that used to be stored as text so that
+they could hold "NA" are converted to numbers, with "NA" values (and "NA"
+strings in columns that are now nullable) becoming NULLs. Columns added since
+a table was created are left empty for existing rows, set to their default
+values in the schema, or filled in from the row's other columns where
+possible (see FILLED_COLUMNS). Tables and indexes missing from the database
+are created.
+
+The whole migration runs in a single transaction, and row counts are checked
+before committing. A backup copy of the database is saved next to it first
+(as e.g. MotorMapping.db.bak) unless --no-backup is given. The migration will
+refuse to run if it would drop a column containing data, or add a required
+column with no default or way to fill it in for existing rows. Usage:
+
+    python tools/migrate_db.py [--db PATH] [--check] [--no-backup]
+
+"""
+
+import re
+import sqlite3
+import argparse
+
+import dbutils
+
+
+# SQL expressions for filling in columns added to existing tables, by table
+FILLED_COLUMNS = {
+    # Older versions of the task always drew the cursor at the joystick position
+    'gamepad': {'display_x': '"stick_x"', 'display_y': '"stick_y"'},
+}
+
+
+def _load_schema(path):
+    # Loads the CREATE statements and column info for each table and index in
+    # a schema file, by running it on an empty in-memory database
+    schema = sqlite3.connect(":memory:")
+    with open(path, "r") as f:
+        schema.executescript(f.read())
+    tables, indexes = ({}, {})
+    query = "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE sql IS NOT NULL"
+    for kind, name, table, sql in schema.execute(query).fetchall():
+        if kind == "table" and name != "sqlite_sequence":
+            tables[name] = (sql, _table_info(schema, name))
+        elif kind == "index":
+            indexes[name] = (table, sql)
+    schema.close()
+    return tables, indexes
+
+
+def _table_info(conn, table):
+    # Gets the (name, type, not_null, default) info for each column of a table
+    cols = conn.execute('PRAGMA table_info("{0}")'.format(table)).fetchall()
+    return [(c[1], c[2].lower(), bool(c[3]), c[4]) for c in cols]
+
+
+def _is_numeric(decl):
+    return any(t in decl for t in ["int", "float", "real", "double", "num"])
+
+
+def _column_expr(name, old, new):
+    # Gets the SQL expression for copying a column's values into its new format
+    old_type, old_notnull = old
+    new_type, new_notnull = new
+    expr = '"{0}"'.format(name)
+    to_numeric = _is_numeric(new_type) and not _is_numeric(old_type)
+    if not new_notnull and not _is_numeric(old_type) and (to_numeric or old_notnull):
+        expr = "NULLIF({0}, 'NA')".format(expr)
+    if to_numeric:
+        cast = "INTEGER" if "int" in new_type else "REAL"
+        expr = "CAST({0} AS {1})".format(expr, cast)
+    return expr
+
+
+def plan_migration(conn, schema_path):
+    # Compares a database with the schema, returning a list of (table, action,
+    # details) tuples describing the changes needed. Raises an error if any
+    # change would lose data.
+    tables, indexes = _load_schema(schema_path)
+    existing = [
+        r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    ]
+    changes = []
+    for table, (sql, new_cols) in tables.items():
+        if table not in existing:
+            changes.append((table, "create", sql))
+            continue
+        old_cols = _table_info(conn, table)
+        if old_cols == new_cols:
+            continue
+        old = {name: (decl, notnull) for name, decl, notnull, _ in old_cols}
+        new = {name: (decl, notnull) for name, decl, notnull, _ in new_cols}
+        defaults = [name for name, _, _, default in new_cols if default is not None]
+        dropped = [name for name in old if name not in new]
+        for name in dropped:
+            query = 'SELECT COUNT(*) FROM "{0}" WHERE "{1}" IS NOT NULL'
+            if conn.execute(query.format(table, name)).fetchone()[0]:
+                e = "Migrating the '{0}' table would drop data in column '{1}'."
+                raise RuntimeError(e.format(table, name))
+        fills = {
+            name: expr for name, expr in FILLED_COLUMNS.get(table, {}).items()
+            if name in new and name not in old
+        }
+        missing = [
+            name for name in new if name not in old and new[name][1]
+            and name not in fills and name not in defaults
+        ]
+        n_rows = conn.execute('SELECT COUNT(*) FROM "{0}"'.format(table)).fetchone()[0]
+        if missing and n_rows:
+            e = "Required column(s) {0} missing from existing rows of the '{1}' table."
+            raise RuntimeError(e.format(", ".join(missing), table))
+        copied = [name for name in new if name in old]
+        exprs = [_column_expr(name, old[name], new[name]) for name in copied]
+        copied += list(fills.keys())
+        exprs += list(fills.values())
+        changes.append((table, "rebuild", (sql, copied, exprs)))
+
+    existing_idx = [
+        r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    ]
+    rebuilt = [table for table, action, _ in changes if action == "rebuild"]
+    for name, (table, sql) in indexes.items():
+        if name not in existing_idx or table in rebuilt:
+            changes.append((table, "index", sql))
+    return changes
+
+
+def _rebuild_table(conn, table, sql, copied, exprs):
+    # Rebuilds a table with a new definition, copying over all existing rows
+    tmp = "_migrate_{0}".format(table)
+    seq_query = "SELECT seq FROM sqlite_sequence WHERE name = ?"
+    seq = conn.execute(seq_query, (table,)).fetchone()
+    name_pattern = r"^(CREATE TABLE\s+)\"?{0}\"?".format(re.escape(table))
+    tmp_sql = re.sub(
+        name_pattern, r'\g<1>"{0}"'.format(tmp), sql, count=1, flags=re.IGNORECASE
+    )
+    conn.execute(tmp_sql)
+    conn.execute('INSERT INTO "{0}" ({1}) SELECT {2} FROM "{3}"'.format(
+        tmp, ", ".join('"{0}"'.format(c) for c in copied), ", ".join(exprs), table
+    ))
+    old_count = conn.execute('SELECT COUNT(*) FROM "{0}"'.format(table)).fetchone()[0]
+    new_count = conn.execute('SELECT COUNT(*) FROM "{0}"'.format(tmp)).fetchone()[0]
+    if old_count != new_count:
+        e = "Row count mismatch when migrating '{0}' ({1} vs {2})."
+        raise RuntimeError(e.format(table, old_count, new_count))
+    conn.execute('DROP TABLE "{0}"'.format(table))
+    conn.execute('ALTER TABLE "{0}" RENAME TO "{1}"'.format(tmp, table))
+    # Keep the table's autoincrement counter, so ids of deleted rows aren't reused
+    if seq:
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (seq[0], table))
+    return new_count
+
+
+def migrate(conn, changes):
+    # Applies a list of planned changes to a database in a single transaction
+    conn.isolation_level = None
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("BEGIN")
+    try:
+        for table, action, details in changes:
+            if action == "create":
+                conn.execute(details)
+            elif action == "rebuild":
+                n = _rebuild_table(conn, table, *details)
+                print("Converted {0} rows in the '{1}' table.".format(n, table))
+            elif action == "index":
+                conn.execute(details)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    # Update the query planner's statistics so the new indexes get used
+    conn.execute("ANALYZE")
+
+
+def describe(changes):
+    for table, action, details in changes:
+        if action == "create":
+            print("  - Create table '{0}'".format(table))
+        elif action == "rebuild":
+            cols = [(c, e, '"{0}"'.format(c)) for c, e in zip(*details[1:])]
+            converted = [c for c, e, q in cols if e != q and q in e]
+            filled = [c for c, e, q in cols if q not in e]
+            txt = "  - Rebuild table '{0}'".format(table)
+            if len(converted):
+                txt += " (converting {0})".format(", ".join(converted))
+            if len(filled):
+                txt += " (filling in {0})".format(", ".join(filled))
+            print(txt)
+        elif action == "index":
+            name = re.search(r"INDEX\s+(\S+)", details, re.IGNORECASE).group(1)
+            print("  - Create index '{0}' on '{1}'".format(name, table))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", type=str, default=dbutils.DB_PATH)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--no-backup", action="store_true")
+    args = parser.parse_args()
+
+    conn = dbutils.connect(args.db, readonly=False)
+    changes = plan_migration(conn, dbutils.SCHEMA_PATH)
+    if not len(changes):
+        print("Database is already up to date.")
+        return
+    print("Changes needed to match the current schema:")
+    describe(changes)
+    if args.check:
+        return
+
+    if not args.no_backup:
+        backup_path = args.db + ".bak"
+        backup = sqlite3.connect(backup_path)
+        conn.backup(backup)
+        backup.close()
+        print("Saved backup to {0}".format(backup_path))
+    migrate(conn, changes)
+    conn.close()
+    print("Migration complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Recomputes movement RTs, initial angles, and contact RTs under different criteria.
+
+During each trial, the task records the following using fixed criteria (see
+_update_movement() and the target checks in experiment.py):
+
+  - movement_rt: the time of the first cursor movement after target onset (ms)
+  - initial_angle: the angle of the cursor from the middle of the screen once
+    it's more than 1 degree away, at least 50 ms after movement onset
+  - contact_rt: the time the cursor first comes within half the cursor's width
+    (cursor_size, 1 degree) of the target's centre (ms)
+
+This script recomputes these from the cursor trajectories in the gamepad table
+for every combination of the given criteria:
+
+  --onset-dist: the distance (degrees) the cursor needs to move from the middle
+    of the screen to count as movement onset (default 0, i.e. any movement)
+  --angle-dist: the distance (degrees) the cursor needs to be from the middle
+    of the screen before taking its initial angle (default 1.0)
+  --angle-delay: the minimum time (ms) after movement onset before taking the
+    initial angle (default 50)
+  --contact-size: the width (degrees) of the cursor for target contact
+    (default 1.0)
+
+Each option takes one or more values. All trials are processed at once for
+each set of criteria, with the sets spread across --jobs worker processes (one
+per CPU core by default). Results are saved as a tab-separated file with one
+row per trial for each set of criteria ("NA" for missing values), written to
+ExpAssets/Data/recomputed_measures.txt unless --out is given. Requires numpy.
+Usage:
+
+    python tools/recompute_measures.py [--db PATH] [--out PATH] [--jobs N]
+        [--check] [--onset-dist DEG ...] [--angle-dist DEG ...]
+        [--angle-delay MS ...] [--contact-size DEG ...]
+
+With the task's own criteria, the recomputed movement RTs and initial angles
+should match the recorded ones, which can be checked for a database with
+--check. The task checks the initial angle criteria every frame but only logs
+cursor samples when the cursor moves, so if the cursor was held still past the
+delay, the frame it was taken on is worked out from each participant's frame
+interval (estimated from their samples). Frames landing right at the end of the
+delay could have gone either way, so --check accepts either angle for those.
+Since the task measures contact RT when the frame showing the contact has been
+drawn, recomputed contact RTs are the time of the cursor sample that reached
+the target instead (--check confirms it was the same sample). Note that older
+versions of the task logged cursor sample times in whole ms, so RTs recomputed
+from them are truncated to the ms. Trials whose trajectories were simplified by
+the task (see trajectory_tolerance in the params file) are missing the samples
+these measures depend on, so they aren't recomputed or checked ("NA" in the
+output).
+
+"""
+
+import os
+import csv
+import argparse
+from time import perf_counter
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dbutils
+import kinematics
+
+
+# The criteria that can be varied, along with the values used by the task
+CRITERIA = [
+    ('onset_dist', 0.0), ('angle_dist', 1.0), ('angle_delay', 50.0),
+    ('contact_size', 1.0),
+]
+
+# The recomputed measures, in output column order
+MEASURES = ['movement_rt', 'initial_angle', 'contact_rt']
+
+# The trial info needed to recompute (and check) the measures
+TRIAL_COLS = kinematics.TRIAL_COLS + [
+    ('movement_rt', 'f8'), ('initial_angle', 'f8'), ('contact_rt', 'f8'), ('err', 'O'),
+]
+
+OUT_PATH = os.path.join(dbutils.DATA_DIR, "recomputed_measures.txt")
+
+# The trajectory data shared with each worker process
+_data = None
+
+
+def task_geometry(trials):
+    # Recovers the screen centre and pixels-per-degree used by the task for each
+    # trial. Target locations are rounded down to whole pixels by the task, so
+    # their centres are used for the initial least-squares estimate. Since target
+    # distances are also whole numbers of pixels (but stored in degrees), the
+    # exact pixels-per-degree is the one around that estimate that makes every
+    # target distance a whole number of pixels.
+    centred = trials.copy()
+    for col in ['target_x', 'target_y']:
+        centred[col] = trials[col] + 0.5
+    origins, ppd = kinematics.trial_geometry(centred)
+    for pid in np.unique(trials['participant_id']):
+        rows = trials['participant_id'] == pid
+        dist = trials['target_dist'][rows]
+        candidates = ppd[rows][0] * np.linspace(0.98, 1.02, 4001)
+        px = np.outer(candidates, dist)
+        best = candidates[np.argmin(np.sum(np.abs(px - np.round(px)), axis=1))]
+        ppd[rows] = np.median(np.round(dist * best) / dist)
+    return np.round(origins), ppd
+
+
+def first_sample(mask, ids, n):
+    # Gets the index of the first sample in each trial meeting a condition,
+    # or -1 for trials without any
+    idx = np.flatnonzero(mask)
+    first = kinematics.segment_reduce(np.minimum, idx, ids[idx], n)
+    return np.where(np.isnan(first), -1, first).astype(np.intp)
+
+
+def frame_intervals(trials, ids, t):
+    # Estimates the task's frame interval (ms) for each trial. The cursor moves
+    # (and so is logged) on most frames during a reach, so the median time
+    # between consecutive samples in a participant's trials is a single frame.
+    same = ids[1:] == ids[:-1]
+    gaps = np.diff(t)[same]
+    gap_pids = trials['participant_id'][ids[1:][same]]
+    frame_ms = np.full(len(trials), np.nan)
+    for pid in np.unique(gap_pids):
+        frame_ms[trials['participant_id'] == pid] = np.median(gaps[gap_pids == pid])
+    return frame_ms
+
+
+def held_samples(t, ids, before, mark, frame_ms):
+    # Gets the index of the sample the cursor was still held at on the first
+    # frame after a given time in each trial (the last sample before it), or -1
+    # for trials where the cursor moved on that frame. Samples are only logged
+    # when the cursor moves, so whether a frame went by without one is worked
+    # out from the trial's frame interval, assuming evenly spaced frames.
+    n = len(mark)
+    idx = np.flatnonzero(before)
+    last = kinematics.segment_reduce(np.maximum, idx, ids[idx], n)
+    held = np.where(np.isnan(last), -1, last).astype(np.intp)
+    h = held[held >= 0]
+    nxt = np.minimum(h + 1, len(t) - 1)
+    next_t = np.where((nxt > h) & (ids[nxt] == ids[h]), t[nxt], np.inf)
+    frame = frame_ms[ids[h]]
+    next_frame = t[h] + (np.floor((mark[ids[h]] - t[h]) / frame) + 1) * frame
+    held[held >= 0] = np.where(next_frame < next_t - frame / 2, h, -1)
+    return held
+
+
+def find_samples(data, criteria):
+    # Finds the sample at which each trial's movement onset, initial angle, and
+    # target contact occur with a given set of criteria, using the same checks
+    # as the task. 'data' is a tuple of the trial index, time, and x/y position
+    # of each sample, and the screen centre, target location, pixels per degree
+    # and frame interval for each trial.
+    ids, t, x, y, origins, targets, ppd, frame_ms = data
+    onset_dist, angle_dist, angle_delay, contact_size = criteria
+    n = len(ppd)
+    dx, dy = (x - origins[ids, 0], y - origins[ids, 1])
+    dist = np.sqrt(dx * dx + dy * dy) / ppd[ids]
+
+    onset = first_sample(dist > onset_dist, ids, n)
+    movement_rt = np.where(onset >= 0, t[onset], np.nan)
+    waited = (t - movement_rt[ids]) > angle_delay
+    angle = first_sample((dist > angle_dist) & waited, ids, n)
+    # The task checks the angle every frame, so if the cursor was held still
+    # past the delay, the angle was taken from the sample it was held at
+    before = ~waited & (onset[ids] >= 0)
+    held = held_samples(t, ids, before, movement_rt + angle_delay, frame_ms)
+    angle = np.where((held >= 0) & (dist[held] > angle_dist), held, angle)
+
+    # The cursor width in pixels is rounded down, like klibs' deg_to_px()
+    radius = np.floor(contact_size * ppd) / 2
+    tx, ty = (x - targets[ids, 0], y - targets[ids, 1])
+    contact = first_sample(np.sqrt(tx * tx + ty * ty) < radius[ids], ids, n)
+    return onset, angle, contact
+
+
+def recompute(data, criteria):
+    # Recomputes the measures for all trials with a given set of criteria
+    ids, t, x, y, origins, _, _, _ = data
+    onset, angle, contact = find_samples(data, criteria)
+    # Angles are clockwise from straight up, like vector_angle() in the task
+    dx, dy = (x[angle] - origins[:, 0], y[angle] - origins[:, 1])
+    initial_angle = np.degrees(np.arctan2(dx, -dy)) % 360
+    return {
+        'movement_rt': np.where(onset >= 0, t[onset], np.nan),
+        'initial_angle': np.where(angle >= 0, initial_angle, np.nan),
+        'contact_rt': np.where(contact >= 0, t[contact], np.nan),
+    }
+
+
+def check_runtime(trials, data):
+    # Compares the measures recomputed with the task's criteria to the ones
+    # recorded during the task, returning the number of trials compared and the
+    # number of mismatches for each measure
+    ids, t, _, _, _, _, _, _ = data
+    simplified = ~np.isnan(trials['trajectory_tolerance'])
+    recorded = np.equal(trials['err'], None) & ~simplified
+    defaults = [value for _, value in CRITERIA]
+    new = recompute(data, defaults)
+    mismatches = {}
+    same = np.isclose(
+        new['movement_rt'], trials['movement_rt'], rtol=0, atol=1e-6, equal_nan=True
+    )
+    mismatches['movement_rt'] = int(np.sum(recorded & ~same))
+
+    # Whether a frame landing right at the end of the angle delay counted as
+    # after it comes down to rounding, so the angle from either side is accepted
+    angles = [new['initial_angle']]
+    for shift in [-1e-6, 1e-6]:
+        criteria = [v + shift if name == 'angle_delay' else v for name, v in CRITERIA]
+        angles.append(recompute(data, criteria)['initial_angle'])
+    same = np.zeros(len(trials), dtype=bool)
+    for angle in angles:
+        same |= np.isclose(
+            angle, trials['initial_angle'], rtol=0, atol=1e-9, equal_nan=True
+        )
+    mismatches['initial_angle'] = int(np.sum(recorded & ~same))
+
+    # Contact RTs should fall between the contact sample and the next one
+    _, _, contact = find_samples(data, defaults)
+    nxt = np.minimum(contact + 1, len(t) - 1)
+    has_next = (contact >= 0) & (nxt > contact) & (ids[nxt] == np.arange(len(trials)))
+    next_t = np.where(has_next, t[nxt], np.inf)
+    old = trials['contact_rt']
+    in_frame = (new['contact_rt'] <= old + 1e-6) & (old < next_t)
+    same = in_frame | (np.isnan(old) & np.isnan(new['contact_rt']))
+    mismatches['contact_rt'] = int(np.sum(recorded & ~same))
+    return int(np.sum(recorded)), mismatches
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def _recompute_worker(criteria):
+    return recompute(_data, criteria)
+
+
+def write_results(writer, trials, criteria, results):
+    # Writes the recomputed measures for a set of criteria to the output file
+    columns = [trials[c].tolist() for c in ['participant_id', 'block_num', 'trial_num']]
+    columns += [[value] * len(trials) for value in criteria]
+    for m in MEASURES:
+        columns.append(["NA" if v != v else v for v in results[m].tolist()])
+    writer.writerows(zip(*columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", type=str, default=dbutils.DB_PATH)
+    parser.add_argument("--out", type=str, default=OUT_PATH)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--check", action="store_true")
+    for name, default in CRITERIA:
+        flag = "--" + name.replace("_", "-")
+        parser.add_argument(flag, type=float, nargs="+", default=[default])
+    args = parser.parse_args()
+
+    start = perf_counter()
+    conn = dbutils.connect(args.db)
+    dbutils.check_migrated(conn)
+    pids = dbutils.participant_ids(conn)
+    trials, samples, ids = kinematics.load_trajectories(conn, pids, TRIAL_COLS)
+    conn.close()
+    origins, ppd = task_geometry(trials)
+    targets = np.column_stack([trials['target_x'], trials['target_y']])
+    frame_ms = frame_intervals(trials, ids, samples['time'])
+    data = (
+        ids, samples['time'], samples['x'], samples['y'], origins, targets, ppd,
+        frame_ms,
+    )
+    print("Loaded {0} trials ({1} samples) in {2:.2f} s".format(
+        len(trials), len(samples), perf_counter() - start
+    ))
+    simplified = ~np.isnan(trials['trajectory_tolerance'])
+    if np.any(simplified):
+        txt = "Skipping {0} trials with simplified trajectories"
+        print(txt.format(int(np.sum(simplified))))
+
+    if args.check:
+        n, mismatches = check_runtime(trials, data)
+        print("Compared recomputed and recorded measures for {0} trials:".format(n))
+        for m in MEASURES:
+            print("  - {0}: {1} mismatched".format(m, mismatches[m]))
+        return
+
+    grid = list(product(*[getattr(args, name) for name, _ in CRITERIA]))
+    start = perf_counter()
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(
+            ['participant_id', 'block_num', 'trial_num'] +
+            [name for name, _ in CRITERIA] + MEASURES
+        )
+        pool = ProcessPoolExecutor(
+            max_workers=args.jobs, initializer=_init_worker, initargs=(data,)
+        )
+        with pool:
+            for criteria, results in zip(grid, pool.map(_recompute_worker, grid)):
+                for m in MEASURES:
+                    results[m][simplified] = np.nan
+                write_results(writer, trials, criteria, results)
+                names = [name for name, _ in CRITERIA]
+                label = ", ".join(
+                    "{0}={1:g}".format(name, v) for name, v in zip(names, criteria)
+                )
+                counts = [int(np.sum(~np.isnan(results[m]))) for m in MEASURES]
+                txt = "  {0}: {1} movement RTs, {2} initial angles, {3} contacts"
+                print(txt.format(label, *counts))
+    print("Recomputed measures for {0} sets of criteria in {1:.2f} s".format(
+        len(grid), perf_counter() - start
+    ))
+    print("Results saved to {0}".format(args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Resamples every trial's cursor trajectory to a fixed number of points.
+
+Reads the cursor trajectories for all trials from the gamepad table and
+resamples each one to --points evenly-spaced points (100 by default) in two
+ways: evenly spaced in time between the first and last samples of the trial
+(time-normalized), and evenly spaced along the path travelled by the cursor
+(path-normalized). Positions between samples are linearly interpolated, and
+all trials are resampled at once with vectorized array operations.
+
+Each trajectory is rotated into a target-aligned frame using the trial's
+target angle, with positions given in degrees from the middle of the screen:
+the first coordinate is the distance towards the target, and the second is the
+distance to the right of (i.e. clockwise from) the straight line to it. This
+way, reaches to different targets can be averaged together directly.
+
+The resampled trajectories are written to --out (ExpAssets/Data/trajectories
+by default) as NumPy arrays of shape (n_trials, n_points, 2), which can be
+memory-mapped for analysis without loading them fully into memory:
+
+    import numpy as np
+    trials = np.load("trajectories/trials.npy")
+    paths = np.load("trajectories/time_normalized.npy", mmap_mode="r")
+    mean_reach = np.nanmean(paths[trials['phase'] == "baseline"], axis=0)
+
+Rows are in the same order as trials.npy, which lists the participant, block,
+trial, phase, trial type, and number of cursor samples for each trial (trials
+without any samples are filled with NaN). Requires numpy. Usage:
+
+    python tools/resample_trajectories.py [--db PATH] [--out PATH] [--points N]
+        [--batch N] [--jobs N]
+
+Participants are processed in batches of --batch participants (25 by default)
+spread across --jobs worker processes (one per CPU core by default).
+
+"""
+
+import os
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dbutils
+import kinematics
+from recompute_measures import task_geometry
+
+
+# The ways trajectories are resampled, and the files they're saved to
+MODES = ['time_normalized', 'path_normalized']
+
+N_POINTS = 100
+
+# The trial info needed to resample and label each trajectory
+TRIAL_COLS = kinematics.TRIAL_COLS + [('phase', 'U12'), ('trial_type', 'U4')]
+
+# The columns saved to the trial index for each row of the arrays
+INDEX_COLS = ['participant_id', 'block_num', 'trial_num', 'phase', 'trial_type']
+
+OUT_DIR = os.path.join(dbutils.DATA_DIR, "trajectories")
+
+
+def resample(ids, values, x, y, n, n_points):
+    # Resamples the x/y positions of a set of trajectories to 'n_points' points
+    # evenly spaced between each trial's first and last sample in 'values' (e.g.
+    # sample times), which must be non-decreasing within each trial. 'ids' is
+    # the trial index of each sample, with each trial's samples stored in order.
+    # Returns an (n, n_points, 2) array, with NaN for trials without samples.
+    #
+    # All trials are interpolated in a single pass by offsetting each trial's
+    # normalized (0 to 1) values by twice its index, so that the values for
+    # every trial are in one increasing sequence with no overlap between trials.
+    out = np.full((n, n_points, 2), np.nan)
+    if not len(ids):
+        return out
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)] - 1
+    first, last = (np.zeros(n, np.intp), np.zeros(n, np.intp))
+    first[ids[starts]] = starts
+    last[ids[ends]] = ends
+    span = values[last] - values[first]
+    span = np.where(span > 0, span, 1.0)
+    keys = 2 * ids + (values - values[first[ids]]) / span[ids]
+
+    # Add each trial's final position at the end of its range, so trials with
+    # only one sample (or no movement) don't get interpolated with the next one
+    trials = ids[ends]
+    keys = np.insert(keys, ends + 1, 2 * trials + 1.0)
+    x = np.insert(x, ends + 1, x[ends])
+    y = np.insert(y, ends + 1, y[ends])
+
+    query = 2 * trials[:, None] + np.linspace(0, 1, n_points)[None, :]
+    out[trials, :, 0] = np.interp(query.ravel(), keys, x).reshape(query.shape)
+    out[trials, :, 1] = np.interp(query.ravel(), keys, y).reshape(query.shape)
+    return out
+
+
+def path_distance(ids, x, y):
+    # Gets the distance travelled along each trajectory at each sample
+    step = np.r_[0.0, np.hypot(np.diff(x), np.diff(y))]
+    step[np.r_[True, ids[1:] != ids[:-1]]] = 0
+    dist = np.cumsum(step)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    offsets = np.repeat(dist[starts], np.diff(np.r_[starts, len(ids)]))
+    return dist - offsets
+
+
+def target_aligned(ids, x, y, origins, target_angle, ppd):
+    # Rotates cursor positions (in screen pixels) into a target-aligned frame in
+    # degrees, with the target straight along the first axis. Target angles are
+    # clockwise from straight up, so the direction to the target on screen
+    # (where y increases downwards) is (sin, -cos). Since rotation and linear
+    # interpolation can be done in either order, samples are rotated before
+    # resampling (as there are usually fewer of them).
+    rad = np.radians(target_angle)
+    sin, cos = ((np.sin(rad) / ppd)[ids], (np.cos(rad) / ppd)[ids])
+    dx, dy = (x - origins[ids, 0], y - origins[ids, 1])
+    return dx * sin - dy * cos, dx * cos + dy * sin
+
+
+def process_batch(db_path, pids, n_points):
+    # Resamples the trajectories for all trials of a set of participants
+    conn = dbutils.connect(db_path)
+    trials, samples, ids = kinematics.load_trajectories(conn, pids, TRIAL_COLS)
+    conn.close()
+    n = len(trials)
+    origins, ppd = task_geometry(trials)
+    t, x, y = (np.ascontiguousarray(samples[c]) for c in ['time', 'x', 'y'])
+    along, across = target_aligned(ids, x, y, origins, trials['target_angle'], ppd)
+    values = {'time_normalized': t, 'path_normalized': path_distance(ids, x, y)}
+    out = {}
+    for mode in MODES:
+        points = resample(ids, values[mode], along, across, n, n_points)
+        out[mode] = points.astype(np.float32)
+    index_dtype = [(col, trials.dtype[col]) for col in INDEX_COLS] + [('samples', 'i8')]
+    index = np.zeros(n, dtype=index_dtype)
+    for col in INDEX_COLS:
+        index[col] = trials[col]
+    index['samples'] = np.bincount(ids, minlength=n)
+    return index, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", type=str, default=dbutils.DB_PATH)
+    parser.add_argument("--out", type=str, default=OUT_DIR)
+    parser.add_argument("--points", type=int, default=N_POINTS)
+    parser.add_argument("--batch", type=int, default=kinematics.BATCH_SIZE)
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    start = perf_counter()
+    conn = dbutils.connect(args.db)
+    pids = dbutils.participant_ids(conn)
+    n_trials = conn.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+    conn.close()
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    shape = (n_trials, args.points, 2)
+    stores = {}
+    for mode in MODES:
+        path = os.path.join(args.out, mode + ".npy")
+        stores[mode] = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float32, shape=shape
+        )
+    batches = [pids[i:i + args.batch] for i in range(0, len(pids), args.batch)]
+    indexes = []
+    offset = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [
+            pool.submit(process_batch, args.db, batch, args.points) for batch in batches
+        ]
+        for f in futures:
+            index, out = f.result()
+            for mode in MODES:
+                stores[mode][offset:offset + len(index)] = out[mode]
+            indexes.append(index)
+            offset += len(index)
+    for store in stores.values():
+        store.flush()
+    if offset != n_trials:
+        e = "Expected {0} trials but resampled {1} (was the database modified?)"
+        raise RuntimeError(e.format(n_trials, offset))
+    np.save(os.path.join(args.out, "trials.npy"), np.concatenate(indexes))
+
+    elapsed = perf_counter() - start
+    print("Resampled {0} trials ({1} participants) to {2} points in {3:.2f} s".format(
+        offset, len(pids), args.points, elapsed
+    ))
+    print("Results saved to {0}".format(args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Screens every trial against a set of data quality rules and flags those that fail.
+
+Checks all completed trials (i.e. trials without an error) and their cursor
+trajectories from the gamepad table against a set of rules, writing a row to
+the trial_flags table for each trial that fails a rule (replacing any existing
+flags for the same participants). Each row gives the name of the rule and the
+value that failed it (e.g. the movement RT for an implausible movement RT),
+and the table can be added to older databases with tools/migrate_db.py.
+
+Rules are given as a list of dicts in a JSON file (--rules), each with a
+unique 'name', a 'kind', the settings for that kind, and optionally the
+'trial_types' and/or 'phases' they apply to (all trials by default):
+
+  - range: flags trials where a trials table 'column' is below 'min' or above
+    'max' (either can be omitted)
+  - missing: flags trials where a trials table 'column' is empty
+  - drift: flags trials where the cursor moved more than 'min_dist' degrees
+    from the middle of the screen (e.g. stick drift on MI and CC trials too
+    small to count as an error)
+  - gap: flags trials with more than 'max_gap' ms between two consecutive
+    cursor samples where the cursor moved at least 'min_jump' degrees (i.e.
+    missing samples in the middle of a movement). Trials whose trajectories
+    were simplified by the task (see trajectory_tolerance in the params file)
+    are skipped, since samples dropped by the simplification leave gaps too.
+
+For example, the default rules (see RULES) include:
+
+    {"name": "movement_rt", "kind": "range", "column": "movement_rt",
+     "trial_types": ["PP"], "min": 100, "max": 3000}
+
+The rules are checked and compiled once, and then each rule is evaluated for
+all trials at once with vectorized array operations, with participants
+processed in batches of --batch participants (25 by default) spread across
+--jobs worker processes (one per CPU core by default). Requires numpy. Usage:
+
+    python tools/screen_trials.py [--db PATH] [--rules PATH] [--batch N]
+        [--jobs N]
+
+"""
+
+import json
+import argparse
+from functools import partial
+from time import perf_counter
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dbutils
+import kinematics
+from recompute_measures import task_geometry
+
+
+# The numeric trials table columns that rules can check
+TRIAL_MEASURES = [
+    'rotation', 'target_onset', 'movement_rt', 'contact_rt', 'response_rt',
+    'initial_angle', 'controller_dropouts',
+]
+
+# The trial info needed to evaluate the rules
+TRIAL_COLS = kinematics.TRIAL_COLS + [(col, 'f8') for col in TRIAL_MEASURES] + [
+    ('phase', 'U12'), ('trial_type', 'U4'), ('err', 'O'),
+]
+
+# The default rules for screening trials
+RULES = [
+    {'name': "imagery_drift", 'kind': "drift", 'trial_types': ["MI", "CC"],
+     'min_dist': 0.0},
+    {'name': "trajectory_gap", 'kind': "gap", 'trial_types': ["PP"],
+     'max_gap': 100.0, 'min_jump': 1.0},
+    {'name': "timeout", 'kind': "missing", 'column': "response_rt"},
+    {'name': "movement_rt", 'kind': "range", 'column': "movement_rt",
+     'trial_types': ["PP"], 'min': 100.0, 'max': 3000.0},
+    {'name': "dropouts", 'kind': "range", 'column': "controller_dropouts", 'max': 0},
+]
+
+
+def check_range(data, column, min=None, max=None):
+    # Flags trials where a column is outside a given range
+    values = data['trials'][column]
+    failed = np.zeros(len(values), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if min is not None:
+            failed |= values < min
+        if max is not None:
+            failed |= values > max
+    return failed, values
+
+
+def check_missing(data, column):
+    # Flags trials where a column has no value
+    values = data['trials'][column]
+    return np.isnan(values), values
+
+
+def check_drift(data, min_dist):
+    # Flags trials where the cursor moved more than a given distance (in degrees)
+    # from the middle of the screen
+    ids, x, y, origins, ppd = (data[k] for k in ['ids', 'x', 'y', 'origins', 'ppd'])
+    n = len(ppd)
+    dist = np.hypot(x - origins[ids, 0], y - origins[ids, 1]) / ppd[ids]
+    furthest = kinematics.segment_reduce(np.maximum, dist, ids, n)
+    with np.errstate(invalid="ignore"):
+        return furthest > min_dist, furthest
+
+
+def check_gap(data, max_gap, min_jump):
+    # Flags trials with a long gap (in ms) between consecutive cursor samples
+    # where the cursor jumped at least a given distance (in degrees)
+    ids, t, x, y, ppd = (data[k] for k in ['ids', 't', 'x', 'y', 'ppd'])
+    n = len(ppd)
+    same = ids[1:] == ids[:-1]
+    jump = np.hypot(np.diff(x), np.diff(y)) / ppd[ids[1:]]
+    moved = same & (jump >= min_jump)
+    longest = kinematics.segment_reduce(np.maximum, np.diff(t)[moved], ids[1:][moved], n)
+    simplified = ~np.isnan(data['trials']['trajectory_tolerance'])
+    with np.errstate(invalid="ignore"):
+        return (longest > max_gap) & ~simplified, longest
+
+
+# The kinds of rules, along with their checks and required/optional settings
+RULE_KINDS = {
+    'range': (check_range, ['column'], ['min', 'max']),
+    'missing': (check_missing, ['column'], []),
+    'drift': (check_drift, ['min_dist'], []),
+    'gap': (check_gap, ['max_gap', 'min_jump'], []),
+}
+
+
+def compile_rules(rules):
+    # Checks a list of rule definitions, returning a (name, trial_types, phases,
+    # check) tuple for each rule, where 'check' takes the data for a batch of
+    # trials and returns whether each one failed the rule along with the value
+    # it was checked on
+    compiled = []
+    names = set()
+    for rule in rules:
+        rule = dict(rule)
+        name, kind = (rule.pop('name', None), rule.pop('kind', None))
+        if not name or name in names:
+            e = "Every rule needs a unique name (got '{0}')."
+            raise ValueError(e.format(name))
+        if kind not in RULE_KINDS:
+            e = "Unknown kind '{0}' for rule '{1}' (must be one of {2})."
+            raise ValueError(e.format(kind, name, ", ".join(sorted(RULE_KINDS))))
+        trial_types = rule.pop('trial_types', None)
+        phases = rule.pop('phases', None)
+        check, required, optional = RULE_KINDS[kind]
+        missing = [s for s in required if s not in rule]
+        unknown = [s for s in rule if s not in required + optional]
+        if missing or unknown:
+            e = "Rule '{0}' is missing settings {1} or has unknown settings {2}."
+            raise ValueError(e.format(name, missing, unknown))
+        if 'column' in rule and rule['column'] not in TRIAL_MEASURES:
+            e = "Unknown column '{0}' for rule '{1}' (must be one of {2})."
+            raise ValueError(e.format(rule['column'], name, ", ".join(TRIAL_MEASURES)))
+        names.add(name)
+        compiled.append((name, trial_types, phases, partial(check, **rule)))
+    return compiled
+
+
+def screen_batch(db_path, pids, rules):
+    # Evaluates a set of compiled rules for all trials of a set of participants,
+    # returning the (participant, block, trial, rule, value) rows for each
+    # failed rule
+    conn = dbutils.connect(db_path)
+    trials, samples, ids = kinematics.load_trajectories(conn, pids, TRIAL_COLS)
+    conn.close()
+    origins, ppd = task_geometry(trials)
+    data = {
+        'trials': trials, 'ids': ids, 'origins': origins, 'ppd': ppd,
+        't': samples['time'], 'x': samples['x'], 'y': samples['y'],
+    }
+    completed = np.equal(trials['err'], None)
+    rows = []
+    for name, trial_types, phases, check in rules:
+        applies = completed.copy()
+        if trial_types is not None:
+            applies &= np.isin(trials['trial_type'], trial_types)
+        if phases is not None:
+            applies &= np.isin(trials['phase'], phases)
+        failed, values = check(data)
+        idx = np.flatnonzero(applies & failed)
+        cols = ['participant_id', 'block_num', 'trial_num']
+        keys = [trials[c][idx].tolist() for c in cols]
+        flagged = [None if v != v else v for v in values[idx].tolist()]
+        rows += zip(*(keys + [[name] * len(idx), flagged]))
+    return rows
+
+
+def save_flags(conn, pids, rows):
+    # Replaces the flags for a set of participants
+    cols = ['participant_id', 'block_num', 'trial_num', 'rule', 'value']
+    where = "participant_id IN ({0})".format(", ".join(str(int(p)) for p in pids))
+    with conn:
+        conn.execute("DELETE FROM trial_flags WHERE {0}".format(where))
+        conn.executemany("INSERT INTO trial_flags ({0}) VALUES ({1})".format(
+            ", ".join(cols), ", ".join(["?"] * len(cols))
+        ), rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--db", type=str, default=dbutils.DB_PATH)
+    parser.add_argument("--rules", type=str, default=None)
+    parser.add_argument("--batch", type=int, default=kinematics.BATCH_SIZE)
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    rules = RULES
+    if args.rules:
+        with open(args.rules, "r") as f:
+            rules = json.load(f)
+    rules = compile_rules(rules)
+
+    conn = dbutils.connect(args.db, readonly=False)
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master")]
+    if "trial_flags" not in tables:
+        raise RuntimeError(
+            "Database has no trial_flags table (run tools/migrate_db.py to add it)."
+        )
+
+    start = perf_counter()
+    pids = dbutils.participant_ids(conn)
+    batches = [pids[i:i + args.batch] for i in range(0, len(pids), args.batch)]
+    counts = Counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(screen_batch, args.db, batch, rules) for batch in batches]
+        for batch, f in zip(batches, futures):
+            rows = f.result()
+            save_flags(conn, batch, rows)
+            counts.update(row[3] for row in rows)
+    n_trials = conn.execute("SELECT COUNT(*) FROM trials WHERE err IS NULL").fetchone()[0]
+    conn.close()
+    elapsed = perf_counter() - start
+    print("Screened {0} trials ({1} participants) in {2:.2f} s:".format(
+        n_trials, len(pids), elapsed
+    ))
+    for name, _, _, _ in rules:
+        print("  - {0}: {1} flagged".format(name, counts[name]))
+
+
+if __name__ == "__main__":
+    main()